@@ -20,8 +20,8 @@ import openpyxl
 from openpyxl import Workbook
 import io
 from fastapi import UploadFile, File
-from fastapi.responses import StreamingResponse
-import requests
+from fastapi.responses import StreamingResponse, PlainTextResponse
+import asyncio
 
 # --- Настройки ---
 DB_PATH = '/opt/stroykontrol/database/stroykontrol.db'
@@ -32,6 +32,17 @@ API_PORT = 8080
 YANDEX_DISK_TOKEN = os.getenv('YANDEX_DISK_TOKEN')
 YANDEX_DISK_BASE_FOLDER = os.getenv('YANDEX_DISK_BASE_FOLDER', 'StroyKontrol')
 
+from apps.config import settings
+from apps.database import ensure_photo_tables, ensure_search_index
+from apps.repository import (
+    fetch_work_materials_requirements, find_material_shortage, get_foreman_display_name,
+    log_material_history_entry, restore_materials, write_off_materials,
+)
+from apps.services.metrics import metrics
+from apps.services.photo_registry import photo_registry
+from apps.services.search import SEARCH_TYPES, search_catalog
+from apps.services.yandex_disk import yandex_disk_service, yandex_retry_queue
+
 
 # --- Настройка логирования ---
 logging.basicConfig(level=logging.INFO)
@@ -50,108 +61,32 @@ app.add_middleware(
 )
 
 # --- Вспомогательные функции для работы с Яндекс.Диском ---
-def _get_yandex_headers():
-    if not YANDEX_DISK_TOKEN:
-        logger.error("❌ Токен Яндекс.Диска не задан. Укажите переменную окружения YANDEX_DISK_TOKEN")
-        return None
-    return {
-        'Authorization': f'OAuth {YANDEX_DISK_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-
+# Все запросы идут через общий клиент apps.services.yandex_disk с предохранителем
+# (circuit breaker) и ограничением параллельных вызовов: при недоступности
+# Яндекс.Диска запросы сразу завершаются ошибкой, а не ждут таймаутов.
 
 def sanitize_folder_component(component: str) -> str:
-    safe = re.sub(r'[^\w\-]', '_', component or '')
-    return safe or 'unknown'
+    return yandex_disk_service.sanitize_folder_component(component)
 
 
 def setup_yandex_disk() -> bool:
-    headers = _get_yandex_headers()
-    if headers is None:
-        return False
-    try:
-        response = requests.get('https://cloud-api.yandex.net/v1/disk/', headers=headers, timeout=10)
-        if response.status_code == 200:
-            return True
-        logger.error(f"❌ Ошибка подключения к Яндекс.Диску: {response.status_code} - {response.text}")
-    except requests.RequestException as exc:
-        logger.error(f"❌ Исключение при подключении к Яндекс.Диску: {exc}")
-    return False
+    return yandex_disk_service.check_connection()
 
 
 def create_yandex_folder(folder_path: str) -> bool:
-    headers = _get_yandex_headers()
-    if headers is None:
-        return False
-
-    if not folder_path.startswith('/'):
-        folder_path = '/' + folder_path
-
-    params = {'path': folder_path}
-    try:
-        response = requests.put(
-            'https://cloud-api.yandex.net/v1/disk/resources',
-            headers=headers,
-            params=params,
-            timeout=10
-        )
-        if response.status_code in (200, 201):
-            logger.info(f"✅ Папка на Яндекс.Диске создана: {folder_path}")
-            return True
-        if response.status_code == 409:
-            logger.info(f"ℹ️ Папка на Яндекс.Диске уже существует: {folder_path}")
-            return True
-        logger.error(f"❌ Ошибка создания папки на Яндекс.Диске: {response.status_code} - {response.text}")
-    except requests.RequestException as exc:
-        logger.error(f"❌ Исключение при создании папки на Яндекс.Диске: {exc}")
-    return False
+    return yandex_disk_service.create_folder(folder_path)
 
 
 def publish_yandex_folder(folder_path: str) -> Optional[str]:
-    headers = _get_yandex_headers()
-    if headers is None:
-        return None
-
-    if folder_path.startswith('/'):
-        folder_path = folder_path[1:]
-
-    try:
-        publish_response = requests.put(
-            'https://cloud-api.yandex.net/v1/disk/resources/publish',
-            headers=headers,
-            params={'path': folder_path},
-            timeout=10
-        )
-        if publish_response.status_code not in (200, 201):
-            logger.error(
-                f"❌ Не удалось опубликовать папку {folder_path}: {publish_response.status_code} - {publish_response.text}"
-            )
-            return None
-
-        info_response = requests.get(
-            'https://cloud-api.yandex.net/v1/disk/resources',
-            headers=headers,
-            params={'path': folder_path, 'fields': 'public_url'},
-            timeout=10
-        )
-        if info_response.status_code == 200:
-            public_url = info_response.json().get('public_url')
-            if public_url:
-                logger.info(f"🔗 Получена ссылка на папку: {public_url}")
-                return public_url
-        logger.error(
-            f"❌ Не удалось получить ссылку на папку {folder_path}: {info_response.status_code} - {info_response.text}"
-        )
-    except requests.RequestException as exc:
-        logger.error(f"❌ Исключение при публикации папки на Яндекс.Диске: {exc}")
-    return None
+    return yandex_disk_service.publish_folder(folder_path)
 
 
 async def ensure_report_folder(db, foreman_id: Optional[int], report_date: str) -> Optional[str]:
     if foreman_id is None or report_date is None:
         return None
 
-    if not setup_yandex_disk():
+    if not yandex_disk_service.is_available():
+        logger.warning("⚠️ Яндекс.Диск временно недоступен, папка отчета будет создана позже")
         return None
 
     async with db.execute(
@@ -164,23 +99,35 @@ async def ensure_report_folder(db, foreman_id: Optional[int], report_date: str)
         logger.warning(f"⚠️ Не удалось найти бригадира ID {foreman_id} для создания папки отчета")
         return None
 
-    foreman_name = sanitize_folder_component(row[0])
-    base_folder = sanitize_folder_component(YANDEX_DISK_BASE_FOLDER or 'StroyKontrol')
-    date_folder = sanitize_folder_component(report_date)
+    # Сетевые вызовы выполняются в отдельном потоке, чтобы не блокировать event loop
+    return await asyncio.to_thread(
+        yandex_disk_service.ensure_report_folder, row[0], foreman_id, report_date
+    )
 
-    base_folder_path = f"/{base_folder}"
-    if not create_yandex_folder(base_folder_path):
-        return None
 
-    date_folder_path = f"{base_folder_path}/{date_folder}"
-    if not create_yandex_folder(date_folder_path):
-        return None
+async def attach_report_folder(report_id: int, foreman_id: Optional[int], report_date: str) -> bool:
+    """Повторная попытка создать папку отчета и сохранить ссылку на нее."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        folder_url = await ensure_report_folder(db, foreman_id, report_date)
+        if not folder_url:
+            return False
+        await db.execute(
+            """UPDATE work_reports SET photo_report_url = ?
+               WHERE id = ? AND (photo_report_url IS NULL OR photo_report_url = '')""",
+            (folder_url, report_id)
+        )
+        await db.commit()
+    logger.info(f"🔗 Ссылка на папку добавлена к отчету ID {report_id}")
+    return True
 
-    foreman_folder_path = f"{date_folder_path}/{foreman_name}_ID_{foreman_id}"
-    if not create_yandex_folder(foreman_folder_path):
-        return None
 
-    return publish_yandex_folder(foreman_folder_path)
+def defer_report_folder(report_id: int, foreman_id: Optional[int], report_date: str):
+    """Ставит создание папки отчета в очередь повторных попыток."""
+    if not yandex_disk_service.token or foreman_id is None or not report_date:
+        return
+    yandex_retry_queue.submit(
+        f"report {report_id} folder", attach_report_folder, report_id, foreman_id, report_date
+    )
 
 async def ensure_work_reports_verification_column():
     """Гарантирует наличие колонки is_verified в таблице work_reports."""
@@ -534,23 +481,6 @@ async def get_foremen_from_db():
         logger.error(f"⚠️ Ошибка получения бригадиров: {e}")
         return []
     
-async def get_foreman_display_name(db, foreman_id: Optional[int]) -> str:
-    """Возвращает отображаемое имя бригадира"""
-    if foreman_id is None:
-        return 'Неизвестный бригадир'
-
-    async with db.execute(
-        "SELECT first_name, last_name FROM foremen WHERE id = ?",
-        (foreman_id,)
-    ) as cursor:
-        row = await cursor.fetchone()
-        if row:
-            first_name, last_name = row
-            parts = [part for part in [first_name, last_name] if part]
-            if parts:
-                return f"Бригадир {' '.join(parts)}"
-    return f"Бригадир ID {foreman_id}"
-
 async def create_foreman_in_db(foreman_data: dict):
     """Создает нового бригадира в базе данных."""
     try:
@@ -945,42 +875,6 @@ async def init_material_history_table():
         ''')
         await db.commit()
 
-async def log_material_history_entry(
-    db,
-    material_id: int,
-    change_amount: float,
-    change_type: str,
-    performed_by: Optional[str] = None,
-    description: Optional[str] = None
-):
-    """Добавляет запись в историю движения материалов"""
-    performed_by_value = (performed_by or 'Неизвестно').strip() or 'Неизвестно'
-    description_value = (description or '').strip()
-
-    resulting_quantity = None
-    async with db.execute(
-        "SELECT quantity FROM materials WHERE id = ?",
-        (material_id,)
-    ) as cursor:
-        row = await cursor.fetchone()
-        if row is not None:
-            resulting_quantity = row[0]
-
-    await db.execute(
-        '''INSERT INTO material_history
-           (material_id, change_type, change_amount, resulting_quantity, performed_by, description, created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?)''',
-        (
-            material_id,
-            change_type,
-            change_amount,
-            resulting_quantity,
-            performed_by_value,
-            description_value,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        )
-    )
-
 async def get_material_history_from_db(limit: int = 500):
     """Возвращает историю движения материалов"""
     try:
@@ -1127,28 +1021,6 @@ async def update_material_pricing_in_db(
         logger.error(f"⚠️ Ошибка обновления стоимости материала ID {material_id}: {exc}")
         return False
 
-async def fetch_work_materials_requirements(db, work_id: int):
-    """Получает список материалов и норм расхода для указанной работы, используя существующее соединение"""
-    async with db.execute('''
-        SELECT wm.material_id, wm.quantity_per_unit, m.name, m.unit, m.category, m.quantity
-        FROM work_materials wm
-        JOIN materials m ON wm.material_id = m.id
-        WHERE wm.work_id = ?
-    ''', (work_id,)) as cursor:
-        rows = await cursor.fetchall()
-        materials = []
-        for row in rows:
-            material_id, quantity_per_unit, name, unit, category, available_quantity = row
-            materials.append({
-                'material_id': material_id,
-                'quantity_per_unit': quantity_per_unit,
-                'material_name': name,
-                'unit': unit,
-                'category': category,
-                'available_quantity': available_quantity
-            })
-        return materials
-
 async def get_work_materials_from_db(work_id: int):
     """Возвращает материалы, закрепленные за работой"""
     try:
@@ -1402,6 +1274,14 @@ async def delete_category_from_db(category_id: int):
         return False, f"Ошибка удаления: {str(e)}"
 
 # ========== ФУНКЦИИ ДЛЯ ОТЧЕТОВ ==========
+async def attach_report_photos(db, reports: list):
+    """Добавляет к отчетам список фото — одним запросом на всю страницу."""
+    db.row_factory = aiosqlite.Row
+    photos = await photo_registry.get_photos_for_reports(db, [report['id'] for report in reports])
+    for report in reports:
+        report['photos'] = photos.get(report['id'], [])
+    return reports
+
 async def get_reports_for_date_from_db(target_date: str):
     """Получает отчеты за конкретную дату из базы данных."""
     try:
@@ -1484,8 +1364,9 @@ async def get_all_reports_from_db(date_filter=None):
                         'work_name': work_name,
                         'unit': unit
                     })
-                logger.info(f"📋 Загружено отчетов: {len(reports)}")
-                return reports
+            await attach_report_photos(db, reports)
+            logger.info(f"📋 Загружено отчетов: {len(reports)}")
+            return reports
     except Exception as e:
         logger.error(f"❌ Ошибка получения всех отчетов: {e}")
         return []
@@ -1511,7 +1392,7 @@ async def get_report_by_id(report_id: int):
                     (report_id, foreman_id, work_id, quantity, report_date,
                      report_time, photo_url, is_verified, foreman_full_name,
                      foreman_position, work_name, unit) = row
-                    return {
+                    report = {
                         'id': report_id,
                         'foreman_id': foreman_id,
                         'work_id': work_id,
@@ -1525,6 +1406,7 @@ async def get_report_by_id(report_id: int):
                         'work_name': work_name,
                         'unit': unit
                     }
+                    return (await attach_report_photos(db, [report]))[0]
         return None
     except Exception as e:
         logger.error(f"❌ Ошибка получения отчета по ID {report_id}: {e}")
@@ -1571,22 +1453,10 @@ async def update_report_in_db(report_id: int, report_data: dict):
 
                 # Возвращаем материалы на склад по старой работе
                 old_requirements = await fetch_work_materials_requirements(db, old_work_id)
-                for requirement in old_requirements:
-                    total_to_restore = requirement['quantity_per_unit'] * old_quantity
-                    if total_to_restore <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity + ? WHERE id = ?",
-                        (total_to_restore, requirement['material_id'])
-                    )
-                    await log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        total_to_restore,
-                        'Возврат',
-                        correction_display,
-                        f"Возврат при редактировании отчета работы ID {report_id}"
-                    )
+                await restore_materials(
+                    db, old_requirements, old_quantity, correction_display,
+                    f"Возврат при редактировании отчета работы ID {report_id}"
+                )
 
 
             # Проверяем наличие работы и доступный баланс под новую работу
@@ -1605,15 +1475,10 @@ async def update_report_in_db(report_id: int, report_data: dict):
                         return False, "Недостаточно материалов на балансе для новой работы"
 
                 new_requirements = await fetch_work_materials_requirements(db, report_data['work_id'])
-                for requirement in new_requirements:
-                    total_required = requirement['quantity_per_unit'] * report_data['quantity']
-                    if total_required <= 0:
-                        continue
-                    if requirement['available_quantity'] < total_required:
-                        await db.rollback()
-                        return False, (
-                            f"Недостаточно материала \"{requirement['material_name']}\" на складе"
-                        )
+                shortage = find_material_shortage(new_requirements, report_data['quantity'])
+                if shortage:
+                    await db.rollback()
+                    return False, f"Недостаточно материала \"{shortage['material_name']}\" на складе"
 
                 auto_photo_url = report_data.get('photo_report_url')
                 if not auto_photo_url:
@@ -1630,22 +1495,10 @@ async def update_report_in_db(report_id: int, report_data: dict):
                 )
 
                 # Списываем материалы для новой работы
-                for requirement in new_requirements:
-                    total_required = requirement['quantity_per_unit'] * report_data['quantity']
-                    if total_required <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity - ? WHERE id = ?",
-                        (total_required, requirement['material_id'])
-                    )
-                    await log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        -total_required,
-                        'Списание',
-                        new_foreman_display,
-                        f"Списание по обновленному отчету работы ID {report_id}"
-                    )
+                await write_off_materials(
+                    db, new_requirements, report_data['quantity'], new_foreman_display,
+                    f"Списание по обновленному отчету работы ID {report_id}"
+                )
 
                 # Обновляем сам отчет
                 await db.execute(
@@ -1660,6 +1513,8 @@ async def update_report_in_db(report_id: int, report_data: dict):
 
                 await db.commit()
                 logger.info(f"📝 Обновлен отчет ID: {report_id}")
+                if not auto_photo_url:
+                    defer_report_folder(report_id, new_foreman_id, report_data.get('report_date'))
                 return True, "Отчет успешно обновлен"
             except Exception as e:
                 await db.rollback()
@@ -1698,24 +1553,13 @@ async def delete_report_from_db(report_id: int):
 
                 # Возвращаем материалы на склад
                 requirements = await fetch_work_materials_requirements(db, work_id)
-                for requirement in requirements:
-                    total_to_restore = requirement['quantity_per_unit'] * quantity
-                    if total_to_restore <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity + ? WHERE id = ?",
-                        (total_to_restore, requirement['material_id'])
-                    )
-                    await log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        total_to_restore,
-                        'Возврат',
-                        deletion_display,
-                        f"Возврат при удалении отчета работы ID {report_id}"
-                    )
+                await restore_materials(
+                    db, requirements, quantity, deletion_display,
+                    f"Возврат при удалении отчета работы ID {report_id}"
+                )
 
                 # Удаляем отчет
+                await db.execute("DELETE FROM report_photos WHERE report_id = ?", (report_id,))
                 await db.execute("DELETE FROM work_reports WHERE id = ?", (report_id,))
                 await db.commit()
 
@@ -1773,7 +1617,7 @@ async def get_all_work_reports_from_db():
                         'photo_report_url': photo_url,
                         'is_verified': bool(is_verified)
                     })
-                return reports
+            return await attach_report_photos(db, reports)
     except Exception as e:
         logger.error(f"❌ Ошибка получения всех отчетов: {e}")
         return []
@@ -1804,15 +1648,10 @@ async def create_work_report_in_db(report_data: dict):
 
                 # Проверяем наличие материалов на складе
                 materials_requirements = await fetch_work_materials_requirements(db, report_data['work_id'])
-                for requirement in materials_requirements:
-                    total_required = requirement['quantity_per_unit'] * report_data['quantity']
-                    if total_required <= 0:
-                        continue
-                    if requirement['available_quantity'] < total_required:
-                        await db.rollback()
-                        return False, (
-                            f"Недостаточно материала \"{requirement['material_name']}\" на складе"
-                        )
+                shortage = find_material_shortage(materials_requirements, report_data['quantity'])
+                if shortage:
+                    await db.rollback()
+                    return False, f"Недостаточно материала \"{shortage['material_name']}\" на складе"
 
                 # Создаем отчет и получаем его ID
 
@@ -1841,27 +1680,16 @@ async def create_work_report_in_db(report_data: dict):
                 )
 
                 # Вычитаем материалы со склада
-                for requirement in materials_requirements:
-                    total_required = requirement['quantity_per_unit'] * report_data['quantity']
-                    if total_required <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity - ? WHERE id = ?",
-                        (total_required, requirement['material_id'])
-                    )
-
-                    await log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        -total_required,
-                        'Списание',
-                        foreman_display,
-                        f"Списание по отчету работы ID {report_id}"
-                    )
+                await write_off_materials(
+                    db, materials_requirements, report_data['quantity'], foreman_display,
+                    f"Списание по отчету работы ID {report_id}"
+                )
 
                 
                 await db.commit()
                 logger.info(f"📊 Создан отчет ID: {report_id}")
+                if not photo_value:
+                    defer_report_folder(report_id, report_data.get('foreman_id'), report_data.get('report_date'))
                 return True, report_id
             except Exception as e:
                 await db.rollback()
@@ -1901,22 +1729,10 @@ async def update_work_report_in_db(report_id: int, report_data: dict):
 
                 # Восстанавливаем материалы на складе
                 old_requirements = await fetch_work_materials_requirements(db, old_work_id)
-                for requirement in old_requirements:
-                    total_to_restore = requirement['quantity_per_unit'] * old_quantity
-                    if total_to_restore <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity + ? WHERE id = ?",
-                        (total_to_restore, requirement['material_id'])
-                    )
-                    await log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        total_to_restore,
-                        'Возврат',
-                        correction_display,
-                        f"Возврат при редактировании отчета работы ID {report_id}"
-                    )
+                await restore_materials(
+                    db, old_requirements, old_quantity, correction_display,
+                    f"Возврат при редактировании отчета работы ID {report_id}"
+                )
 
                 # Проверяем новый баланс работы
                 async with db.execute(
@@ -1935,15 +1751,10 @@ async def update_work_report_in_db(report_id: int, report_data: dict):
 
                 # Проверяем наличие материалов на складе для новой работы
                 new_requirements = await fetch_work_materials_requirements(db, report_data['work_id'])
-                for requirement in new_requirements:
-                    total_required = requirement['quantity_per_unit'] * report_data['quantity']
-                    if total_required <= 0:
-                        continue
-                    if requirement['available_quantity'] < total_required:
-                        await db.rollback()
-                        return False, (
-                            f"Недостаточно материала \"{requirement['material_name']}\" на складе"
-                        )
+                shortage = find_material_shortage(new_requirements, report_data['quantity'])
+                if shortage:
+                    await db.rollback()
+                    return False, f"Недостаточно материала \"{shortage['material_name']}\" на складе"
 
                 auto_photo_url = report_data.get('photo_report_url')
                 if not auto_photo_url:
@@ -1961,22 +1772,10 @@ async def update_work_report_in_db(report_id: int, report_data: dict):
                 )
 
                 # Вычитаем материалы со склада
-                for requirement in new_requirements:
-                    total_required = requirement['quantity_per_unit'] * report_data['quantity']
-                    if total_required <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity - ? WHERE id = ?",
-                        (total_required, requirement['material_id'])
-                    )
-                    await log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        -total_required,
-                        'Списание',
-                        new_foreman_display,
-                        f"Списание по обновленному отчету работы ID {report_id}"
-                    )
+                await write_off_materials(
+                    db, new_requirements, report_data['quantity'], new_foreman_display,
+                    f"Списание по обновленному отчету работы ID {report_id}"
+                )
 
                 # Обновляем отчет
                 await db.execute(
@@ -1991,6 +1790,8 @@ async def update_work_report_in_db(report_id: int, report_data: dict):
 
                 await db.commit()
                 logger.info(f"📊 Обновлен отчет ID: {report_id}")
+                if not auto_photo_url:
+                    defer_report_folder(report_id, report_data.get('foreman_id'), report_data.get('report_date'))
                 return True, "Отчет успешно обновлен"
             except Exception as e:
                 await db.rollback()
@@ -2004,6 +1805,46 @@ async def update_work_report_in_db(report_id: int, report_data: dict):
 def read_root():
     return {"message": "StroyKontrol API", "version": "1.0.0"}
 
+
+@app.get("/health")
+async def health_check():
+    """Состояние сервиса и предохранителя Яндекс.Диска."""
+    breaker = yandex_disk_service.breaker.snapshot()
+    return {
+        "status": "degraded" if breaker["state"] == "open" else "healthy",
+        "yandex_disk": {
+            **breaker,
+            "bulkhead": yandex_disk_service.bulkhead.snapshot(),
+            "deferred": yandex_retry_queue.snapshot(),
+        },
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Метрики в формате Prometheus."""
+    return metrics.render()
+
+
+async def init_photo_tables():
+    """Создает таблицы реестра фото и фото отчетов."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await ensure_photo_tables(db)
+        await db.commit()
+
+
+async def init_search_index():
+    """Создает полнотекстовый индекс по работам и материалам."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await ensure_search_index(db)
+        await db.commit()
+
+
+@app.on_event("startup")
+async def start_yandex_retry_queue():
+    # Фоновая обработка отложенных операций с Яндекс.Диском
+    asyncio.create_task(yandex_retry_queue.run(settings.YANDEX_RETRY_INTERVAL_SECONDS))
+
 # Таблица пользователей сайта
 async def init_site_users_table():
     """Создает таблицу для пользователей сайта"""
@@ -2460,6 +2301,8 @@ async def startup_event():
     await ensure_work_reports_verification_column()
     await ensure_work_pricing_columns()
     await ensure_material_pricing_columns()
+    await init_photo_tables()
+    await init_search_index()
 
 
 # Эндпоинты для работ
@@ -2739,6 +2582,16 @@ async def update_work_materials(work_id: int, request: Request):
     }
 
 # Эндпоинты для материалов склада
+@app.get("/api/search")
+async def search_catalog_endpoint(q: str, type: Optional[str] = None, limit: int = 20):
+    """Полнотекстовый поиск по работам и материалам."""
+    if type is not None and type not in SEARCH_TYPES:
+        raise HTTPException(status_code=400, detail="type должен быть works или materials")
+    limit = max(1, min(limit, 100))
+    async with aiosqlite.connect(DB_PATH) as db:
+        results = await search_catalog(db, q, type, limit)
+    return {"success": True, "data": results}
+
 @app.get("/api/materials")
 async def get_materials():
     materials = await get_all_materials_from_db()
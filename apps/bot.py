@@ -1,15 +1,24 @@
 import asyncio
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import (
+    ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove,
+    InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile,
+)
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import json
 import re
 import os
 import tempfile
+import time
+import uuid
 import requests
 import logging
 import traceback
@@ -59,6 +68,10 @@ if not BOT_TOKEN:
     logger.error("BOT_TOKEN не задан! Укажите переменную окружения BOT_TOKEN")
     raise ValueError("BOT_TOKEN environment variable is required")
 
+# Адрес Bot API: пусто — api.telegram.org; можно указать локальный Bot API сервер
+# (или тестовый стенд, см. scripts/loadtest_bot.py)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+
 # Яндекс.Диск настройки
 YANDEX_DISK_TOKEN = os.getenv('YANDEX_DISK_TOKEN', '')
 YANDEX_DISK_BASE_FOLDER = os.getenv('YANDEX_DISK_BASE_FOLDER', 'StroyKontrol')
@@ -88,9 +101,40 @@ SPREADSHEET_ID = os.getenv('SPREADSHEET_ID', '')
 
 logger.info(f"Конфигурация загружена. DB_PATH={DB_PATH}, MANAGER_IDS={MANAGER_USER_IDS}")
 
+# Общие сервисы приложения импортируются после загрузки .env,
+# чтобы apps.config прочитал те же переменные окружения
+from apps.database import ensure_catalog_indexes, ensure_change_tracking, ensure_photo_tables
+from apps.repository import (
+    fetch_work_materials_requirements, find_material_shortage, get_foreman_display_name,
+    write_off_materials,
+)
+from apps.services.photo_registry import photo_registry, spool_chunks, CHUNK_SIZE
+from apps.services.response_cache import response_cache
+from apps.services.change_watcher import change_watcher
+from apps.services.yandex_disk import yandex_disk_service, yandex_retry_queue
+from apps.config import settings
+from apps.services.fsm_storage import SQLiteStorage
+from apps.services.scheduler import parse_time_of_day, run_daily
+from apps.services.telegram_sender import TelegramSender, split_message
+from apps.services.submission_queue import SubmissionQueue, SubmissionRejected
+from apps.services.update_isolation import UserUpdateIsolation
+
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+if TELEGRAM_API_URL:
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=BOT_TOKEN)
+# Состояния диалогов хранятся в SQLite, чтобы перезапуск бота не сбрасывал
+# незавершенные отчеты бригадиров
+fsm_storage = SQLiteStorage(settings.fsm_db_path, ttl=settings.BOT_FSM_TTL_HOURS * 3600)
+# Обновления обрабатываются параллельно (каждое в своей задаче), но обновления
+# одного пользователя — строго по очереди, чтобы переходы FSM не перемешивались
+update_isolation = UserUpdateIsolation(max_concurrency=settings.BOT_MAX_CONCURRENT_UPDATES)
+dp = Dispatcher(storage=fsm_storage, events_isolation=update_isolation)
+# Закрываем соединение с хранилищем состояний при остановке
+dp.shutdown.register(fsm_storage.close)
+# Рассылки идут через отправителя с учетом лимитов Telegram
+telegram_sender = TelegramSender(bot)
 
 # Состояния FSM
 class Form(StatesGroup):
@@ -149,8 +193,22 @@ async def init_db():
                 FOREIGN KEY (work_id) REFERENCES works (id)
             )
         ''')
+        # Реестр загруженных фото и фото, привязанные к отчетам
+        await ensure_photo_tables(db)
+        await ensure_catalog_indexes(db)
+        await ensure_change_tracking(db)
+        # Отметки об отправке ежедневной сводки (одна отправка на дату для всех процессов)
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS manager_digest_deliveries (
+                report_date TEXT PRIMARY KEY,
+                sent_at TEXT NOT NULL
+            )
+        ''')
         await db.commit()
-        logger.info("✅ База данных инициализирована.")
+    # Разделы и их связи с бригадирами (раньше создавались при каждом запросе работ)
+    await ensure_categories_table()
+    await ensure_foreman_sections_table()
+    logger.info("✅ База данных инициализирована.")
 
 async def upgrade_database():
     """Добавляет новые столбцы в базу данных при необходимости"""
@@ -166,6 +224,18 @@ async def upgrade_database():
                 logger.info("✅ Добавлен столбец project_total в таблицу works")
             else:
                 logger.info("✅ Столбец project_total уже существует")
+
+            # Ключ отправки из очереди бота: повторная обработка не создает дубль отчета
+            async with db.execute("PRAGMA table_info(work_reports)") as cursor:
+                columns = [column[1] for column in await cursor.fetchall()]
+            if 'submission_id' not in columns:
+                await db.execute('ALTER TABLE work_reports ADD COLUMN submission_id TEXT')
+                logger.info("✅ Добавлен столбец submission_id в таблицу work_reports")
+            await db.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_work_reports_submission "
+                "ON work_reports(submission_id) WHERE submission_id IS NOT NULL"
+            )
+            await db.commit()
                 
     except Exception as e:
         logger.error(f"❌ Ошибка обновления базы данных: {e}")
@@ -212,6 +282,7 @@ async def register_foreman(user_id: int, full_name: str, position: str, username
                 (user_id, full_name, position, username, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 1)  # is_active = 1 - сразу активен
             )
             await db.commit()
+            response_cache.bump('foremen')
             logger.info(f"👤 Зарегистрирован новый бригадир: {first_name} {position} (ID: {user_id})")
             return True
     except Exception as e:
@@ -283,8 +354,6 @@ def normalize_category_name(name: Optional[str]) -> str:
 
 async def get_assigned_category_names(foreman_id: int) -> Optional[List[str]]:
     """Возвращает список названий разделов, закрепленных за бригадиром."""
-    await ensure_foreman_sections_table()
-    await ensure_categories_table()
     try:
         async with aiosqlite.connect(DB_PATH) as db:
             async with db.execute(
@@ -312,264 +381,163 @@ async def get_assigned_category_names(foreman_id: int) -> Optional[List[str]]:
         logger.error(traceback.format_exc())
         return None
 
-async def _get_assigned_category_set(foreman_id: int) -> Set[str]:
-    """Возвращает множество нормализованных названий разделов для бригадира."""
-    assigned = await get_assigned_category_names(foreman_id) or []
-    normalized = {normalize_category_name(category) for category in assigned if category}
-    if not normalized:
-        logger.info("🔒 У бригадира %s нет назначенных разделов.", foreman_id)
-        return set()
-    return normalized
+# Кэш каталога работ по бригадирам: {foreman_id или None: (время истечения, работы)}.
+# Сбрасывается при изменении баланса работ ботом и при изменениях, внесенных
+# другими процессами (change_watcher); WORKS_CACHE_TTL - запасной срок жизни.
+WORKS_CACHE_TTL = float(os.getenv('BOT_WORKS_CACHE_SECONDS', '60'))
+_works_cache: dict = {}
+
+def invalidate_works_cache():
+    """Сбрасывает кэш каталога работ."""
+    _works_cache.clear()
+
+def _on_database_change(tables):
+    # Работы, разделы или назначения бригадиров изменены другим процессом (веб-панель)
+    if tables & {'works', 'categories', 'foreman_sections'}:
+        invalidate_works_cache()
+
+change_watcher.subscribe(_on_database_change)
+
+def _work_row_to_dict(row) -> dict:
+    work_id, name, category, unit, balance, project_total, is_active = row
+    return {
+        'id': work_id,
+        'Название работы': name,
+        'Раздел': category,
+        'Единица измерения': unit,
+        'На балансе': balance,
+        'Проект': project_total,
+        'is_active': is_active
+    }
 
 async def get_active_works(foreman_id: Optional[int] = None):
-    """Получает список активных работ из базы данных."""
-    filter_by_sections = foreman_id is not None and foreman_id not in MANAGER_USER_IDS
-
-    assigned_categories: Set[str] = set()
-    if filter_by_sections:
-        await ensure_foreman_sections_table()
-        await ensure_categories_table()
+    """Получает список активных работ из базы данных.
 
-        assigned_categories = await _get_assigned_category_set(foreman_id)
+    Для бригадиров работы отбираются одним запросом по назначенным разделам
+    (foreman_sections), руководители видят весь каталог.
+    """
+    filter_by_sections = foreman_id is not None and foreman_id not in MANAGER_USER_IDS
+    cache_key = foreman_id if filter_by_sections else None
 
-        if not assigned_categories:
-            
-            return []
+    cached = _works_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return [dict(work) for work in cached[1]]
 
-    query = (
-        "SELECT w.id, w.name, w.category, w.unit, w.balance, w.project_total, w.is_active "
-        "FROM works w WHERE w.is_active = 1"
-    )
-    
+    if filter_by_sections:
+        query = (
+            "SELECT w.id, w.name, w.category, w.unit, w.balance, w.project_total, w.is_active "
+            "FROM foreman_sections fs "
+            "JOIN categories c ON c.id = fs.category_id "
+            "JOIN works w ON w.category = c.name AND w.is_active = 1 "
+            "WHERE fs.foreman_id = ? "
+            "ORDER BY w.id"
+        )
+        params = (foreman_id,)
+    else:
+        query = (
+            "SELECT w.id, w.name, w.category, w.unit, w.balance, w.project_total, w.is_active "
+            "FROM works w WHERE w.is_active = 1 ORDER BY w.id"
+        )
+        params = ()
 
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute(query) as cursor:
-                rows = await cursor.fetchall()
-                works = []
-                for row in rows:
-                    work_id, name, category, unit, balance, project_total, is_active = row
-                    if filter_by_sections:
-                        if normalize_category_name(category) not in assigned_categories:
-                            continue
-                    works.append({
-                        'id': work_id,
-                        'Название работы': name,
-                        'Раздел': category,
-                        'Единица измерения': unit,
-                        'На балансе': balance,
-                        'Проект': project_total,
-                        'is_active': is_active
-                    })
-
-                if filter_by_sections and not works:
-                    logger.info(
-                        "🔍 Для бригадира %s не найдено работ в назначенных разделах.",
-                        foreman_id,
-                    )
-
-                logger.info(f"🔍 Найдено активных работ: {len(works)}")
-                return works
+            async with db.execute(query, params) as cursor:
+                works = [_work_row_to_dict(row) for row in await cursor.fetchall()]
     except Exception as e:
         logger.error(f"⚠️ Ошибка получения работ: {e}")
         logger.error(traceback.format_exc())
         return []
 
-async def _fetch_work_materials_requirements(db, work_id: int):
-    """Получает список материалов и норм расхода для указанной работы."""
-    async with db.execute('''
-        SELECT wm.material_id, wm.quantity_per_unit, m.name, m.quantity
-        FROM work_materials wm
-        JOIN materials m ON wm.material_id = m.id
-        WHERE wm.work_id = ?
-    ''', (work_id,)) as cursor:
-        rows = await cursor.fetchall()
-        materials = []
-        for row in rows:
-            material_id, quantity_per_unit, material_name, available_quantity = row
-            materials.append({
-                'material_id': material_id,
-                'quantity_per_unit': quantity_per_unit,
-                'material_name': material_name,
-                'available_quantity': available_quantity
-            })
-        return materials
-
-async def _get_foreman_display_name(db, foreman_id: Optional[int]) -> str:
-    """Возвращает отображаемое имя бригадира."""
-    if foreman_id is None:
-        return 'Неизвестный бригадир'
-
-    async with db.execute(
-        "SELECT first_name, last_name FROM foremen WHERE id = ?",
-        (foreman_id,),
-    ) as cursor:
-        row = await cursor.fetchone()
-        if row:
-            first_name, last_name = row
-            parts = [part for part in [first_name, last_name] if part]
-            if parts:
-                return f"Бригадир {' '.join(parts)}"
-
-    return f"Бригадир ID {foreman_id}"
-
-
-async def _log_material_history_entry(
-    db,
-    material_id: int,
-    change_amount: float,
-    change_type: str,
-    performed_by: Optional[str] = None,
-    description: Optional[str] = None,
-):
-    """Добавляет запись в историю движения материалов."""
-    performed_by_value = (performed_by or 'Неизвестно').strip() or 'Неизвестно'
-    description_value = (description or '').strip()
-
-    resulting_quantity = None
-    async with db.execute(
-        "SELECT quantity FROM materials WHERE id = ?",
-        (material_id,),
-    ) as cursor:
-        row = await cursor.fetchone()
-        if row is not None:
-            resulting_quantity = row[0]
-
-    cursor = await db.execute(
-        '''INSERT INTO material_history
-           (material_id, change_type, change_amount, resulting_quantity, performed_by, description, created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?)''',
-        (
-            material_id,
-            change_type,
-            change_amount,
-            resulting_quantity,
-            performed_by_value,
-            description_value,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        ),
-    )
-
-    return cursor.lastrowid
+    if filter_by_sections and not works:
+        logger.info(
+            "🔍 Для бригадира %s не найдено работ в назначенных разделах.",
+            foreman_id,
+        )
+    logger.info(f"🔍 Найдено активных работ: {len(works)}")
 
+    _works_cache[cache_key] = (time.monotonic() + WORKS_CACHE_TTL, works)
+    return [dict(work) for work in works]
 
-async def update_work_balance(
-    work_id: int,
-    quantity_used: float,
-    foreman_id: Optional[int] = None,
-    report_id: Optional[int] = None,
-):
-    """Обновляет баланс работы и списывает материалы на складе."""
+async def get_work_unit(work_id: int) -> str:
+    """Возвращает единицу измерения работы."""
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            try:
-                await db.execute("BEGIN")
-
-                # Получаем текущий баланс
-                async with db.execute(
-                    "SELECT balance FROM works WHERE id = ?", (work_id,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    if not row:
-                        await db.rollback()
-                        return False, "❌ Работа не найдена!"
-                    current_balance = row[0]
-
-                new_balance = current_balance - quantity_used
-                if new_balance < 0:
-                    await db.rollback()                  
-                    return False, "❌ Недостаточно материалов на балансе!"
-                
-                # Проверяем доступность материалов на складе
-                materials_requirements = await _fetch_work_materials_requirements(db, work_id)
-                for requirement in materials_requirements:
-                    total_required = requirement['quantity_per_unit'] * quantity_used
-                    if total_required <= 0:
-                        continue
-                    if requirement['available_quantity'] < total_required:
-                        await db.rollback()
-                        return False, (
-                            f"❌ Недостаточно материала \"{requirement['material_name']}\" на складе!"
-                        )
-
-                # Обновляем баланс работы
-
-                await db.execute(
-                    "UPDATE works SET balance = ? WHERE id = ?",
-                    (new_balance, work_id)
-                )
+            async with db.execute("SELECT unit FROM works WHERE id = ?", (work_id,)) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row and row[0] else 'шт'
+    except Exception as e:
+        logger.error(f"⚠️ Ошибка получения единицы измерения работы {work_id}: {e}")
+        return 'шт'
 
-                performed_by = await _get_foreman_display_name(db, foreman_id)
-
-                # Списываем материалы со склада
-                for requirement in materials_requirements:
-                    total_required = requirement['quantity_per_unit'] * quantity_used
-                    if total_required <= 0:
-                        continue
-                    await db.execute(
-                        "UPDATE materials SET quantity = quantity - ? WHERE id = ?",
-                        (total_required, requirement['material_id'])
-                    )
-                    description = (
-                        f"Списание по отчету работы ID {report_id}"
-                        if report_id is not None
-                        else f"Списание по отчету работы ID {work_id}"
-                    )
-                    await _log_material_history_entry(
-                        db,
-                        requirement['material_id'],
-                        -total_required,
-                        'Списание',
-                        performed_by,
-                        description,
-                    )
+async def store_submitted_report(submission: dict) -> dict:
+    """Сохраняет отчет из очереди отправок одной транзакцией.
 
-                await db.commit()
-                return True, new_balance
-            except Exception as inner_error:
-                await db.rollback()
-                raise inner_error
-    except Exception as e:
-        logger.error(f"⚠️ Ошибка обновления баланса: {e}")
-        logger.error(traceback.format_exc())
-        return False, f"❌ Ошибка обновления баланса: {e}"
+    Отчет, списание баланса работы и материалов записываются вместе, поэтому
+    повтор после ошибки безопасен; уже сохраненная отправка (submission_id)
+    повторно не записывается. Ошибки данных (нет работы, не хватает баланса)
+    приводят к SubmissionRejected, остальные — к повтору позже.
+    """
+    work_id = submission['work_id']
+    quantity = submission['quantity']
+    foreman_id = submission['user_id']
+    reported_at = datetime.fromisoformat(submission['reported_at'])
+
+    async with aiosqlite.connect(DB_PATH, timeout=10) as db:
+        async with db.execute(
+            "SELECT id FROM work_reports WHERE submission_id = ?", (submission['submission_id'],)
+        ) as cursor:
+            existing = await cursor.fetchone()
+        if existing:
+            async with db.execute("SELECT balance FROM works WHERE id = ?", (work_id,)) as cursor:
+                row = await cursor.fetchone()
+            return {'report_id': existing[0], 'new_balance': row[0] if row else None, 'created': False}
 
-async def save_work_report(user_id: int, work_id: int, quantity: float, photo_report_url: str = ""):
-    """Сохраняет отчет о выполненной работе в базе данных."""
-    try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            moscow_now = datetime.now(MOSCOW_TZ)
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            async with db.execute("SELECT balance FROM works WHERE id = ?", (work_id,)) as cursor:
+                row = await cursor.fetchone()
+            if not row:
+                raise SubmissionRejected("❌ Работа не найдена!")
+            new_balance = row[0] - quantity
+            if new_balance < 0:
+                raise SubmissionRejected("❌ Недостаточно материалов на балансе!")
+
+            materials_requirements = await fetch_work_materials_requirements(db, work_id)
+            shortage = find_material_shortage(materials_requirements, quantity)
+            if shortage:
+                raise SubmissionRejected(
+                    f"❌ Недостаточно материала \"{shortage['material_name']}\" на складе!"
+                )
 
             cursor = await db.execute(
-                "INSERT INTO work_reports (foreman_id, work_id, quantity, report_date, report_time, photo_report_url) VALUES (?, ?, ?, ?, ?, ?)",
-                (user_id, work_id, quantity,
-                 moscow_now.strftime('%Y-%m-%d'),
-                 moscow_now.strftime('%H:%M:%S'),
-                 photo_report_url)
+                "INSERT INTO work_reports (foreman_id, work_id, quantity, report_date, report_time, "
+                "photo_report_url, submission_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (foreman_id, work_id, quantity,
+                 reported_at.strftime('%Y-%m-%d'),
+                 reported_at.strftime('%H:%M:%S'),
+                 submission.get('photo_url') or '',
+                 submission['submission_id'])
             )
-            await db.commit()
             report_id = cursor.lastrowid
-            logger.info(f"✅ Отчет сохранен ID: {report_id} для работы ID: {work_id}")
-            return True, report_id
-    except Exception as e:
-        logger.error(f"⚠️ Ошибка сохранения отчета о работе: {e}")
-        logger.error(traceback.format_exc())
-        return False, f"⚠️ Ошибка сохранения отчета: {e}"
 
+            await db.execute("UPDATE works SET balance = ? WHERE id = ?", (new_balance, work_id))
 
-async def delete_work_report(report_id: int):
-    """Удаляет отчет о работе из базы данных."""
-    try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                "DELETE FROM work_reports WHERE id = ?",
-                (report_id,)
+            await write_off_materials(
+                db, materials_requirements, quantity,
+                await get_foreman_display_name(db, foreman_id),
+                f"Списание по отчету работы ID {report_id}"
             )
             await db.commit()
-            logger.info(f"🗑️ Отчет ID: {report_id} удален после ошибки списания")
-    except Exception as e:
-        logger.error(f"⚠️ Ошибка удаления отчета ID {report_id}: {e}")
-        logger.error(traceback.format_exc())
+        except BaseException:
+            await db.rollback()
+            raise
+
+    logger.info(f"✅ Отчет сохранен ID: {report_id} для работы ID: {work_id}")
+    invalidate_works_cache()
+    # Ответы API каталога, если бот работает в процессе API (webhook)
+    response_cache.bump('works', 'materials')
+    return {'report_id': report_id, 'new_balance': new_balance, 'created': True}
 
 async def get_reports_for_date(target_date: str):
     """Получает отчеты за конкретную дату."""
@@ -582,6 +550,7 @@ async def get_reports_for_date(target_date: str):
                 JOIN works w ON wr.work_id = w.id
                 JOIN foremen f ON wr.foreman_id = f.id
                 WHERE wr.report_date = ?
+                ORDER BY wr.id
             ''', (target_date,)) as cursor:
                 rows = await cursor.fetchall()
 
@@ -679,23 +648,14 @@ def setup_google_sheets():
     return DummySpreadsheet()
 
 # Настройка Яндекс.Диска
+# Запросы к Яндекс.Диску идут через общий клиент с предохранителем (circuit breaker):
+# пока диск недоступен, вызовы сразу завершаются ошибкой вместо ожидания таймаутов.
 def setup_yandex_disk():
-    try:
-        headers = {
-            'Authorization': f'OAuth {YANDEX_DISK_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        response = requests.get('https://cloud-api.yandex.net/v1/disk/', headers=headers)
-        if response.status_code == 200:
-            logger.info("✅ Яндекс.Диск настроен успешно!")
-            return True
-        else:
-            logger.error(f"❌ Ошибка настройки Яндекс.Диска: {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"❌ Ошибка настройки Яндекс.Диска: {e}")
-        logger.error(traceback.format_exc())
-        return False
+    if yandex_disk_service.check_connection():
+        logger.info("✅ Яндекс.Диск настроен успешно!")
+        return True
+    logger.error("❌ Ошибка настройки Яндекс.Диска")
+    return False
 
 # Очистка публичных ссылок Яндекс.Диска
 def sanitize_public_url(public_url: Optional[str]) -> Optional[str]:
@@ -713,29 +673,8 @@ def sanitize_public_url(public_url: Optional[str]) -> Optional[str]:
 
 # Создание папки на Яндекс.Диске
 def create_yandex_folder(folder_path):
-    try:
-        if not folder_path.startswith('/'):
-            folder_path = '/' + folder_path
-        headers = {
-            'Authorization': f'OAuth {YANDEX_DISK_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        logger.info(f"🔍 Создание папки: {folder_path}")
-        url = 'https://cloud-api.yandex.net/v1/disk/resources'
-        params = {'path': folder_path}
-        response = requests.put(url, headers=headers, params=params)
-        if response.status_code in [200, 201]:
-            logger.info(f"✅ Папка создана успешно: {folder_path}")
-            return True
-        elif response.status_code == 409:
-            logger.info(f"✅ Папка уже существует: {folder_path}")
-            return True
-        else:
-            logger.error(f"❌ Ошибка создания папки: {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"❌ Ошибка создания папки на Яндекс.Диске: {e}")
-        return False
+    logger.info(f"🔍 Создание папки: {folder_path}")
+    return yandex_disk_service.create_folder(folder_path)
 
 # Публикация папки на Яндекс.Диске и получение публичной ссылки
 def publish_yandex_folder(folder_path: str) -> str | None:
@@ -743,41 +682,7 @@ def publish_yandex_folder(folder_path: str) -> str | None:
     Публикует папку и возвращает публичную ссылку вида https://disk.yandex.ru/d/...
     folder_path — относительный путь, например: 'StroyKontrol/2025-09-26'
     """
-    try:
-        headers = {
-            'Authorization': f'OAuth {YANDEX_DISK_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        if folder_path.startswith('/'):
-            folder_path = folder_path[1:]
-        # 1. Публикуем папку
-        publish_url = 'https://cloud-api.yandex.net/v1/disk/resources/publish'
-        response = requests.put(publish_url, headers=headers, params={'path': folder_path})
-        if response.status_code != 200:
-            logger.error(f"❌ Не удалось опубликовать папку {folder_path}: {response.status_code} - {response.text}")
-            return None
-        # 2. Получаем публичную ссылку через GET-запрос с fields=public_url
-        info_url = 'https://cloud-api.yandex.net/v1/disk/resources'
-        info_response = requests.get(
-            info_url,
-            headers=headers,
-            params={'path': folder_path, 'fields': 'public_url'}
-        )
-        if info_response.status_code == 200:
-            public_url = sanitize_public_url(info_response.json().get('public_url'))
-            if public_url:
-                logger.info(f"🔗 Получена публичная ссылка: {public_url}")
-                return public_url
-            else:
-                logger.warning("⚠️ Папка опубликована, но public_url отсутствует в ответе")
-                return None
-        else:
-            logger.error(f"❌ Ошибка получения public_url: {info_response.status_code} - {info_response.text}")
-            return None
-    except Exception as e:
-        logger.error(f"❌ Исключение при публикации папки: {e}")
-        logger.error(traceback.format_exc())
-        return None
+    return yandex_disk_service.publish_folder(folder_path)
 
 # Создание папки с датой (для обычных отчетов)
 def create_date_folder():
@@ -818,85 +723,80 @@ def create_foreman_folder(date_folder_path, foreman_name, foreman_id):
         logger.error(traceback.format_exc())
         return None
 
-# Загрузка фото на Яндекс.Диск
-async def upload_photo_to_yandex(photo_file, folder_path, filename):
+# Загрузка фото на Яндекс.Диск с дедупликацией по хэшу содержимого
+async def store_photo_in_registry(photo_file, folder_path, filename):
+    """
+    Скачивает фото из Telegram потоком, считая SHA-256 по ходу загрузки.
+    Если такое же фото уже загружалось, повторно на Яндекс.Диск оно не отправляется —
+    возвращается уже опубликованный файл. Возвращает запись реестра или None.
+    """
     try:
         logger.info(f"🔍 Начало загрузки фото: {filename}")
-        file_info = await bot.get_file(photo_file.file_id)
-        file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_info.file_path}"
-        response = requests.get(file_url, timeout=30)
-        if response.status_code != 200:
-            logger.error(f"❌ Ошибка скачивания фото: статус {response.status_code}")
-            return None
-
-        headers = {
-            'Authorization': f'OAuth {YANDEX_DISK_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        upload_url = 'https://cloud-api.yandex.net/v1/disk/resources/upload'
-        file_path = f"{folder_path}/{filename}"
-        params = {'path': file_path, 'overwrite': 'true'}
-
-        response_upload = requests.get(upload_url, headers=headers, params=params)
-        if response_upload.status_code != 200:
-            logger.error(f"❌ Ошибка получения URL для загрузки: {response_upload.status_code} - {response_upload.text}")
-            return None
-
-        href = response_upload.json().get('href')
-        if not href:
-            logger.error("❌ Не получен URL для загрузки")
-            return None
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_file.write(response.content)
-            temp_file_path = temp_file.name
-
+        file_id = photo_file if isinstance(photo_file, str) else photo_file.file_id
+        file_info = await bot.get_file(file_id)
+        file_url = bot.session.api.file_url(BOT_TOKEN, file_info.file_path)
+        response = await asyncio.to_thread(requests.get, file_url, stream=True, timeout=30)
         try:
-            with open(temp_file_path, 'rb') as file:
-                upload_response = requests.put(href, data=file)
-
-            if upload_response.status_code == 201:
-                # Публикуем файл
-                public_url_response = requests.put(
-                    'https://cloud-api.yandex.net/v1/disk/resources/publish',
-                    headers=headers,
-                    params={'path': file_path}
-                )
-                if public_url_response.status_code == 200:
-                    # Если публикация прошла успешно, получаем публичную ссылку
-                    info_response = requests.get(
-                        'https://cloud-api.yandex.net/v1/disk/resources',
-                        headers=headers,
-                        params={'path': file_path, 'fields': 'public_url'}
-                    )
-                    if info_response.status_code == 200:
-                        return sanitize_public_url(info_response.json().get('public_url'))
-                    else:
-                        logger.error(f"❌ Ошибка получения public_url после публикации: {info_response.status_code}")
-                        # Возвращаем путь к файлу как резервный вариант
-                        return f"uploaded_file_path: {file_path}"
-                else:
-                    # Если публикация не удалась, пробуем получить прямую ссылку на файл
-                    file_info_response = requests.get(
-                        'https://cloud-api.yandex.net/v1/disk/resources',
-                        headers=headers,
-                        params={'path': file_path}
-                    )
-                    if file_info_response.status_code == 200:
-                        return file_info_response.json().get('file')
-                    else:
-                        logger.error(f"❌ Ошибка получения ссылки на файл: {file_info_response.status_code}")
-                        return f"uploaded_file_path: {file_path}"
-            else:
-                logger.error(f"❌ Ошибка загрузки фото: {upload_response.status_code}")
+            if response.status_code != 200:
+                logger.error(f"❌ Ошибка скачивания фото: статус {response.status_code}")
                 return None
+            spooled = await asyncio.to_thread(spool_chunks, response.iter_content(CHUNK_SIZE))
         finally:
-            os.unlink(temp_file_path)
+            response.close()
+
+        try:
+            stored = await photo_registry.store(spooled, folder_path, filename)
+        finally:
+            spooled.close()
+
+        if not stored:
+            logger.error(f"❌ Ошибка загрузки фото: {filename}")
+            return None
+        if stored['deduplicated']:
+            logger.info(f"♻️ Фото уже загружалось ранее, используем {stored['disk_path']}")
+        return stored
     except Exception as e:
         logger.error(f"❌ Ошибка загрузки фото на Яндекс.Диск: {e}")
         logger.error(traceback.format_exc())
         return None
 
+# Отложенная загрузка фото, полученного пока Яндекс.Диск был недоступен
+async def upload_pending_report_photo(report_id: int, user_id: int, file_id: str, filename: str) -> bool:
+    foreman_info = await get_foreman_info(user_id)
+    if not foreman_info:
+        return False
+    date_folder = await asyncio.to_thread(create_date_folder)
+    if not date_folder:
+        return False
+    foreman_folder = await asyncio.to_thread(
+        create_foreman_folder, date_folder, foreman_info['full_name'], user_id
+    )
+    if not foreman_folder:
+        return False
+    stored = await store_photo_in_registry(file_id, foreman_folder, filename)
+    if not stored:
+        return False
+
+    await photo_registry.link_many(report_id, [stored])
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            """UPDATE work_reports
+               SET photo_report_url = CASE
+                   WHEN photo_report_url IS NULL OR photo_report_url = '' THEN ?
+                   ELSE photo_report_url || char(10) || ?
+               END
+               WHERE id = ?""",
+            (stored['public_url'], stored['public_url'], report_id)
+        )
+        await db.commit()
+    logger.info(f"📷 Отложенное фото загружено для отчета ID {report_id}")
+    return True
+
+# Загрузка фото на Яндекс.Диск
+async def upload_photo_to_yandex(photo_file, folder_path, filename):
+    stored = await store_photo_in_registry(photo_file, folder_path, filename)
+    return stored['public_url'] if stored else None
+
 # Загрузка фотоотчета с людьми на Яндекс.Диск
 async def upload_people_photo_to_yandex(photo_file, folder_path, filename):
     return await upload_photo_to_yandex(photo_file, folder_path, filename) # переиспользуем ту же логику
@@ -941,6 +841,79 @@ def get_category_keyboard(category_map):
     keyboard.append([KeyboardButton(text='↩️ Назад')])
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
+# Список работ выводится inline-клавиатурой по WORKS_PAGE_SIZE кнопок на страницу;
+# в callback_data передается ID работы, а не ее название
+WORKS_PAGE_SIZE = 8
+WORK_BUTTON_MAX_LENGTH = 60
+
+class WorkCallback(CallbackData, prefix='work'):
+    """Кнопка списка работ: выбор работы (pick) или переход на страницу (page)."""
+    action: str
+    value: int
+
+def normalize_search_text(text: Optional[str]) -> str:
+    return (text or '').casefold().replace('ё', 'е').strip()
+
+def search_works(works, query: str):
+    """Ищет работы, в названии которых есть все слова запроса.
+
+    Сначала идут названия, начинающиеся с первого слова запроса.
+    """
+    tokens = normalize_search_text(query).split()
+    if not tokens:
+        return []
+    matches = []
+    for work in works:
+        name = normalize_search_text(work['Название работы'])
+        if all(token in name for token in tokens):
+            matches.append((not name.startswith(tokens[0]), name.find(tokens[0]), name, work))
+    matches.sort(key=lambda match: match[:3])
+    return [match[3] for match in matches]
+
+def find_work_by_id(data: dict, work_id: int):
+    """Находит работу по ID среди работ, сохраненных в состоянии."""
+    for key in ('works', 'all_works'):
+        for work in data.get(key) or []:
+            if work['id'] == work_id:
+                return work
+    return None
+
+def get_works_page_keyboard(works, page: int = 0):
+    pages = max(1, (len(works) + WORKS_PAGE_SIZE - 1) // WORKS_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    start = page * WORKS_PAGE_SIZE
+    keyboard = []
+    for work in works[start:start + WORKS_PAGE_SIZE]:
+        name = work['Название работы']
+        if len(name) > WORK_BUTTON_MAX_LENGTH:
+            name = name[:WORK_BUTTON_MAX_LENGTH - 1] + '…'
+        keyboard.append([InlineKeyboardButton(
+            text=name,
+            callback_data=WorkCallback(action='pick', value=work['id']).pack()
+        )])
+    if pages > 1:
+        keyboard.append([
+            InlineKeyboardButton(
+                text='◀️', callback_data=WorkCallback(action='page', value=(page - 1) % pages).pack()
+            ),
+            InlineKeyboardButton(
+                text=f'{page + 1}/{pages}', callback_data=WorkCallback(action='page', value=page).pack()
+            ),
+            InlineKeyboardButton(
+                text='▶️', callback_data=WorkCallback(action='page', value=(page + 1) % pages).pack()
+            ),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_work_selection_keyboard():
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text='📤 Завершить отчет')],
+            [KeyboardButton(text='↩️ Назад')]
+        ],
+        resize_keyboard=True
+    )
+
 def get_photo_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -1003,6 +976,35 @@ def get_manager_back_keyboard():
     )
 
 # === ОБРАБОТЧИКИ ===
+async def show_works_list(message: types.Message, state: FSMContext, works, title: str):
+    """Показывает список работ постранично и переводит в режим выбора работы."""
+    await state.update_data(works=works)
+    await message.answer(
+        f"{title}\n🔍 Чтобы найти работу, напишите часть ее названия.",
+        reply_markup=get_work_selection_keyboard()
+    )
+    await message.answer("Выберите выполненную работу:", reply_markup=get_works_page_keyboard(works))
+    await state.set_state(Form.selecting_work)
+
+async def select_work(message: types.Message, state: FSMContext, selected_work: dict):
+    """Запоминает выбранную работу и запрашивает количество."""
+    unit = selected_work.get('Единица измерения', 'шт')
+    await state.update_data(
+        selected_work_id=selected_work['id'],
+        selected_work_name=selected_work['Название работы'],
+        selected_work_unit=unit,
+    )
+    balance = selected_work.get('На балансе', 0)
+    category = selected_work.get('Раздел', '')
+    await message.answer(
+        f"🏗 Выбрана работа: {selected_work['Название работы']}\n"
+        f"📁 Раздел: {category}\n"
+        f"📊 Доступно: {balance} {unit}\n"
+        f"Введите количество ({unit}):",
+        reply_markup=get_back_keyboard()
+    )
+    await state.set_state(Form.entering_work_quantity)
+
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
     # Инициализация базы данных происходит при запуске
@@ -1206,17 +1208,8 @@ async def handle_category_selection(message: types.Message, state: FSMContext):
         )
         return
 
-    keyboard = [[KeyboardButton(text=work['Название работы'])] for work in works_in_category]
-    keyboard.append([KeyboardButton(text='📤 Завершить отчет')])
-    keyboard.append([KeyboardButton(text='↩️ Назад')])
-
-    await state.update_data(current_category=selected_category, works=works_in_category)
-
-    await message.answer(
-        f"Раздел: {selected_category}\nВыберите выполненную работу:",
-        reply_markup=ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
-    )
-    await state.set_state(Form.selecting_work)
+    await state.update_data(current_category=selected_category)
+    await show_works_list(message, state, works_in_category, f"Раздел: {selected_category}")
 
 # НОВЫЕ ОБРАБОТЧИКИ ДЛЯ РУКОВОДИТЕЛЯ
 @dp.message(Form.manager_selecting_report_type)
@@ -1228,7 +1221,7 @@ async def handle_manager_report_type(message: types.Message, state: FSMContext):
         await state.set_state(Form.selecting_action)
         return
     if message.text == '📅 За сегодня':
-        target_date = datetime.now().strftime('%Y-%m-%d')
+        target_date = datetime.now(MOSCOW_TZ).strftime('%Y-%m-%d')
         await generate_manager_report(message, state, target_date)
     elif message.text == '📆 Ввести дату':
         await message.answer("Введите дату в формате ДД.ММ.ГГГГ:", reply_markup=get_manager_back_keyboard())
@@ -1250,54 +1243,164 @@ async def handle_manager_custom_date(message: types.Message, state: FSMContext):
             reply_markup=get_manager_back_keyboard()
         )
 
-async def generate_manager_report(message: types.Message, state: FSMContext, target_date: str):
-    try:
+# === ЕЖЕДНЕВНАЯ СВОДКА ДЛЯ РУКОВОДИТЕЛЕЙ ===
+# Сводка за день собирается заранее: по расписанию (MANAGER_DIGEST_TIME, по Москве)
+# и после каждого нового отчета. Запрос руководителя отвечается из кэша, если
+# с момента сборки отчеты за дату не менялись.
+MANAGER_DIGEST_TIME = parse_time_of_day(os.getenv('MANAGER_DIGEST_TIME', '19:00'))
+
+_digest_cache: dict = {}          # дата -> {'signature': ..., 'blocks': [...]}
+_digest_links: dict = {}          # дата -> публичная ссылка на папку с фото
+_digest_refresh_tasks: dict = {}  # дата -> фоновая пересборка
+_digest_scheduler_task = None
+# Больше сообщений в одной сводке не отправляем — вместо них один файл
+MAX_DIGEST_MESSAGES = int(os.getenv('MANAGER_DIGEST_MAX_MESSAGES', '5'))
+
+def render_manager_digest(target_date: str, reports) -> List[str]:
+    """Формирует сводку по отчетам за дату: заголовок и по блоку на бригадира."""
+    display_date = target_date.replace('-', '.')
+    blocks = [f"Дата: {display_date}"]
+
+    for report_data in reports:
+        foreman = report_data['foreman']
+        position = report_data.get('position')
+        works = report_data['works']
+        header_line = f"Бригадир: {foreman}"
+        if position:
+            header_line += f" ({position})"
+        lines = [header_line]
+        for w in works:
+            work_name = w.get('name', '—')
+            quantity = w.get('quantity', '—')
+            unit = w.get('unit', '')
+            lines.append(f"• {work_name} — {quantity} {unit}".strip())
+        blocks.append("\n".join(lines))
+
+    return blocks
+
+async def _get_reports_signature(target_date: str):
+    """Дешевый отпечаток отчетов за дату: меняется при добавлении, удалении и правке."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT COUNT(*), MAX(id), TOTAL(quantity), TOTAL(work_id) "
+            "FROM work_reports WHERE report_date = ?",
+            (target_date,)
+        ) as cursor:
+            return tuple(await cursor.fetchone())
+
+async def get_digest_folder_link(target_date: str) -> Optional[str]:
+    """Создает и публикует папку с фото за дату; ссылка кэшируется."""
+    if target_date in _digest_links:
+        return _digest_links[target_date]
+    folder_relative_path = f"{YANDEX_DISK_BASE_FOLDER}/{target_date}"
+    await asyncio.to_thread(create_yandex_folder, '/' + folder_relative_path)
+    link = await asyncio.to_thread(publish_yandex_folder, folder_relative_path)
+    if link:
+        _digest_links[target_date] = link
+    return link
+
+async def get_manager_digest(target_date: str) -> Optional[dict]:
+    """Возвращает сводку за дату ({'blocks', 'link'}) или None, если отчетов нет."""
+    signature = await _get_reports_signature(target_date)
+    cached = _digest_cache.get(target_date)
+    if cached is None or cached['signature'] != signature:
         reports = await get_reports_for_date(target_date)
-        if not reports:
-            await message.answer(
-                f"📭 Нет отчетов за {target_date.replace('-', '.')}",
-                reply_markup=get_main_keyboard(message.from_user.id)
-            )
-            await state.set_state(Form.selecting_action)
-            return
+        blocks = render_manager_digest(target_date, reports) if reports else None
+        cached = {'signature': signature, 'blocks': blocks}
+        _digest_cache[target_date] = cached
+    if cached['blocks'] is None:
+        return None
+    return {'blocks': cached['blocks'], 'link': await get_digest_folder_link(target_date)}
 
-        display_date = target_date.replace('-', '.')
-        report_lines = [f"Дата: {display_date}\n"]
-
-        for report_data in reports:
-            foreman = report_data['foreman']
-            position = report_data.get('position')
-            works = report_data['works']
-            header_line = f"Бригадир: {foreman}"
-            if position:
-                header_line += f" ({position})"
-            report_lines.append(header_line)
-            for w in works:
-                work_name = w.get('name', '—')
-                quantity = w.get('quantity', '—')
-                unit = w.get('unit', '')
-                line = f"• {work_name} — {quantity} {unit}".strip()
-                report_lines.append(line)
-            report_lines.append("")
-
-        report_text = "\n".join(report_lines).strip()
-
-        # === Создаём папку с датой и публикуем её ===
-        folder_relative_path = f"{YANDEX_DISK_BASE_FOLDER}/{target_date}"
-        # Убеждаемся, что папка существует
-        create_yandex_folder('/' + folder_relative_path)
-        # Получаем публичную ссылку
-        yandex_link = publish_yandex_folder(folder_relative_path)
-        if not yandex_link:
-            yandex_link = f"📁 Не удалось опубликовать папку. Путь: {folder_relative_path}"
-
-        full_message = f"{report_text}\n📁 Фотоотчёты за эту дату:\n{yandex_link}"
-        if len(full_message) > 4096:
-            await message.answer(report_text[:4096])
-            await message.answer(f"...\n📁 Фотоотчёты: {yandex_link}")
-        else:
-            await message.answer(full_message, reply_markup=get_main_keyboard(message.from_user.id))
+def schedule_digest_refresh(target_date: str):
+    """Пересобирает сводку за дату в фоне (не чаще одной сборки одновременно)."""
+    running = _digest_refresh_tasks.get(target_date)
+    if running and not running.done():
+        return
+
+    async def refresh():
+        try:
+            await get_manager_digest(target_date)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить сводку за {target_date}: {e}")
+
+    _digest_refresh_tasks[target_date] = asyncio.create_task(refresh())
 
+async def send_manager_digest(chat_id: int, target_date: str, digest: Optional[dict], reply_markup=None):
+    """Отправляет сводку (или сообщение об отсутствии отчетов) в чат.
+
+    Длинная сводка делится на сообщения по границам бригадиров; если сообщений
+    получается больше MAX_DIGEST_MESSAGES, сводка отправляется файлом.
+    """
+    display_date = target_date.replace('-', '.')
+    if digest is None:
+        await telegram_sender.send_message(
+            chat_id, f"📭 Нет отчетов за {display_date}", reply_markup=reply_markup
+        )
+        return
+
+    folder_relative_path = f"{YANDEX_DISK_BASE_FOLDER}/{target_date}"
+    yandex_link = digest['link'] or f"📁 Не удалось опубликовать папку. Путь: {folder_relative_path}"
+    link_block = f"📁 Фотоотчёты за эту дату:\n{yandex_link}"
+    blocks = digest['blocks']
+
+    if len(split_message(blocks)) > MAX_DIGEST_MESSAGES:
+        document = BufferedInputFile(
+            "\n\n".join(blocks).encode('utf-8'), filename=f"report_{target_date}.txt"
+        )
+        await telegram_sender.send_document(
+            chat_id, document,
+            caption=f"📋 Сводка за {display_date}: бригадиров — {len(blocks) - 1}\n{link_block}",
+            reply_markup=reply_markup
+        )
+        return
+
+    await telegram_sender.send_long_message(chat_id, blocks + [link_block], reply_markup=reply_markup)
+
+async def _claim_digest_delivery(target_date: str) -> bool:
+    """Отмечает отправку сводки за дату; False, если ее уже отправил другой процесс."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO manager_digest_deliveries (report_date, sent_at) VALUES (?, ?)",
+            (target_date, datetime.now(MOSCOW_TZ).strftime('%Y-%m-%d %H:%M:%S'))
+        )
+        await db.commit()
+        return cursor.rowcount == 1
+
+async def push_manager_digest():
+    """Рассылает сводку за сегодня всем руководителям."""
+    target_date = datetime.now(MOSCOW_TZ).strftime('%Y-%m-%d')
+    if not MANAGER_USER_IDS or not await _claim_digest_delivery(target_date):
+        return
+    digest = await get_manager_digest(target_date)
+    # Руководителям отправляем параллельно: лимиты соблюдает telegram_sender
+    manager_ids = sorted(MANAGER_USER_IDS)
+    results = await asyncio.gather(
+        *(send_manager_digest(manager_id, target_date, digest) for manager_id in manager_ids),
+        return_exceptions=True
+    )
+    for manager_id, result in zip(manager_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Не удалось отправить сводку руководителю {manager_id}: {result}")
+    logger.info(f"📨 Сводка за {target_date} отправлена руководителям: {len(MANAGER_USER_IDS)}")
+
+def start_digest_scheduler():
+    """Запускает ежедневную рассылку и заранее собирает сводку за сегодня."""
+    global _digest_scheduler_task
+    schedule_digest_refresh(datetime.now(MOSCOW_TZ).strftime('%Y-%m-%d'))
+    if MANAGER_DIGEST_TIME is None or _digest_scheduler_task is not None:
+        return
+    _digest_scheduler_task = asyncio.create_task(
+        run_daily('manager_digest', MANAGER_DIGEST_TIME, MOSCOW_TZ, push_manager_digest)
+    )
+
+async def generate_manager_report(message: types.Message, state: FSMContext, target_date: str):
+    try:
+        digest = await get_manager_digest(target_date)
+        await send_manager_digest(
+            message.chat.id, target_date, digest,
+            reply_markup=get_main_keyboard(message.from_user.id)
+        )
         await state.set_state(Form.selecting_action)
 
     except Exception as e:
@@ -1408,25 +1511,64 @@ async def handle_work_selection(message: types.Message, state: FSMContext):
 
     data = await state.get_data()
     works = data.get('works', [])
-    selected_work = next((w for w in works if w['Название работы'].strip().lower() == message.text.strip().lower()), None)
-
+    query = (message.text or '').strip()
+    selected_work = next(
+        (w for w in works if normalize_search_text(w['Название работы']) == normalize_search_text(query)),
+        None
+    )
     if selected_work:
-        work_id = selected_work['id'] # Получаем ID из БД
-        await state.update_data(selected_work_id=work_id, selected_work_name=selected_work['Название работы']) # Сохраняем ID
-        unit = selected_work.get('Единица измерения', 'шт')
-        balance = selected_work.get('На балансе', 0)
-        category = selected_work.get('Раздел', '')
+        await select_work(message, state, selected_work)
+        return
+
+    # Любой другой текст считается поисковым запросом по всем доступным работам
+    matches = search_works(data.get('all_works') or works, query)
+    if not matches:
         await message.answer(
-            f"🏗 Выбрана работа: {selected_work['Название работы']}\n"
-            f"📁 Раздел: {category}\n"
-            f"📊 Доступно: {balance} {unit}\n"
-            f"Введите количество ({unit}):",
-            reply_markup=get_back_keyboard()
+            f"❌ По запросу «{query}» ничего не найдено. Попробуйте другое название "
+            f"или выберите работу из списка выше."
         )
-        await state.set_state(Form.entering_work_quantity)
-    else:
-        available = "\n".join([f"• {w['Название работы']} ({w.get('Раздел', '')})" for w in works])
-        await message.answer(f"❌ Работа '{message.text}' не найдена.\nДоступные работы:\n{available}")
+        return
+    await state.update_data(works=matches)
+    await message.answer(
+        f"🔍 Найдено работ: {len(matches)}. Выберите выполненную работу:",
+        reply_markup=get_works_page_keyboard(matches)
+    )
+
+@dp.callback_query(Form.selecting_work, WorkCallback.filter())
+async def handle_work_callback(callback: types.CallbackQuery, callback_data: WorkCallback, state: FSMContext):
+    data = await state.get_data()
+
+    if callback_data.action == 'page':
+        try:
+            await callback.message.edit_reply_markup(
+                reply_markup=get_works_page_keyboard(data.get('works', []), callback_data.value)
+            )
+        except TelegramBadRequest:
+            pass  # Та же страница: сообщение не изменилось
+        await callback.answer()
+        return
+
+    has_access, error_msg = await check_access(callback.from_user.id)
+    if not has_access:
+        await callback.answer()
+        await callback.message.answer(error_msg)
+        await state.set_state(Form.selecting_action)
+        return
+
+    selected_work = find_work_by_id(data, callback_data.value)
+    if not selected_work:
+        await callback.answer("Работа больше недоступна. Выберите другую.", show_alert=True)
+        return
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except TelegramBadRequest:
+        pass
+    await select_work(callback.message, state, selected_work)
+
+@dp.callback_query(WorkCallback.filter())
+async def handle_stale_work_callback(callback: types.CallbackQuery):
+    await callback.answer("Этот список работ устарел. Начните выбор заново.", show_alert=True)
 
 @dp.message(Form.entering_work_quantity)
 async def handle_work_quantity(message: types.Message, state: FSMContext):
@@ -1468,7 +1610,12 @@ async def handle_work_quantity(message: types.Message, state: FSMContext):
         data = await state.get_data()
         work_id = data['selected_work_id'] # Получаем ID из состояния
         work_name = data['selected_work_name'] # Получаем имя для отображения
-        await state.update_data(work_id=work_id, work_name=work_name, quantity=quantity) # Сохраняем ID и имя
+        await state.update_data(
+            work_id=work_id,
+            work_name=work_name,
+            work_unit=data.get('selected_work_unit'),
+            quantity=quantity,
+        ) # Сохраняем ID и имя
         await message.answer("📸 Хотите прикрепить фотоотчет к выполненной работе?", reply_markup=get_photo_keyboard())
         await state.set_state(Form.waiting_photo)
     except ValueError:
@@ -1480,22 +1627,19 @@ async def handle_photo_choice(message: types.Message, state: FSMContext):
 
     if message.text == '↩️ Назад':
         data = await state.get_data()
-        await state.update_data(photo_urls=[], photo_folder_path=None, date_folder_path=None)
+        await state.update_data(photo_urls=[], photo_records=[], pending_photos=[], photo_folder_path=None, date_folder_path=None)
         work_id = data.get('work_id', 0) # Получаем ID
         work_name = data.get('work_name', 'Неизвестная работа') # Получаем имя
-        # Нужно получить unit и category заново из БД, так как они не сохранены в FSM
-        works = await get_active_works(user_id)
-        selected_work = next((w for w in works if w['id'] == work_id), None)
-        unit = selected_work.get('Единица измерения', 'шт') if selected_work else 'шт'
+        unit = data.get('work_unit') or await get_work_unit(work_id)
         await message.answer(f"Введите количество ({unit}):", reply_markup=get_back_keyboard())
         await state.set_state(Form.entering_work_quantity)
         return
     if message.text == '➡️ Пропустить фото':
-        await state.update_data(photo_urls=[], photo_folder_path=None, date_folder_path=None)
+        await state.update_data(photo_urls=[], photo_records=[], pending_photos=[], photo_folder_path=None, date_folder_path=None)
         await save_report_with_photo(message, state, photo_url="")
         return
     if message.text == '📸 Прикрепить фото':
-        await state.update_data(photo_urls=[], photo_folder_path=None, date_folder_path=None)
+        await state.update_data(photo_urls=[], photo_records=[], pending_photos=[], photo_folder_path=None, date_folder_path=None)
         await message.answer(
             "📸 Пожалуйста, отправьте фотографию выполненной работы. \n"
             "Вы можете прикрепить несколько фотографий, после чего нажмите «✅ Завершить добавление фото».",
@@ -1505,9 +1649,13 @@ async def handle_photo_choice(message: types.Message, state: FSMContext):
     if message.text == '✅ Завершить добавление фото':
         data = await state.get_data()
         photo_urls = data.get('photo_urls', [])
+        photo_records = data.get('photo_records', [])
+        pending_photos = data.get('pending_photos', [])
         joined_urls = "\n".join(photo_urls) if photo_urls else ""
-        await state.update_data(photo_urls=[], photo_folder_path=None, date_folder_path=None)
-        await save_report_with_photo(message, state, photo_url=joined_urls)
+        await state.update_data(photo_urls=[], photo_records=[], pending_photos=[], photo_folder_path=None, date_folder_path=None)
+        await save_report_with_photo(
+            message, state, photo_url=joined_urls, photos=photo_records, pending_photos=pending_photos
+        )
         return
     if message.photo:
         try:
@@ -1516,18 +1664,38 @@ async def handle_photo_choice(message: types.Message, state: FSMContext):
             work_name = data.get('work_name', 'Неизвестная работа') # Получаем имя
             quantity = data.get('quantity', 0)
             photo_urls = data.get('photo_urls', [])
+            photo_records = data.get('photo_records', [])
+            pending_photos = data.get('pending_photos', [])
             user_id = message.from_user.id
 
-            if not setup_yandex_disk():
+            photo = message.photo[-1]
+            timestamp = datetime.now().strftime('%H-%M-%S')
+            filename = f"{work_name}_{timestamp}.jpg" # Используем имя работы
+            filename = re.sub(r'[^\w\-_.]', '_', filename)
+
+            # Яндекс.Диск недоступен (предохранитель разомкнут): не ждем таймаутов,
+            # запоминаем фото и загрузим его в фоне после сохранения отчета
+            if not yandex_disk_service.is_available():
+                pending_photos.append({'file_id': photo.file_id, 'filename': filename})
+                await state.update_data(pending_photos=pending_photos)
+                await message.answer(
+                    "⏳ Яндекс.Диск временно недоступен. Фото будет загружено автоматически позже.\n"
+                    f"📷 Добавлено фото: {len(photo_urls) + len(pending_photos)} шт.\n"
+                    "Вы можете отправить еще фотографии или нажмите «✅ Завершить добавление фото».",
+                    reply_markup=get_photo_upload_keyboard()
+                )
+                return
+
+            if not await asyncio.to_thread(setup_yandex_disk):
                 await message.answer("❌ Ошибка подключения к Яндекс.Диску. Отчет сохранен без фото.")
                 await state.update_data(photo_urls=[], photo_folder_path=None, date_folder_path=None)
                 await save_report_with_photo(message, state, photo_url="")
                 return
 
-            create_yandex_folder(YANDEX_DISK_BASE_FOLDER)
+            await asyncio.to_thread(create_yandex_folder, YANDEX_DISK_BASE_FOLDER)
             date_folder = data.get('date_folder_path')
             if not date_folder:
-                date_folder = create_date_folder()
+                date_folder = await asyncio.to_thread(create_date_folder)
             if not date_folder:
                 await message.answer("❌ Ошибка создания папки с датой. Отчет сохранен без фото.")
                 await save_report_with_photo(message, state, photo_url="")
@@ -1542,29 +1710,40 @@ async def handle_photo_choice(message: types.Message, state: FSMContext):
 
             foreman_folder = data.get('photo_folder_path')
             if not foreman_folder:
-                foreman_folder = create_foreman_folder(date_folder, foreman_info['full_name'], user_id)
+                foreman_folder = await asyncio.to_thread(
+                    create_foreman_folder, date_folder, foreman_info['full_name'], user_id
+                )
             if not foreman_folder:
                 await message.answer("❌ Ошибка создания папки бригадира. Отчет сохранен без фото.")
                 await state.update_data(photo_urls=[], photo_folder_path=None, date_folder_path=None)
                 await save_report_with_photo(message, state, photo_url="")
                 return
 
-            photo = message.photo[-1]
-            timestamp = datetime.now().strftime('%H-%M-%S')
-            filename = f"{work_name}_{timestamp}.jpg" # Используем имя работы
-            filename = re.sub(r'[^\w\-_.]', '_', filename)
-
-            photo_url = await upload_photo_to_yandex(photo, foreman_folder, filename)
+            stored_photo = await store_photo_in_registry(photo, foreman_folder, filename)
+            photo_url = stored_photo['public_url'] if stored_photo else None
 
             if photo_url:
                 await message.answer("✅ Фото успешно загружено!")
                 photo_urls.append(photo_url)
-                await state.update_data(photo_urls=photo_urls, photo_folder_path=foreman_folder, date_folder_path=date_folder)
+                photo_records.append(stored_photo)
+                await state.update_data(
+                    photo_urls=photo_urls,
+                    photo_records=photo_records,
+                    photo_folder_path=foreman_folder,
+                    date_folder_path=date_folder
+                )
                 await message.answer(
-                    f"📷 Добавлено фото: {len(photo_urls)} шт.\n"
+                    f"📷 Добавлено фото: {len(photo_urls) + len(pending_photos)} шт.\n"
                     "Вы можете отправить еще фотографии или нажмите «✅ Завершить добавление фото».",
                     reply_markup=get_photo_upload_keyboard()
                 )
+            elif not yandex_disk_service.is_available():
+                pending_photos.append({'file_id': photo.file_id, 'filename': filename})
+                await state.update_data(pending_photos=pending_photos)
+                await message.answer(
+                    "⏳ Яндекс.Диск временно недоступен. Фото будет загружено автоматически позже.",
+                    reply_markup=get_photo_upload_keyboard()
+                )
             else:
                 await message.answer("❌ Ошибка загрузки фото. Отчет сохранен без фото.")
 
@@ -1584,73 +1763,128 @@ async def handle_photo_choice(message: types.Message, state: FSMContext):
         await state.set_state(Form.selecting_action)
         return
 
-async def save_report_with_photo(message: types.Message, state: FSMContext, photo_url: str):
+async def process_submission(submission: dict) -> dict:
+    """Обработчик очереди отправок: сохраняет отчет и привязывает фото."""
+    result = await store_submitted_report(submission)
+    if not result['created']:
+        return result
+    report_id = result['report_id']
+
+    # Привязываем загруженные фото к отчету
+    if submission.get('photos'):
+        try:
+            await photo_registry.link_many(report_id, submission['photos'])
+        except Exception as link_error:
+            logger.error(f"⚠️ Ошибка привязки фото к отчету ID {report_id}: {link_error}")
+
+    # Фото, полученные пока Яндекс.Диск был недоступен, загружаем в фоне
+    for pending in submission.get('pending_photos') or []:
+        yandex_retry_queue.submit(
+            f"report {report_id} photo {pending['filename']}",
+            upload_pending_report_photo,
+            report_id,
+            submission['user_id'],
+            pending['file_id'],
+            pending['filename'],
+        )
+
+    # Сводка руководителям за дату отчета пересобирается в фоне
+    schedule_digest_refresh(submission['reported_at'][:10])
+    return result
+
+async def notify_submission_stored(submission: dict, result: dict):
+    """Сообщает бригадиру, что отложенный отчет сохранен."""
+    unit = submission.get('unit') or 'шт'
+    await telegram_sender.send_message(
+        submission['chat_id'],
+        f"✅ Отчет сохранен: {submission['work_name']} — {submission['quantity']} {unit}\n"
+        f"💰 Остаток: {result['new_balance']} {unit}"
+    )
+
+async def notify_submission_rejected(submission: dict, error: SubmissionRejected):
+    """Сообщает бригадиру, что отложенный отчет не удалось сохранить."""
+    await telegram_sender.send_message(
+        submission['chat_id'],
+        f"❌ Отчет по работе «{submission['work_name']}» не сохранен.\n{error}"
+    )
+
+# Очередь отправок отчетов: отчет сначала записывается в отдельный файл и
+# сохраняется в основную базу в фоне, с повторами при ошибках базы
+submission_queue = SubmissionQueue(
+    settings.outbox_db_path,
+    handler=process_submission,
+    on_done=notify_submission_stored,
+    on_rejected=notify_submission_rejected,
+)
+dp.shutdown.register(submission_queue.close)
+# Сколько ждать сохранения отчета, прежде чем ответить «принят в очередь»
+SUBMISSION_WAIT_SECONDS = float(os.getenv('BOT_SUBMISSION_WAIT_SECONDS', '3'))
+SUBMISSION_RETRY_INTERVAL_SECONDS = 5
+
+async def save_report_with_photo(
+    message: types.Message,
+    state: FSMContext,
+    photo_url: str,
+    photos: Optional[list] = None,
+    pending_photos: Optional[list] = None,
+):
     try:
         data = await state.get_data()
         work_id = data.get('work_id', 0) # Получаем ID
         work_name = data.get('work_name', 'Неизвестная работа') # Получаем имя
         quantity = data.get('quantity', 0)
         works_list = data.get('works_list', [])
-
-        report_success, report_result = await save_work_report(
-            message.from_user.id,
-            work_id, # Передаем ID
-            quantity,
-            photo_url
-        )
-
-        if not report_success:
-            await message.answer(
-                report_result,
-                reply_markup=get_main_keyboard(message.from_user.id)
-            )
-            
-            await state.set_state(Form.selecting_action)
-            return
-
-        report_id = report_result
-
-        balance_success, balance_result = await update_work_balance(
-            work_id,
-            quantity,
-            message.from_user.id,
-            report_id
-        )
-
-        if not balance_success:
-            await delete_work_report(report_id)
+        unit = data.get('work_unit') or await get_work_unit(work_id)
+
+        submission = {
+            'submission_id': uuid.uuid4().hex,
+            'user_id': message.from_user.id,
+            'chat_id': message.chat.id,
+            'work_id': work_id,
+            'work_name': work_name,
+            'quantity': quantity,
+            'unit': unit,
+            'photo_url': photo_url,
+            'photos': photos or [],
+            'pending_photos': pending_photos or [],
+            'reported_at': datetime.now(MOSCOW_TZ).isoformat(),
+        }
+        submission_key = await submission_queue.submit(message.from_user.id, submission)
+        try:
+            result = await submission_queue.wait(submission_key, SUBMISSION_WAIT_SECONDS)
+        except SubmissionRejected as rejection:
             await message.answer(
-                balance_result,
+                str(rejection),
                 reply_markup=get_main_keyboard(message.from_user.id)
             )
             await state.set_state(Form.selecting_action)
             return
 
-        new_balance = balance_result
-
-        # Нужно получить unit заново из БД
-        works = await get_active_works(message.from_user.id)
-        selected_work = next((w for w in works if w['id'] == work_id), None)
-        unit = selected_work.get('Единица измерения', 'шт') if selected_work else 'шт'
-
-        foreman_info = await get_foreman_info(message.from_user.id)
-        photo_text = " с фотоотчетом" if photo_url else ""
+        foreman_info = await get_foreman_info(message.from_user.id) or {}
+        photo_text = " с фотоотчетом" if photo_url or pending_photos else ""
         works_list.append({'work_name': work_name, 'quantity': quantity, 'unit': unit, 'photo': photo_text})
         await state.update_data(
             works_list=works_list,
             photo_urls=[],
+            photo_records=[],
+            pending_photos=[],
             photo_folder_path=None,
             date_folder_path=None
         )
         count = len(works_list)
+        if result is None:
+            # База пока недоступна: отчет сохранится из очереди, бригадир получит уведомление
+            balance_line = "🕓 Отчет принят и будет сохранен автоматически, мы сообщим об этом.\n"
+        else:
+            balance_line = f"💰 Остаток: {result['new_balance']} {unit}\n"
         await message.answer(
             f"✅ Работа добавлена в отчет{photo_text}!\n"
-            f"👷 Бригадир: {foreman_info['full_name']}\n"
+            f"👷 Бригадир: {foreman_info.get('full_name') or '—'}\n"
             f"💼 Должность: {foreman_info.get('position') or '—'}\n"
             f"🏗 Работа: {work_name}\n" # Используем имя
             f"📊 Количество: {quantity} {unit}\n"
-            f"💰 Остаток: {new_balance} {unit}\n"
-            f"📅 Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n"
+            f"{balance_line}"
+            f"📅 Дата: {datetime.now(MOSCOW_TZ).strftime('%d.%m.%Y %H:%M')}\n"
             f"📋 В отчете уже {count} шт\n"
             f"Хотите добавить еще работу в отчет?",
             reply_markup=get_add_more_keyboard()
@@ -1667,11 +1901,10 @@ async def handle_add_more_works(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     if message.text == '✅ Добавить еще работу':
         data = await state.get_data()
-        works = data.get('works', [])
-        keyboard = [[KeyboardButton(text=w['Название работы'])] for w in works]
-        keyboard += [[KeyboardButton(text='📤 Завершить отчет')], [KeyboardButton(text='↩️ Назад')]]
-        await message.answer("Выберите выполненную работу:", reply_markup=ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True))
-        await state.set_state(Form.selecting_work)
+        category = data.get('current_category')
+        works = (data.get('categories') or {}).get(category) or data.get('works', [])
+        title = f"Раздел: {category}" if category else "Добавление работы"
+        await show_works_list(message, state, works, title)
     elif message.text == '📤 Завершить отчет':
         data = await state.get_data()
         works_list = data.get('works_list', [])
@@ -1685,24 +1918,49 @@ async def handle_add_more_works(message: types.Message, state: FSMContext):
         await message.answer("Пожалуйста, выберите действие:", reply_markup=get_add_more_keyboard())
 
         has_access, error_msg = await check_access(user_id)
-    if not has_access:
-        await message.answer(error_msg)
-        await state.set_state(Form.selecting_action)
-        return
-
-# Запуск бота
-async def main():
-    logger.info("🚀 Запуск строительного бота...")
+        if not has_access:
+            await message.answer(error_msg)
+            await state.set_state(Form.selecting_action)
+            return
 
+# Подготовка базы данных и Яндекс.Диска (общая для polling и webhook)
+async def on_startup():
     # Инициализируем базу данных
     await init_db()
     
     # Обновляем структуру базы данных при необходимости
     await upgrade_database()
 
-    if setup_yandex_disk():
-        create_yandex_folder(YANDEX_DISK_BASE_FOLDER)
-        create_yandex_folder(f"{YANDEX_DISK_BASE_FOLDER}/{YANDEX_DISK_PEOPLE_REPORTS_FOLDER}")
+    if await asyncio.to_thread(setup_yandex_disk):
+        await asyncio.to_thread(create_yandex_folder, YANDEX_DISK_BASE_FOLDER)
+        await asyncio.to_thread(
+            create_yandex_folder, f"{YANDEX_DISK_BASE_FOLDER}/{YANDEX_DISK_PEOPLE_REPORTS_FOLDER}"
+        )
+
+    # Ежедневная сводка руководителям
+    start_digest_scheduler()
+
+    # Отчеты, не сохраненные до перезапуска, досохраняются из очереди
+    asyncio.create_task(submission_queue.run(SUBMISSION_RETRY_INTERVAL_SECONDS))
+
+    # Изменения базы другими процессами сбрасывают кэши бота
+    change_watcher.start(settings.CHANGE_POLL_INTERVAL_SECONDS)
+
+# Запуск бота
+async def main():
+    if settings.bot_webhook_enabled:
+        # В режиме webhook обновления принимает API-сервер (apps.main)
+        logger.error("Задан BOT_WEBHOOK_URL: бот работает через API-сервер, polling не запускается")
+        return
+
+    logger.info("🚀 Запуск строительного бота...")
+    await on_startup()
+
+    # Фоновая загрузка отложенных фото на Яндекс.Диск
+    asyncio.create_task(yandex_retry_queue.run(settings.YANDEX_RETRY_INTERVAL_SECONDS))
+
+    # Снимаем webhook, если бот раньше работал через API-сервер
+    await bot.delete_webhook()
 
     logger.info("✅ Бот успешно запущен!")
     await dp.start_polling(bot)
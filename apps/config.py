@@ -26,12 +26,46 @@ class Settings:
     # Telegram Bot
     BOT_TOKEN: str = os.getenv('BOT_TOKEN', '')
     MANAGER_USER_IDS: Set[int] = set()
+    # Bot conversation state; defaults to bot_fsm.db next to DATABASE_PATH
+    BOT_FSM_DB_PATH: str = os.getenv('BOT_FSM_DB_PATH', '')
+    BOT_FSM_TTL_HOURS: float = float(os.getenv('BOT_FSM_TTL_HOURS', '48'))
+    # Durable queue of report submissions; defaults to bot_outbox.db next to DATABASE_PATH
+    BOT_OUTBOX_DB_PATH: str = os.getenv('BOT_OUTBOX_DB_PATH', '')
+    # Bot updates handled at once across all users (a user's own updates are handled one by one)
+    BOT_MAX_CONCURRENT_UPDATES: int = int(os.getenv('BOT_MAX_CONCURRENT_UPDATES', '32'))
+    # Webhook mode: updates are served by the API app instead of polling
+    BOT_WEBHOOK_URL: str = os.getenv('BOT_WEBHOOK_URL', '')
+    BOT_WEBHOOK_PATH: str = os.getenv('BOT_WEBHOOK_PATH', '/telegram/webhook')
+    BOT_WEBHOOK_SECRET: str = os.getenv('BOT_WEBHOOK_SECRET', '')
+    BOT_WEBHOOK_MAX_CONCURRENCY: int = int(os.getenv('BOT_WEBHOOK_MAX_CONCURRENCY', '40'))
 
     # Yandex Disk
     YANDEX_DISK_TOKEN: str = os.getenv('YANDEX_DISK_TOKEN', '')
+    YANDEX_DISK_API_URL: str = os.getenv('YANDEX_DISK_API_URL', 'https://cloud-api.yandex.net/v1/disk')
     YANDEX_DISK_BASE_FOLDER: str = os.getenv('YANDEX_DISK_BASE_FOLDER', 'StroyKontrol')
     YANDEX_DISK_PEOPLE_REPORTS_FOLDER: str = os.getenv('YANDEX_DISK_PEOPLE_REPORTS_FOLDER', 'Фото отчеты (Люди)')
 
+    # Yandex Disk circuit breaker and bulkhead
+    YANDEX_BREAKER_FAILURE_RATE: float = float(os.getenv('YANDEX_BREAKER_FAILURE_RATE', '0.5'))
+    YANDEX_BREAKER_WINDOW: int = int(os.getenv('YANDEX_BREAKER_WINDOW', '20'))
+    YANDEX_BREAKER_MIN_CALLS: int = int(os.getenv('YANDEX_BREAKER_MIN_CALLS', '5'))
+    YANDEX_BREAKER_OPEN_SECONDS: float = float(os.getenv('YANDEX_BREAKER_OPEN_SECONDS', '30'))
+    YANDEX_BULKHEAD_SIZE: int = int(os.getenv('YANDEX_BULKHEAD_SIZE', '4'))
+    YANDEX_BULKHEAD_WAIT_SECONDS: float = float(os.getenv('YANDEX_BULKHEAD_WAIT_SECONDS', '2'))
+    YANDEX_RETRY_INTERVAL_SECONDS: float = float(os.getenv('YANDEX_RETRY_INTERVAL_SECONDS', '15'))
+
+    # Photo uploads via the API
+    PHOTO_UPLOAD_MAX_FILE_SIZE: int = int(os.getenv('PHOTO_UPLOAD_MAX_FILE_SIZE', str(20 * 1024 * 1024)))
+    PHOTO_UPLOAD_MAX_FILES: int = int(os.getenv('PHOTO_UPLOAD_MAX_FILES', '100'))
+    PHOTO_UPLOAD_MAX_REQUEST_SIZE: int = int(os.getenv('PHOTO_UPLOAD_MAX_REQUEST_SIZE', str(500 * 1024 * 1024)))
+    PHOTO_UPLOAD_PARALLELISM: int = int(os.getenv('PHOTO_UPLOAD_PARALLELISM', '4'))
+
+    # Cached catalog responses (works, materials, categories, foremen)
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+    RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+    # How often each process checks the database for writes by other processes
+    CHANGE_POLL_INTERVAL_SECONDS: float = float(os.getenv('CHANGE_POLL_INTERVAL_SECONDS', '1'))
+
     # Security
     SECRET_KEY: str = os.getenv('SECRET_KEY', 'change-me-in-production')
 
@@ -56,6 +90,25 @@ class Settings:
         except ValueError:
             return set()
 
+    @property
+    def bot_webhook_enabled(self) -> bool:
+        """Whether Telegram updates are delivered to the API via webhook."""
+        return bool(self.BOT_WEBHOOK_URL)
+
+    @property
+    def fsm_db_path(self) -> str:
+        """Path of the SQLite file holding bot FSM sessions."""
+        if self.BOT_FSM_DB_PATH:
+            return self.BOT_FSM_DB_PATH
+        return str(Path(self.DATABASE_PATH).with_name('bot_fsm.db'))
+
+    @property
+    def outbox_db_path(self) -> str:
+        """Path of the SQLite file holding the bot's queued report submissions."""
+        if self.BOT_OUTBOX_DB_PATH:
+            return self.BOT_OUTBOX_DB_PATH
+        return str(Path(self.DATABASE_PATH).with_name('bot_outbox.db'))
+
     @property
     def vat_multiplier(self) -> float:
         """Calculate VAT multiplier."""
@@ -30,6 +30,211 @@ async def get_db() -> AsyncGenerator[aiosqlite.Connection, None]:
         await db.close()
 
 
+PHOTO_COLUMNS = {
+    'photo_registry': [
+        ('thumbnail_url', 'TEXT'),
+        ('width', 'INTEGER'),
+        ('height', 'INTEGER'),
+    ],
+    'report_photos': [
+        ('disk_path', 'TEXT'),
+        ('public_url', 'TEXT'),
+        ('thumbnail_url', 'TEXT'),
+        ('size', 'INTEGER'),
+        ('width', 'INTEGER'),
+        ('height', 'INTEGER'),
+    ],
+}
+
+
+async def ensure_photo_tables(db):
+    """Create or upgrade the photo registry and report photo tables.
+
+    Shared by the API, the legacy api_server and the bot, which all open the
+    same database file.
+    """
+    # Content hash -> uploaded Yandex Disk file
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS photo_registry (
+            content_hash TEXT PRIMARY KEY,
+            disk_path TEXT NOT NULL,
+            public_url TEXT,
+            thumbnail_url TEXT,
+            size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            use_count INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL
+        )
+    ''')
+
+    # Photos attached to work reports; file details are copied from the
+    # registry so report listings read a single table
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS report_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            is_duplicate INTEGER NOT NULL DEFAULT 0,
+            disk_path TEXT,
+            public_url TEXT,
+            thumbnail_url TEXT,
+            size INTEGER,
+            width INTEGER,
+            height INTEGER,
+            created_at TEXT NOT NULL,
+            UNIQUE(report_id, content_hash),
+            FOREIGN KEY (report_id) REFERENCES work_reports(id) ON DELETE CASCADE,
+            FOREIGN KEY (content_hash) REFERENCES photo_registry(content_hash)
+        )
+    ''')
+
+    added = set()
+    for table, columns in PHOTO_COLUMNS.items():
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            existing = {row[1] for row in await cursor.fetchall()}
+        for name, column_type in columns:
+            if name not in existing:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                added.add((table, name))
+                logger.info(f"Added {name} column to {table} table")
+
+    if ('report_photos', 'disk_path') in added:
+        # Backfill links created before file details were stored per report
+        await db.execute('''
+            UPDATE report_photos SET
+                disk_path = (SELECT disk_path FROM photo_registry pr
+                             WHERE pr.content_hash = report_photos.content_hash),
+                public_url = (SELECT public_url FROM photo_registry pr
+                              WHERE pr.content_hash = report_photos.content_hash),
+                size = (SELECT size FROM photo_registry pr
+                        WHERE pr.content_hash = report_photos.content_hash)
+        ''')
+
+    # Photos of a page of reports are fetched in one query ordered by report
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_report_photos_report ON report_photos(report_id, id)"
+    )
+
+
+async def ensure_catalog_indexes(db):
+    """Create indexes used by the bot's work catalog and daily report queries.
+
+    ``foreman_sections`` is looked up by its primary key, categories by id
+    and works by exact category name among active works; the managers'
+    daily digest reads work reports by date.
+    """
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_works_category_active ON works(category, is_active)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_work_reports_date ON work_reports(report_date)"
+    )
+
+
+# Catalog tables indexed for full-text search: table -> indexed columns
+SEARCH_TABLES = {
+    'works': ('name', 'category'),
+    'materials': ('name', 'category'),
+}
+
+
+def _fold_yo(expression: str) -> str:
+    """SQL expression replacing ё with е, which unicode61 does not fold."""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+async def ensure_search_index(db):
+    """Create FTS5 indexes over works and materials, kept in sync by triggers.
+
+    The indexes are external-content tables, so they hold only the token
+    index. ``unicode61`` folds case for Cyrillic too and the triggers index
+    ``ё`` as ``е``; prefix indexes make ``кирп*`` lookups cheap. An index is
+    filled from its table when first created.
+    """
+    for table, columns in SEARCH_TABLES.items():
+        fts = f'{table}_fts'
+        column_list = ', '.join(columns)
+        new_values = ', '.join(_fold_yo(f'new.{column}') for column in columns)
+        old_values = ', '.join(_fold_yo(f'old.{column}') for column in columns)
+
+        async with db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+        ) as cursor:
+            exists = await cursor.fetchone() is not None
+
+        await db.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {column_list},
+                content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        await db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        await db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        await db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        if not exists:
+            # Not 'rebuild': that would index the raw text without folding ё
+            values = ', '.join(_fold_yo(column) for column in columns)
+            await db.execute(
+                f"INSERT INTO {fts}(rowid, {column_list}) SELECT id, {values} FROM {table}"
+            )
+            logger.info(f"Built full-text index {fts}")
+
+
+# Tables whose changes are counted in table_versions
+TRACKED_TABLES = (
+    'works', 'materials', 'categories', 'foremen', 'foreman_sections',
+    'work_materials', 'work_reports', 'material_history', 'report_photos',
+    'photo_registry',
+)
+
+
+async def ensure_change_tracking(db):
+    """Count changes to the tracked tables in ``table_versions``.
+
+    Triggers bump a table's version on every insert, update and delete,
+    whichever process writes, so caches in other processes can tell what
+    changed (see ``apps.services.change_watcher``). Tables that don't exist
+    yet are skipped; they get their triggers when the schema is created.
+    """
+    async with db.execute("SELECT name FROM sqlite_master WHERE type = 'table'") as cursor:
+        existing = {row[0] for row in await cursor.fetchall()}
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in TRACKED_TABLES:
+        if table not in existing:
+            continue
+        await db.execute(
+            "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)", (table,)
+        )
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+
 async def init_database():
     """Initialize all database tables."""
     async with get_db() as db:
@@ -153,6 +358,16 @@ async def init_database():
             )
         ''')
 
+        # Photo registry and photos attached to work reports
+        await ensure_photo_tables(db)
+        await ensure_catalog_indexes(db)
+
+        # Full-text search over works and materials
+        await ensure_search_index(db)
+
+        # Per-table change counters for cross-process cache invalidation
+        await ensure_change_tracking(db)
+
         await db.commit()
         logger.info("Database initialized successfully")
 
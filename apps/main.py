@@ -2,11 +2,13 @@
 Main FastAPI application entry point.
 Build-Report API Server - Modular Architecture
 """
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from apps.config import settings
@@ -18,7 +20,16 @@ from apps.routers import (
     reports_router,
     categories_router,
     auth_router,
+    search_router,
+    telegram_router,
 )
+from apps.routers import telegram as telegram_routes
+from apps.services.change_watcher import change_watcher
+from apps.services.conditional import ETagMiddleware
+from apps.services.metrics import metrics
+from apps.services.response_cache import response_cache
+from apps.services.telegram_webhook import TelegramWebhook
+from apps.services.yandex_disk import yandex_disk_service, yandex_retry_queue
 
 # Configure logging
 logging.basicConfig(
@@ -27,6 +38,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger('main')
 
+# Writes by other workers, the bot or the legacy server make cached responses stale
+change_watcher.subscribe(lambda tables: response_cache.bump(*tables))
+
+
+async def start_bot_webhook():
+    """Serve the Telegram bot from this process instead of a polling one."""
+    # The bot module validates BOT_TOKEN on import, so load it only when needed
+    from apps.bot import bot, dp, on_startup
+
+    await on_startup()
+    webhook = TelegramWebhook(
+        bot, dp,
+        secret_token=settings.BOT_WEBHOOK_SECRET,
+        max_concurrency=settings.BOT_WEBHOOK_MAX_CONCURRENCY,
+    )
+    await webhook.start(settings.BOT_WEBHOOK_URL.rstrip('/') + settings.BOT_WEBHOOK_PATH)
+    telegram_routes.webhook = webhook
+    logger.info("Telegram bot running in webhook mode")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -36,9 +66,22 @@ async def lifespan(app: FastAPI):
     await init_database()
     await upgrade_database()
     logger.info("Database initialized and upgraded")
+    retry_task = asyncio.create_task(
+        yandex_retry_queue.run(settings.YANDEX_RETRY_INTERVAL_SECONDS)
+    )
+    change_watcher.start(settings.CHANGE_POLL_INTERVAL_SECONDS)
+    if settings.bot_webhook_enabled:
+        await start_bot_webhook()
     yield
     # Shutdown
     logger.info("Shutting down Build-Report API Server...")
+    if telegram_routes.webhook is not None:
+        await telegram_routes.webhook.stop()
+        telegram_routes.webhook = None
+    retry_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await retry_task
+    await change_watcher.stop()
 
 
 # Create FastAPI application
@@ -49,6 +92,9 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# ETags chosen by the routes' conditional_get dependencies
+app.add_middleware(ETagMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -65,6 +111,8 @@ app.include_router(materials_router)
 app.include_router(foremen_router)
 app.include_router(reports_router)
 app.include_router(categories_router)
+app.include_router(search_router)
+app.include_router(telegram_router)
 
 
 @app.get("/")
@@ -79,8 +127,22 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint with Yandex Disk circuit breaker state."""
+    breaker = yandex_disk_service.breaker.snapshot()
+    return {
+        "status": "degraded" if breaker["state"] == "open" else "healthy",
+        "yandex_disk": {
+            **breaker,
+            "bulkhead": yandex_disk_service.bulkhead.snapshot(),
+            "deferred": yandex_retry_queue.snapshot(),
+        },
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics endpoint."""
+    return metrics.render()
 
 
 # For running with uvicorn directly
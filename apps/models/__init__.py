@@ -5,6 +5,7 @@ from apps.models.foreman import ForemanCreate, ForemanUpdate, ForemanResponse
 from apps.models.report import ReportCreate, ReportUpdate, ReportResponse
 from apps.models.category import CategoryCreate, CategoryUpdate, CategoryResponse
 from apps.models.auth import LoginRequest, LoginResponse, UserResponse
+from apps.models.search import SearchResult
 
 __all__ = [
     'WorkCreate', 'WorkUpdate', 'WorkResponse', 'WorkAddBalance',
@@ -13,4 +14,5 @@ __all__ = [
     'ReportCreate', 'ReportUpdate', 'ReportResponse',
     'CategoryCreate', 'CategoryUpdate', 'CategoryResponse',
     'LoginRequest', 'LoginResponse', 'UserResponse',
+    'SearchResult',
 ]
@@ -66,3 +66,26 @@ class AccumulativeStatementEntry(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class PhotoUploadFileResult(BaseModel):
+    """Outcome of one file in a multipart photo upload."""
+    index: int = Field(..., description="Position of the file in the request")
+    filename: Optional[str] = Field(None, description="Client file name")
+    status: str = Field(..., description="uploaded, duplicate, rejected or failed")
+    size: int = Field(default=0, description="Size in bytes")
+    content_hash: Optional[str] = Field(None, description="SHA-256 of the content")
+    public_url: Optional[str] = Field(None, description="Public Yandex Disk URL")
+    error: Optional[str] = Field(None, description="Reason for rejected or failed files")
+
+
+class PhotoUploadResponse(BaseModel):
+    """Summary of a multipart photo upload to a report."""
+    report_id: int
+    folder_url: Optional[str] = None
+    received: int = Field(..., description="Files received")
+    uploaded: int = Field(..., description="Files uploaded to Yandex Disk")
+    duplicates: int = Field(..., description="Files already stored, linked without uploading")
+    failed: int = Field(..., description="Files rejected or failed to upload")
+    total_bytes: int = Field(..., description="Bytes of file content received")
+    files: List[PhotoUploadFileResult]
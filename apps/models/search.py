@@ -0,0 +1,14 @@
+"""Pydantic models for catalog search."""
+from pydantic import BaseModel, Field
+
+
+class SearchResult(BaseModel):
+    """A work or material matching a search query."""
+    type: str = Field(..., description="Entity type: work or material")
+    id: int = Field(..., description="Work or material ID")
+    name: str = Field(..., description="Name")
+    category: str = Field(..., description="Category")
+    unit: str = Field(..., description="Unit of measurement")
+    is_active: bool = Field(True, description="Whether the item is active")
+    quantity: float = Field(0, description="Work balance or material stock")
+    rank: float = Field(..., description="BM25 relevance, lower is better")
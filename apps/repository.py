@@ -0,0 +1,149 @@
+"""
+Data access shared by the API routers, the legacy api_server and the bot.
+
+All three open the same SQLite file and used to carry their own copies of
+these queries. Functions take an open connection, so callers keep control of
+transactions; they work with both plain tuple rows and ``aiosqlite.Row``.
+SQL text is kept in module constants: sqlite3 caches prepared statements by
+text per connection, so every caller reuses the same compiled statement.
+Each query is counted and timed in the metrics registry by name.
+"""
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterable, List, Optional, TypedDict
+
+from apps.services.metrics import metrics
+
+metrics.describe('db_queries_total', 'counter', 'Repository queries by name')
+metrics.describe('db_query_seconds_total', 'counter', 'Time spent in repository queries by name')
+
+
+class MaterialRequirement(TypedDict):
+    """Material consumed per unit of a work, with the stock on hand."""
+    material_id: int
+    quantity_per_unit: float
+    material_name: str
+    unit: Optional[str]
+    category: Optional[str]
+    available_quantity: float
+
+
+# work_materials is read through its UNIQUE(work_id, material_id) index
+WORK_MATERIALS_SQL = '''
+    SELECT wm.material_id, wm.quantity_per_unit, m.name, m.unit, m.category, m.quantity
+    FROM work_materials wm
+    JOIN materials m ON wm.material_id = m.id
+    WHERE wm.work_id = ?
+    ORDER BY wm.id
+'''
+FOREMAN_NAME_SQL = "SELECT first_name, last_name FROM foremen WHERE id = ?"
+MATERIAL_QUANTITY_SQL = "SELECT quantity FROM materials WHERE id = ?"
+MOVE_MATERIAL_SQL = "UPDATE materials SET quantity = quantity + ? WHERE id = ?"
+INSERT_MATERIAL_HISTORY_SQL = '''
+    INSERT INTO material_history
+    (material_id, change_type, change_amount, resulting_quantity, performed_by, description, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+@asynccontextmanager
+async def _timed(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.inc('db_queries_total', query=name)
+        metrics.inc('db_query_seconds_total', time.perf_counter() - started, query=name)
+
+
+def _material_requirement(row) -> MaterialRequirement:
+    return {
+        'material_id': row[0],
+        'quantity_per_unit': row[1] or 0,
+        'material_name': row[2],
+        'unit': row[3],
+        'category': row[4],
+        'available_quantity': row[5] or 0,
+    }
+
+
+async def fetch_work_materials_requirements(db, work_id: int) -> List[MaterialRequirement]:
+    """Materials and consumption norms of a work."""
+    async with _timed('work_materials'):
+        async with db.execute(WORK_MATERIALS_SQL, (work_id,)) as cursor:
+            return [_material_requirement(row) for row in await cursor.fetchall()]
+
+
+async def get_foreman_display_name(db, foreman_id: Optional[int]) -> str:
+    """Foreman name as written to the material history."""
+    if foreman_id is None:
+        return 'Неизвестный бригадир'
+    async with _timed('foreman_name'):
+        async with db.execute(FOREMAN_NAME_SQL, (foreman_id,)) as cursor:
+            row = await cursor.fetchone()
+    if row:
+        parts = [part for part in (row[0], row[1]) if part]
+        if parts:
+            return f"Бригадир {' '.join(parts)}"
+    return f"Бригадир ID {foreman_id}"
+
+
+async def log_material_history_entry(
+    db,
+    material_id: int,
+    change_amount: float,
+    change_type: str,
+    performed_by: Optional[str] = None,
+    description: Optional[str] = None,
+) -> int:
+    """Record a stock movement with the material's resulting quantity; returns the entry id."""
+    async with _timed('material_history_insert'):
+        async with db.execute(MATERIAL_QUANTITY_SQL, (material_id,)) as cursor:
+            row = await cursor.fetchone()
+        cursor = await db.execute(INSERT_MATERIAL_HISTORY_SQL, (
+            material_id,
+            change_type,
+            change_amount,
+            row[0] if row is not None else None,
+            (performed_by or 'Неизвестно').strip() or 'Неизвестно',
+            (description or '').strip(),
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        ))
+    return cursor.lastrowid
+
+
+def find_material_shortage(requirements: Iterable[MaterialRequirement],
+                           quantity: float) -> Optional[MaterialRequirement]:
+    """First material without enough stock for ``quantity`` units of the work."""
+    for requirement in requirements:
+        required = requirement['quantity_per_unit'] * quantity
+        if required > 0 and requirement['available_quantity'] < required:
+            return requirement
+    return None
+
+
+async def _move_materials(db, requirements: Iterable[MaterialRequirement], quantity: float,
+                          sign: int, change_type: str, performed_by: Optional[str],
+                          description: Optional[str]):
+    for requirement in requirements:
+        amount = requirement['quantity_per_unit'] * quantity
+        if amount <= 0:
+            continue
+        async with _timed('material_move'):
+            await db.execute(MOVE_MATERIAL_SQL, (sign * amount, requirement['material_id']))
+        await log_material_history_entry(
+            db, requirement['material_id'], sign * amount, change_type, performed_by, description
+        )
+
+
+async def write_off_materials(db, requirements: Iterable[MaterialRequirement], quantity: float,
+                              performed_by: Optional[str], description: Optional[str]):
+    """Take the materials for ``quantity`` units of a work off the stock and log it."""
+    await _move_materials(db, requirements, quantity, -1, 'Списание', performed_by, description)
+
+
+async def restore_materials(db, requirements: Iterable[MaterialRequirement], quantity: float,
+                            performed_by: Optional[str], description: Optional[str]):
+    """Return the materials of ``quantity`` units of a work to the stock and log it."""
+    await _move_materials(db, requirements, quantity, 1, 'Возврат', performed_by, description)
@@ -5,6 +5,8 @@ from apps.routers.foremen import router as foremen_router
 from apps.routers.reports import router as reports_router
 from apps.routers.categories import router as categories_router
 from apps.routers.auth import router as auth_router
+from apps.routers.search import router as search_router
+from apps.routers.telegram import router as telegram_router
 
 __all__ = [
     'works_router',
@@ -13,4 +15,6 @@ __all__ = [
     'reports_router',
     'categories_router',
     'auth_router',
+    'search_router',
+    'telegram_router',
 ]
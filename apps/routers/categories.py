@@ -7,14 +7,14 @@ from fastapi import APIRouter, HTTPException
 
 from apps.database import get_db
 from apps.models.category import CategoryCreate, CategoryUpdate, CategoryResponse
+from apps.services.conditional import conditional_get
+from apps.services.response_cache import response_cache
 
 logger = logging.getLogger('categories_router')
 router = APIRouter(prefix="/api/categories", tags=["categories"])
 
 
-@router.get("", response_model=List[CategoryResponse])
-async def get_categories():
-    """Get all categories."""
+async def _fetch_categories() -> List[CategoryResponse]:
     async with get_db() as db:
         async with db.execute(
             "SELECT id, name, created_date FROM categories ORDER BY name"
@@ -30,7 +30,14 @@ async def get_categories():
             ]
 
 
-@router.get("/{category_id}", response_model=CategoryResponse)
+@router.get("", response_model=List[CategoryResponse], dependencies=[conditional_get('categories')])
+async def get_categories():
+    """Get all categories."""
+    return await response_cache.respond(('categories',), ('categories',), _fetch_categories)
+
+
+@router.get("/{category_id}", response_model=CategoryResponse,
+            dependencies=[conditional_get('categories')])
 async def get_category(category_id: int):
     """Get a specific category by ID."""
     async with get_db() as db:
@@ -58,6 +65,7 @@ async def create_category(category: CategoryCreate):
                 (category.name.strip(), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
             )
             await db.commit()
+            response_cache.bump('categories')
             category_id = cursor.lastrowid
             logger.info(f"Created category: {category.name} (ID: {category_id})")
             return await get_category(category_id)
@@ -104,6 +112,7 @@ async def update_category(category_id: int, category: CategoryUpdate):
             )
 
             await db.commit()
+            response_cache.bump('categories', 'works', 'materials', 'foreman_sections')
             logger.info(f"Updated category ID {category_id}: '{current_name}' -> '{new_name}'")
             return await get_category(category_id)
         except Exception as e:
@@ -133,6 +142,7 @@ async def delete_category(category_id: int):
 
         cursor = await db.execute("DELETE FROM categories WHERE id = ?", (category_id,))
         await db.commit()
+        response_cache.bump('categories', 'foreman_sections')
 
         if cursor.rowcount == 0:
             raise HTTPException(404, "Category not found")
@@ -10,6 +10,8 @@ from apps.models.foreman import (
     ForemanCreate, ForemanUpdate, ForemanResponse,
     ForemanSectionUpdate, ForemanSectionResponse
 )
+from apps.services.conditional import conditional_get
+from apps.services.response_cache import response_cache
 
 logger = logging.getLogger('foremen_router')
 router = APIRouter(prefix="/api/foremen", tags=["foremen"])
@@ -29,9 +31,7 @@ def _foreman_row_to_response(row) -> dict:
     }
 
 
-@router.get("", response_model=List[dict])
-async def get_foremen():
-    """Get all foremen."""
+async def _fetch_foremen() -> List[dict]:
     async with get_db() as db:
         async with db.execute("""
             SELECT id, first_name, last_name, username, registration_date, is_active
@@ -42,7 +42,13 @@ async def get_foremen():
             return [_foreman_row_to_response(row) for row in rows]
 
 
-@router.get("/{foreman_id}", response_model=dict)
+@router.get("", response_model=List[dict], dependencies=[conditional_get('foremen')])
+async def get_foremen():
+    """Get all foremen."""
+    return await response_cache.respond(('foremen',), ('foremen',), _fetch_foremen)
+
+
+@router.get("/{foreman_id}", response_model=dict, dependencies=[conditional_get('foremen')])
 async def get_foreman(foreman_id: int):
     """Get a specific foreman by ID."""
     async with get_db() as db:
@@ -66,6 +72,7 @@ async def create_foreman(foreman: ForemanCreate):
         """, (foreman.full_name, foreman.position, foreman.username or '',
               datetime.now().strftime('%Y-%m-%d %H:%M:%S'), int(foreman.is_active)))
         await db.commit()
+        response_cache.bump('foremen')
 
         foreman_id = cursor.lastrowid
         logger.info(f"Created foreman: {foreman.full_name} (ID: {foreman_id})")
@@ -109,6 +116,7 @@ async def update_foreman(foreman_id: int, foreman: ForemanUpdate):
 
         await db.execute(query, values)
         await db.commit()
+        response_cache.bump('foremen')
         logger.info(f"Updated foreman ID: {foreman_id}")
         return await get_foreman(foreman_id)
 
@@ -134,6 +142,7 @@ async def delete_foreman(foreman_id: int):
 
         cursor = await db.execute("DELETE FROM foremen WHERE id = ?", (foreman_id,))
         await db.commit()
+        response_cache.bump('foremen', 'foreman_sections')
 
         if cursor.rowcount == 0:
             raise HTTPException(404, "Foreman not found")
@@ -142,9 +151,7 @@ async def delete_foreman(foreman_id: int):
         return {"message": "Foreman deleted successfully"}
 
 
-@router.get("/{foreman_id}/sections", response_model=List[ForemanSectionResponse])
-async def get_foreman_sections(foreman_id: int):
-    """Get sections assigned to a foreman."""
+async def _fetch_foreman_sections(foreman_id: int) -> List[ForemanSectionResponse]:
     async with get_db() as db:
         # Check if foreman exists
         async with db.execute("SELECT id FROM foremen WHERE id = ?", (foreman_id,)) as cursor:
@@ -165,6 +172,16 @@ async def get_foreman_sections(foreman_id: int):
             ]
 
 
+@router.get("/{foreman_id}/sections", response_model=List[ForemanSectionResponse],
+            dependencies=[conditional_get('foremen', 'foreman_sections', 'categories')])
+async def get_foreman_sections(foreman_id: int):
+    """Get sections assigned to a foreman."""
+    return await response_cache.respond(
+        ('foreman_sections', foreman_id), ('foremen', 'foreman_sections', 'categories'),
+        lambda: _fetch_foreman_sections(foreman_id)
+    )
+
+
 @router.put("/{foreman_id}/sections", response_model=List[ForemanSectionResponse])
 async def update_foreman_sections(foreman_id: int, data: ForemanSectionUpdate):
     """Update sections assigned to a foreman."""
@@ -199,5 +216,6 @@ async def update_foreman_sections(foreman_id: int, data: ForemanSectionUpdate):
             )
 
         await db.commit()
+        response_cache.bump('foreman_sections')
         logger.info(f"Updated sections for foreman {foreman_id}")
         return await get_foreman_sections(foreman_id)
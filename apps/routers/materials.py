@@ -10,6 +10,9 @@ from openpyxl import Workbook, load_workbook
 
 from apps.database import get_db
 from apps.config import settings
+from apps.repository import log_material_history_entry
+from apps.services.conditional import conditional_get
+from apps.services.response_cache import response_cache
 from apps.models.material import (
     MaterialCreate, MaterialUpdate, MaterialResponse,
     MaterialAddQuantity, MaterialPricingUpdate, MaterialHistoryEntry
@@ -40,31 +43,7 @@ def _material_row_to_response(row) -> dict:
     }
 
 
-async def _log_material_history(db, material_id: int, change_amount: float,
-                                 change_type: str, performed_by: Optional[str] = None,
-                                 description: Optional[str] = None):
-    """Log a material history entry."""
-    async with db.execute(
-        "SELECT quantity FROM materials WHERE id = ?", (material_id,)
-    ) as cursor:
-        row = await cursor.fetchone()
-        resulting_quantity = row['quantity'] if row else None
-
-    await db.execute("""
-        INSERT INTO material_history
-        (material_id, change_type, change_amount, resulting_quantity, performed_by, description, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
-        material_id, change_type, change_amount, resulting_quantity,
-        (performed_by or 'Неизвестно').strip() or 'Неизвестно',
-        (description or '').strip(),
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    ))
-
-
-@router.get("", response_model=List[dict])
-async def get_materials(active_only: bool = True):
-    """Get all materials."""
+async def _fetch_materials(active_only: bool) -> List[dict]:
     async with get_db() as db:
         query = """
             SELECT id, name, category, unit, quantity, is_active,
@@ -80,7 +59,16 @@ async def get_materials(active_only: bool = True):
             return [_material_row_to_response(row) for row in rows]
 
 
-@router.get("/history", response_model=List[MaterialHistoryEntry])
+@router.get("", response_model=List[dict], dependencies=[conditional_get('materials')])
+async def get_materials(active_only: bool = True):
+    """Get all materials."""
+    return await response_cache.respond(
+        ('materials', active_only), ('materials',), lambda: _fetch_materials(active_only)
+    )
+
+
+@router.get("/history", response_model=List[MaterialHistoryEntry],
+            dependencies=[conditional_get('material_history', 'materials')])
 async def get_material_history(limit: int = 500):
     """Get material history."""
     async with get_db() as db:
@@ -214,11 +202,12 @@ async def import_materials(file: UploadFile = File(...)):
                 errors.append(f"Row {idx}: {str(e)}")
 
         await db.commit()
+        response_cache.bump('materials', 'categories')
 
     return {"imported": imported, "errors": errors}
 
 
-@router.get("/{material_id}", response_model=dict)
+@router.get("/{material_id}", response_model=dict, dependencies=[conditional_get('materials')])
 async def get_material(material_id: int):
     """Get a specific material by ID."""
     async with get_db() as db:
@@ -252,12 +241,13 @@ async def create_material(material: MaterialCreate):
               int(material.is_active), material.unit_cost_without_vat,
               material.total_cost_without_vat, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         await db.commit()
+        response_cache.bump('materials', 'categories')
 
         material_id = cursor.lastrowid
         logger.info(f"Created material: {material.name} (ID: {material_id})")
 
         # Log history
-        await _log_material_history(
+        await log_material_history_entry(
             db, material_id, material.quantity,
             'Создание', 'Система', f'Создание материала {material.name}'
         )
@@ -312,6 +302,7 @@ async def update_material(material_id: int, material: MaterialUpdate):
 
         await db.execute(query, values)
         await db.commit()
+        response_cache.bump('materials', 'categories')
         logger.info(f"Updated material ID: {material_id}")
         return await get_material(material_id)
 
@@ -333,17 +324,19 @@ async def add_quantity(material_id: int, data: MaterialAddQuantity):
             (new_quantity, material_id)
         )
 
-        await _log_material_history(
+        await log_material_history_entry(
             db, material_id, data.amount, 'Приход',
             data.performed_by, data.description
         )
         await db.commit()
+        response_cache.bump('materials')
 
         logger.info(f"Added {data.amount} to material {material_id}. New quantity: {new_quantity}")
         return await get_material(material_id)
 
 
-@router.get("/{material_id}/pricing", response_model=dict)
+@router.get("/{material_id}/pricing", response_model=dict,
+            dependencies=[conditional_get('materials')])
 async def get_material_pricing(material_id: int):
     """Get material pricing info."""
     async with get_db() as db:
@@ -386,6 +379,7 @@ async def update_material_pricing(material_id: int, data: MaterialPricingUpdate)
             WHERE id = ?
         """, (data.unit_cost_without_vat, total_cost, material_id))
         await db.commit()
+        response_cache.bump('materials')
 
         logger.info(f"Updated pricing for material {material_id}")
         return await get_material_pricing(material_id)
@@ -402,6 +396,7 @@ async def delete_material(material_id: int):
 
         cursor = await db.execute("DELETE FROM materials WHERE id = ?", (material_id,))
         await db.commit()
+        response_cache.bump('materials')
 
         if cursor.rowcount == 0:
             raise HTTPException(404, "Material not found")
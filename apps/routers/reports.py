@@ -1,26 +1,36 @@
 """API Router for Work Reports."""
+import asyncio
 import logging
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 
 from apps.database import get_db
 from apps.config import settings
 from apps.models.report import (
     ReportCreate, ReportUpdate, ReportResponse,
-    ReportVerify, DailyReportSummary, AccumulativeStatementEntry
+    ReportVerify, DailyReportSummary, AccumulativeStatementEntry, PhotoUploadResponse
 )
+from apps.services.conditional import conditional_get
 from apps.services.yandex_disk import yandex_disk_service
+from apps.services.photo_registry import photo_registry
+from apps.services.photo_upload import (
+    MultipartPhotoReader, ReportPhotoUploader, UploadRequestError, UploadTooLargeError
+)
 
 logger = logging.getLogger('reports_router')
 router = APIRouter(prefix="/api", tags=["reports"])
 
 VAT_MULTIPLIER = 1 + settings.VAT_RATE
 
+# Tables report listings are read from
+REPORT_TABLES = ('work_reports', 'works', 'foremen', 'report_photos', 'photo_registry')
+
 
 def _report_row_to_response(row) -> dict:
     """Convert database row to response dict."""
+    row = dict(row)
     return {
         'id': row['id'],
         'foreman_id': row['foreman_id'],
@@ -38,7 +48,8 @@ def _report_row_to_response(row) -> dict:
     }
 
 
-@router.get("/reports/{date}", response_model=List[DailyReportSummary])
+@router.get("/reports/{date}", response_model=List[DailyReportSummary],
+            dependencies=[conditional_get('work_reports', 'works', 'foremen')])
 async def get_reports_for_date(date: str):
     """Get all reports for a specific date."""
     async with get_db() as db:
@@ -72,16 +83,21 @@ async def get_reports_for_date(date: str):
         return list(grouped.values())
 
 
-@router.get("/all-reports", response_model=List[dict])
+@router.get("/all-reports", response_model=List[dict],
+            dependencies=[conditional_get(*REPORT_TABLES)])
 async def get_all_reports(
     foreman_id: Optional[int] = Query(None),
     work_id: Optional[int] = Query(None),
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None),
     verified_only: bool = Query(False),
-    limit: int = Query(500, le=1000)
+    limit: int = Query(500, le=1000),
+    include_photos: bool = Query(True),
 ):
-    """Get all reports with optional filters."""
+    """Get all reports with optional filters.
+
+    Attached photos are loaded for the whole page in a single query.
+    """
     async with get_db() as db:
         query = """
             SELECT wr.id, wr.foreman_id, wr.work_id, wr.quantity,
@@ -115,16 +131,27 @@ async def get_all_reports(
 
         async with db.execute(query, params) as cursor:
             rows = await cursor.fetchall()
-            return [_report_row_to_response(row) for row in rows]
+        reports = [_report_row_to_response(row) for row in rows]
+
+        if include_photos:
+            photos = await photo_registry.get_photos_for_reports(db, [r['id'] for r in reports])
+            for report in reports:
+                report['photos'] = photos.get(report['id'], [])
+        return reports
 
 
-@router.get("/work-reports", response_model=List[dict])
-async def get_work_reports(limit: int = Query(500, le=1000)):
+@router.get("/work-reports", response_model=List[dict],
+            dependencies=[conditional_get(*REPORT_TABLES)])
+async def get_work_reports(limit: int = Query(500, le=1000), include_photos: bool = Query(True)):
     """Get all work reports."""
-    return await get_all_reports(limit=limit)
+    return await get_all_reports(
+        foreman_id=None, work_id=None, date_from=None, date_to=None,
+        verified_only=False, limit=limit, include_photos=include_photos
+    )
 
 
-@router.get("/report/{report_id}", response_model=dict)
+@router.get("/report/{report_id}", response_model=dict,
+            dependencies=[conditional_get(*REPORT_TABLES)])
 async def get_report(report_id: int):
     """Get a specific report by ID."""
     async with get_db() as db:
@@ -139,9 +166,101 @@ async def get_report(report_id: int):
             WHERE wr.id = ?
         """, (report_id,)) as cursor:
             row = await cursor.fetchone()
-            if not row:
+        if not row:
+            raise HTTPException(404, "Report not found")
+        report = _report_row_to_response(row)
+        report['photos'] = await photo_registry.get_report_photos(db, report_id)
+        return report
+
+
+@router.get("/report/{report_id}/photos", response_model=List[dict],
+            dependencies=[conditional_get('work_reports', 'report_photos', 'photo_registry')])
+async def get_report_photos(report_id: int):
+    """Get photos linked to a report, including deduplicated ones."""
+    async with get_db() as db:
+        async with db.execute("SELECT id FROM work_reports WHERE id = ?", (report_id,)) as cursor:
+            if not await cursor.fetchone():
                 raise HTTPException(404, "Report not found")
-            return _report_row_to_response(row)
+        return await photo_registry.get_report_photos(db, report_id)
+
+
+@router.post("/report/{report_id}/photos", response_model=PhotoUploadResponse)
+async def upload_report_photos(report_id: int, request: Request):
+    """Upload photos to a report as multipart/form-data.
+
+    Files are streamed to Yandex Disk while the request is still being
+    received; each file gets its own status in the response so clients can
+    show per-file progress and retry only the failed ones.
+    """
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and \
+            int(content_length) > settings.PHOTO_UPLOAD_MAX_REQUEST_SIZE:
+        raise HTTPException(413, f"Request exceeds {settings.PHOTO_UPLOAD_MAX_REQUEST_SIZE} bytes")
+
+    async with get_db() as db:
+        async with db.execute("""
+            SELECT wr.foreman_id, wr.report_date, wr.photo_report_url, f.first_name
+            FROM work_reports wr
+            JOIN foremen f ON wr.foreman_id = f.id
+            WHERE wr.id = ?
+        """, (report_id,)) as cursor:
+            report = await cursor.fetchone()
+    if not report:
+        raise HTTPException(404, "Report not found")
+
+    try:
+        reader = MultipartPhotoReader(
+            request.headers.get('content-type', ''),
+            max_file_size=settings.PHOTO_UPLOAD_MAX_FILE_SIZE,
+            max_files=settings.PHOTO_UPLOAD_MAX_FILES,
+        )
+    except UploadRequestError as exc:
+        raise HTTPException(400, str(exc))
+
+    if not yandex_disk_service.is_available():
+        raise HTTPException(503, "Yandex Disk is temporarily unavailable")
+    folder_url = await asyncio.to_thread(
+        yandex_disk_service.ensure_report_folder,
+        report['first_name'], report['foreman_id'], report['report_date']
+    )
+    if not folder_url:
+        raise HTTPException(503, "Could not prepare the report folder on Yandex Disk")
+    folder_path = yandex_disk_service.report_folder_path(
+        report['first_name'], report['foreman_id'], report['report_date']
+    )
+
+    uploader = ReportPhotoUploader(report_id, folder_path, settings.PHOTO_UPLOAD_PARALLELISM)
+    try:
+        files = await uploader.process(
+            request.stream(), reader, settings.PHOTO_UPLOAD_MAX_REQUEST_SIZE
+        )
+    except UploadTooLargeError as exc:
+        raise HTTPException(413, str(exc))
+    except UploadRequestError as exc:
+        raise HTTPException(400, str(exc))
+    if not files:
+        raise HTTPException(400, "No files in request")
+
+    await photo_registry.link_many(report_id, uploader.stored)
+    if uploader.stored and not report['photo_report_url']:
+        async with get_db() as db:
+            await db.execute(
+                "UPDATE work_reports SET photo_report_url = ? WHERE id = ?",
+                (folder_url, report_id)
+            )
+            await db.commit()
+
+    statuses = [f['status'] for f in files]
+    return {
+        'report_id': report_id,
+        'folder_url': folder_url,
+        'received': len(files),
+        'uploaded': statuses.count('uploaded'),
+        'duplicates': statuses.count('duplicate'),
+        'failed': statuses.count('rejected') + statuses.count('failed'),
+        'total_bytes': sum(f['size'] for f in files),
+        'files': files,
+    }
 
 
 @router.post("/work-reports", response_model=dict)
@@ -228,6 +347,9 @@ async def verify_report(report_id: int, data: ReportVerify):
 async def delete_report(report_id: int):
     """Delete a report."""
     async with get_db() as db:
+        # Delete photo links first
+        await db.execute("DELETE FROM report_photos WHERE report_id = ?", (report_id,))
+
         cursor = await db.execute("DELETE FROM work_reports WHERE id = ?", (report_id,))
         await db.commit()
 
@@ -238,7 +360,8 @@ async def delete_report(report_id: int):
         return {"message": "Report deleted successfully"}
 
 
-@router.get("/accumulative-statement", response_model=List[dict])
+@router.get("/accumulative-statement", response_model=List[dict],
+            dependencies=[conditional_get('work_reports', 'works')])
 async def get_accumulative_statement(foreman_id: Optional[int] = Query(None)):
     """Get accumulative statement of verified works."""
     async with get_db() as db:
@@ -0,0 +1,25 @@
+"""API Router for catalog search."""
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Query
+
+from apps.database import get_db
+from apps.models.search import SearchResult
+from apps.services.conditional import conditional_get
+from apps.services.search import search_catalog
+
+logger = logging.getLogger('search_router')
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+@router.get("", response_model=List[SearchResult],
+            dependencies=[conditional_get('works', 'materials')])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Search text"),
+    type: Optional[str] = Query(None, pattern="^(works|materials)$", description="Limit to one catalog"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Full-text search over works and materials, best matches first."""
+    async with get_db() as db:
+        return await search_catalog(db, q, type, limit)
@@ -0,0 +1,31 @@
+"""API Router for Telegram webhook updates."""
+import json
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from apps.config import settings
+from apps.services.telegram_webhook import SECRET_HEADER, TelegramWebhook
+
+logger = logging.getLogger('telegram_router')
+router = APIRouter(tags=["telegram"])
+
+# Set on startup when the bot runs in webhook mode (BOT_WEBHOOK_URL)
+webhook: Optional[TelegramWebhook] = None
+
+
+@router.post(settings.BOT_WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request):
+    """Receive an update from Telegram and process it in the background."""
+    if webhook is None:
+        raise HTTPException(status_code=404, detail="Webhook mode is disabled")
+    if not webhook.verify_secret(request.headers.get(SECRET_HEADER)):
+        logger.warning("Rejected Telegram update with a wrong secret token")
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        update = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid update")
+    await webhook.feed(update)
+    return {"ok": True}
@@ -10,6 +10,9 @@ from openpyxl import Workbook, load_workbook
 
 from apps.database import get_db
 from apps.config import settings
+from apps.repository import fetch_work_materials_requirements
+from apps.services.conditional import conditional_get
+from apps.services.response_cache import response_cache
 from apps.models.work import (
     WorkCreate, WorkUpdate, WorkResponse, WorkAddBalance,
     WorkMaterialsUpdate, WorkMaterialLink
@@ -40,9 +43,7 @@ def _work_row_to_response(row) -> dict:
     }
 
 
-@router.get("", response_model=List[dict])
-async def get_works(active_only: bool = True):
-    """Get all works (optionally only active ones)."""
+async def _fetch_works(active_only: bool) -> List[dict]:
     async with get_db() as db:
         query = """
             SELECT id, name, category, unit, balance, project_total, is_active,
@@ -58,7 +59,15 @@ async def get_works(active_only: bool = True):
             return [_work_row_to_response(row) for row in rows]
 
 
-@router.get("/all", response_model=List[dict])
+@router.get("", response_model=List[dict], dependencies=[conditional_get('works')])
+async def get_works(active_only: bool = True):
+    """Get all works (optionally only active ones)."""
+    return await response_cache.respond(
+        ('works', active_only), ('works',), lambda: _fetch_works(active_only)
+    )
+
+
+@router.get("/all", response_model=List[dict], dependencies=[conditional_get('works')])
 async def get_all_works():
     """Get all works including inactive."""
     return await get_works(active_only=False)
@@ -154,11 +163,12 @@ async def import_works(file: UploadFile = File(...)):
                 errors.append(f"Row {idx}: {str(e)}")
 
         await db.commit()
+        response_cache.bump('works', 'categories')
 
     return {"imported": imported, "errors": errors}
 
 
-@router.get("/{work_id}", response_model=dict)
+@router.get("/{work_id}", response_model=dict, dependencies=[conditional_get('works')])
 async def get_work(work_id: int):
     """Get a specific work by ID."""
     async with get_db() as db:
@@ -192,6 +202,7 @@ async def create_work(work: WorkCreate):
             """, (work.name, work.category, work.unit, work.balance, work.project_total,
                   int(work.is_active), work.unit_cost_without_vat, work.total_cost_without_vat))
             await db.commit()
+            response_cache.bump('works', 'categories')
             work_id = cursor.lastrowid
             logger.info(f"Created work: {work.name} (ID: {work_id})")
             return await get_work(work_id)
@@ -252,6 +263,7 @@ async def update_work(work_id: int, work: WorkUpdate):
         try:
             await db.execute(query, values)
             await db.commit()
+            response_cache.bump('works', 'categories')
             logger.info(f"Updated work ID: {work_id}")
             return await get_work(work_id)
         except Exception as e:
@@ -272,6 +284,7 @@ async def add_balance(work_id: int, data: WorkAddBalance):
         new_balance = (row['balance'] or 0) + data.amount
         await db.execute("UPDATE works SET balance = ? WHERE id = ?", (new_balance, work_id))
         await db.commit()
+        response_cache.bump('works')
         logger.info(f"Added {data.amount} to work {work_id} balance. New balance: {new_balance}")
         return await get_work(work_id)
 
@@ -285,6 +298,7 @@ async def delete_work(work_id: int):
 
         cursor = await db.execute("DELETE FROM works WHERE id = ?", (work_id,))
         await db.commit()
+        response_cache.bump('works')
 
         if cursor.rowcount == 0:
             raise HTTPException(404, "Work not found")
@@ -293,7 +307,8 @@ async def delete_work(work_id: int):
         return {"message": "Work deleted successfully"}
 
 
-@router.get("/{work_id}/materials", response_model=List[dict])
+@router.get("/{work_id}/materials", response_model=List[dict],
+            dependencies=[conditional_get('works', 'work_materials', 'materials')])
 async def get_work_materials(work_id: int):
     """Get materials linked to a work."""
     async with get_db() as db:
@@ -302,20 +317,13 @@ async def get_work_materials(work_id: int):
             if not await cursor.fetchone():
                 raise HTTPException(404, "Work not found")
 
-        async with db.execute("""
-            SELECT wm.material_id, wm.quantity_per_unit, m.name, m.unit, m.quantity
-            FROM work_materials wm
-            JOIN materials m ON wm.material_id = m.id
-            WHERE wm.work_id = ?
-        """, (work_id,)) as cursor:
-            rows = await cursor.fetchall()
-            return [{
-                'material_id': row['material_id'],
-                'quantity_per_unit': row['quantity_per_unit'],
-                'material_name': row['name'],
-                'material_unit': row['unit'],
-                'available_quantity': row['quantity']
-            } for row in rows]
+        return [{
+            'material_id': requirement['material_id'],
+            'quantity_per_unit': requirement['quantity_per_unit'],
+            'material_name': requirement['material_name'],
+            'material_unit': requirement['unit'],
+            'available_quantity': requirement['available_quantity']
+        } for requirement in await fetch_work_materials_requirements(db, work_id)]
 
 
 @router.put("/{work_id}/materials")
@@ -1,4 +1,5 @@
 """Business logic services for Build-Report application."""
 from apps.services.yandex_disk import YandexDiskService
+from apps.services.photo_registry import PhotoRegistry
 
-__all__ = ['YandexDiskService']
+__all__ = ['YandexDiskService', 'PhotoRegistry']
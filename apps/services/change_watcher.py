@@ -0,0 +1,140 @@
+"""Detects writes to the shared database made by any process.
+
+The API workers, the polling bot and the legacy api_server all write the
+same SQLite file, so an in-process cache only sees its own writes. Triggers
+created by ``ensure_change_tracking`` count the changes to every tracked
+table in ``table_versions``. ``ChangeWatcher`` keeps one connection open
+and polls ``PRAGMA data_version``, which changes whenever another
+connection commits; only then does it read the version table and pass the
+names of the tables that changed to its subscribers. Caches therefore go
+stale for at most one poll interval, whoever wrote.
+"""
+import asyncio
+import inspect
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiosqlite
+
+from apps.config import settings
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('change_watcher')
+
+metrics.describe('db_change_polls_total', 'counter', 'Polls of the database for changes by other connections')
+metrics.describe('db_table_changes_total', 'counter', 'Detected changes of tracked tables')
+
+Subscriber = Callable[[Set[str]], object]
+
+
+class ChangeWatcher:
+    """Polls the database for committed changes and notifies subscribers."""
+
+    def __init__(self, path: Optional[str] = None):
+        # Defaults to settings.DATABASE_PATH, read on every poll
+        self._path = path
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_path: Optional[str] = None
+        self._data_version: Optional[int] = None
+        self.versions: Dict[str, int] = {}
+        self._subscribers: List[Subscriber] = []
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.DATABASE_PATH
+
+    def subscribe(self, callback: Subscriber):
+        """Call ``callback(changed_tables)`` (sync or async) after every detected change."""
+        self._subscribers.append(callback)
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None and self._db_path != self.path:
+            await self.close()
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.path)
+            self._db_path = self.path
+            self._data_version = None
+            self.versions = {}
+        return self._db
+
+    async def check(self) -> Set[str]:
+        """Poll once; returns the tables changed since the previous poll.
+
+        The first poll only records the current versions.
+        """
+        async with self._lock:
+            return await self._check()
+
+    async def current(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """Up-to-date versions of the tables.
+
+        Polls first, so a commit made just before by any connection is
+        reflected (and subscribers have been notified of it).
+        """
+        await self.check()
+        return tuple(self.versions.get(table, 0) for table in tables)
+
+    async def _check(self) -> Set[str]:
+        db = await self._connection()
+        metrics.inc('db_change_polls_total')
+        async with db.execute("PRAGMA data_version") as cursor:
+            data_version = (await cursor.fetchone())[0]
+        if data_version == self._data_version:
+            return set()
+        first = self._data_version is None
+        self._data_version = data_version
+
+        async with db.execute("SELECT table_name, version FROM table_versions") as cursor:
+            versions = {name: version for name, version in await cursor.fetchall()}
+        changed = {name for name, version in versions.items() if self.versions.get(name) != version}
+        self.versions = versions
+        if first or not changed:
+            return set()
+
+        for table in changed:
+            metrics.inc('db_table_changes_total', table=table)
+        for callback in self._subscribers:
+            try:
+                result = callback(changed)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Change subscriber failed")
+        return changed
+
+    async def run(self, interval: float):
+        """Poll every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Database change poll failed")
+                await self.close()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float) -> asyncio.Task:
+        """Start polling in the background; the API and an in-process bot share one task."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(interval))
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.close()
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+# Global watcher of settings.DATABASE_PATH
+change_watcher = ChangeWatcher()
@@ -0,0 +1,280 @@
+"""Circuit breaker, bulkhead and deferred retry queue for external services."""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Optional
+
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('circuit_breaker')
+
+STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class BulkheadFullError(RuntimeError):
+    """Raised when no bulkhead slot became free in time."""
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with closed, open and half-open states.
+
+    The breaker keeps the outcomes of the last ``window_size`` calls. Once at
+    least ``minimum_calls`` outcomes are known and the failure rate reaches
+    ``failure_rate_threshold``, it opens and rejects calls for
+    ``open_seconds``. Then a limited number of trial calls is let through
+    (half-open): a success closes the breaker, a failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, window_size: int = 20,
+                 minimum_calls: int = 5, open_seconds: float = 30.0, half_open_max_calls: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.trips = 0
+
+        metrics.describe(f'{name}_circuit_state', 'gauge',
+                         'Circuit breaker state (0 closed, 1 half-open, 2 open)')
+        metrics.describe(f'{name}_circuit_trips_total', 'counter', 'Times the circuit breaker opened')
+        metrics.describe(f'{name}_calls_total', 'counter', 'Calls by outcome')
+        self._export_state()
+
+    def _export_state(self):
+        metrics.set(f'{self.name}_circuit_state', STATE_VALUES[self._state])
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit '{self.name}': {self._state} -> {state}")
+        self._state = state
+        if state == self.OPEN:
+            self._opened_at = self._clock()
+            self.trips += 1
+            metrics.inc(f'{self.name}_circuit_trips_total')
+        elif state == self.HALF_OPEN:
+            self._half_open_calls = 0
+        elif state == self.CLOSED:
+            self._outcomes.clear()
+        self._export_state()
+
+    def _refresh(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._transition(self.HALF_OPEN)
+
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once the timeout elapsed."""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def failure_rate(self) -> float:
+        """Failure rate over the current window."""
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def allow_request(self) -> bool:
+        """Check whether a call may proceed; rejected calls are counted."""
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+        metrics.inc(f'{self.name}_calls_total', outcome='rejected')
+        return False
+
+    def record_success(self):
+        """Record a successful call."""
+        metrics.inc(f'{self.name}_calls_total', outcome='success')
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+            else:
+                self._outcomes.append(True)
+
+    def record_failure(self):
+        """Record a failed call."""
+        metrics.inc(f'{self.name}_calls_total', outcome='failure')
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.OPEN)
+                return
+            self._outcomes.append(False)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.minimum_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate_threshold:
+                    self._transition(self.OPEN)
+
+    def reset(self):
+        """Force the breaker back to the closed state."""
+        with self._lock:
+            self._transition(self.CLOSED)
+            self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        """Breaker status for health checks."""
+        state = self.state
+        return {
+            'state': state,
+            'failure_rate': round(self.failure_rate(), 3),
+            'trips': self.trips,
+        }
+
+
+class Bulkhead:
+    """Limits concurrent calls so a slow dependency cannot take all workers."""
+
+    def __init__(self, name: str, max_concurrent: int, max_wait: float = 0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+        metrics.describe(f'{name}_bulkhead_in_flight', 'gauge', 'Calls currently holding a bulkhead slot')
+        metrics.describe(f'{name}_bulkhead_rejected_total', 'counter', 'Calls rejected by the bulkhead')
+        metrics.set(f'{name}_bulkhead_in_flight', 0)
+
+    @contextmanager
+    def acquire(self):
+        """Hold a slot for the duration of the block or raise BulkheadFullError."""
+        if self.max_wait > 0:
+            acquired = self._semaphore.acquire(timeout=self.max_wait)
+        else:
+            acquired = self._semaphore.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            metrics.inc(f'{self.name}_bulkhead_rejected_total')
+            raise BulkheadFullError(f"Bulkhead '{self.name}' is full")
+        with self._lock:
+            self.in_flight += 1
+            metrics.set(f'{self.name}_bulkhead_in_flight', self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                metrics.set(f'{self.name}_bulkhead_in_flight', self.in_flight)
+            self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        """Bulkhead status for health checks."""
+        return {
+            'max_concurrent': self.max_concurrent,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+        }
+
+
+@dataclass
+class DeferredJob:
+    """A retriable operation postponed while a dependency is unavailable."""
+    name: str
+    func: Callable[..., Awaitable]
+    args: tuple = ()
+    attempts: int = 0
+    next_attempt_at: float = field(default_factory=time.monotonic)
+
+
+class DeferredRetryQueue:
+    """Queue of async jobs retried in the background while a breaker allows calls.
+
+    A job succeeds when it returns a truthy value; exceptions and falsy
+    results schedule another attempt with exponential backoff until
+    ``max_attempts`` is reached.
+    """
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None, max_size: int = 1000,
+                 max_attempts: int = 10, base_delay: float = 30.0, max_delay: float = 900.0):
+        self.name = name
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._jobs: Deque[DeferredJob] = deque(maxlen=max_size)
+        metrics.describe(f'{name}_deferred_queue_size', 'gauge', 'Jobs waiting for a deferred retry')
+        metrics.describe(f'{name}_deferred_jobs_total', 'counter', 'Deferred jobs by result')
+        self._export_size()
+
+    def _export_size(self):
+        metrics.set(f'{self.name}_deferred_queue_size', len(self._jobs))
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def submit(self, name: str, func: Callable[..., Awaitable], *args):
+        """Queue an async job for a later attempt."""
+        if len(self._jobs) == self._jobs.maxlen:
+            dropped = self._jobs[0]
+            logger.error(f"Deferred queue '{self.name}' is full, dropping job '{dropped.name}'")
+            metrics.inc(f'{self.name}_deferred_jobs_total', result='dropped')
+        self._jobs.append(DeferredJob(name=name, func=func, args=args))
+        metrics.inc(f'{self.name}_deferred_jobs_total', result='queued')
+        self._export_size()
+        logger.info(f"Deferred job queued: {name}")
+
+    async def run_once(self) -> int:
+        """Attempt all due jobs once; returns the number of completed jobs."""
+        completed = 0
+        now = time.monotonic()
+        for _ in range(len(self._jobs)):
+            if self.breaker is not None and self.breaker.state == CircuitBreaker.OPEN:
+                break
+            job = self._jobs.popleft()
+            if job.next_attempt_at > now:
+                self._jobs.append(job)
+                continue
+            job.attempts += 1
+            try:
+                succeeded = bool(await job.func(*job.args))
+            except Exception as exc:
+                logger.warning(f"Deferred job '{job.name}' failed: {exc}")
+                succeeded = False
+            if succeeded:
+                completed += 1
+                metrics.inc(f'{self.name}_deferred_jobs_total', result='completed')
+            elif job.attempts >= self.max_attempts:
+                logger.error(f"Deferred job '{job.name}' abandoned after {job.attempts} attempts")
+                metrics.inc(f'{self.name}_deferred_jobs_total', result='abandoned')
+            else:
+                delay = min(self.base_delay * (2 ** (job.attempts - 1)), self.max_delay)
+                job.next_attempt_at = time.monotonic() + delay
+                self._jobs.append(job)
+        self._export_size()
+        return completed
+
+    async def run(self, interval: float = 10.0):
+        """Drain the queue forever, checking every ``interval`` seconds."""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.error(f"Deferred queue '{self.name}' error: {exc}")
+            await asyncio.sleep(interval)
+
+    def snapshot(self) -> dict:
+        """Queue status for health checks."""
+        return {'pending': len(self._jobs)}
@@ -0,0 +1,84 @@
+"""ETags and conditional GET for the read endpoints.
+
+A response's ETag is built from the versions of the tables it is read from
+(see ``ensure_change_tracking``), not from its body, so it is known before
+the endpoint runs and is the same in every worker. Routes declare their
+tables with ``dependencies=[conditional_get('works', ...)]``: a request
+whose ``If-None-Match`` matches gets 304 without any query being run;
+otherwise the tag is stored in the request state and ``ETagMiddleware``
+adds it to the successful response.
+"""
+import logging
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request
+
+from apps.services.change_watcher import change_watcher
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('conditional')
+
+metrics.describe('conditional_get_total', 'counter', 'GET requests with an ETag by result')
+
+# Clients must revalidate before reusing a stored response
+CACHE_CONTROL = b'no-cache'
+
+
+def make_etag(versions: Iterable[int]) -> str:
+    return '"v' + '.'.join(str(version) for version in versions) + '"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Weak comparison, as RFC 9110 prescribes for If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(','))
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def conditional_get(*tables: str) -> Depends:
+    """Route dependency answering 304 when none of ``tables`` changed."""
+    async def check(request: Request):
+        try:
+            versions: Tuple[int, ...] = await change_watcher.current(tables)
+        except Exception:
+            # Serve the full response rather than fail the request
+            logger.exception("Table versions unavailable, skipping ETag")
+            return
+        etag = make_etag(versions)
+        request.state.etag = etag
+        if etag_matches(etag, request.headers.get('if-none-match')):
+            metrics.inc('conditional_get_total', result='not_modified')
+            raise HTTPException(304, headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL.decode()})
+        metrics.inc('conditional_get_total', result='full')
+
+    return Depends(check)
+
+
+class ETagMiddleware:
+    """Adds the ETag chosen by ``conditional_get`` to 200 responses."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_etag(message):
+            if message['type'] == 'http.response.start' and message['status'] == 200:
+                etag = scope.get('state', {}).get('etag')
+                if etag:
+                    headers = [
+                        (name, value) for name, value in message.get('headers', [])
+                        if name.lower() not in (b'etag', b'cache-control')
+                    ]
+                    headers.append((b'etag', etag.encode()))
+                    headers.append((b'cache-control', CACHE_CONTROL))
+                    message = {**message, 'headers': headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
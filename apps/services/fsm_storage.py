@@ -0,0 +1,144 @@
+"""SQLite-backed FSM storage for the Telegram bot.
+
+Keeps foremen's conversation state (current step and collected data) in a
+small SQLite file so a bot restart does not drop reports in progress.
+The file uses WAL journaling, data is stored as compact JSON, and sessions
+untouched for longer than the TTL are treated as absent and evicted.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Mapping, Optional
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger('fsm_storage')
+
+
+def _storage_key(key: StorageKey) -> str:
+    parts = [
+        key.bot_id,
+        key.chat_id,
+        key.user_id,
+        getattr(key, 'thread_id', None) or '',
+        getattr(key, 'business_connection_id', None) or '',
+        key.destiny,
+    ]
+    return ':'.join(str(part) for part in parts)
+
+
+def _dump(data: Mapping[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage persisted in SQLite."""
+
+    def __init__(self, path: str, ttl: Optional[float] = 48 * 3600,
+                 eviction_interval: float = 600, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+        self._clock = clock
+        self._db: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._update_lock = asyncio.Lock()
+        self._last_eviction = 0.0
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        async with self._connect_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.path)
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute('''
+                    CREATE TABLE IF NOT EXISTS fsm_sessions (
+                        key TEXT PRIMARY KEY,
+                        state TEXT,
+                        data TEXT,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_fsm_sessions_updated ON fsm_sessions(updated_at)"
+                )
+                await db.commit()
+                self._db = db
+                await self.evict_expired()
+        return self._db
+
+    def _cutoff(self) -> float:
+        return self._clock() - self.ttl if self.ttl else float('-inf')
+
+    async def _fetch(self, key: StorageKey, column: str) -> Optional[str]:
+        db = await self._connection()
+        async with db.execute(
+            f"SELECT {column} FROM fsm_sessions WHERE key = ? AND updated_at >= ?",
+            (_storage_key(key), self._cutoff())
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def _write(self, key: StorageKey, column: str, value: Optional[str]):
+        db = await self._connection()
+        storage_key = _storage_key(key)
+        now = self._clock()
+        # An expired session must not come back to life with its old values
+        await db.execute(
+            "DELETE FROM fsm_sessions WHERE key = ? AND updated_at < ?", (storage_key, self._cutoff())
+        )
+        await db.execute(f'''
+            INSERT INTO fsm_sessions (key, {column}, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column}, updated_at = excluded.updated_at
+        ''', (storage_key, value, now))
+        # Drop sessions that no longer hold anything
+        await db.execute(
+            "DELETE FROM fsm_sessions WHERE key = ? AND state IS NULL AND (data IS NULL OR data = '{}')",
+            (storage_key,)
+        )
+        await db.commit()
+        if self.ttl and now - self._last_eviction >= self.eviction_interval:
+            await self.evict_expired()
+
+    async def evict_expired(self) -> int:
+        """Delete sessions idle for longer than the TTL; returns the number removed."""
+        self._last_eviction = self._clock()
+        if not self.ttl:
+            return 0
+        db = await self._connection()
+        cursor = await db.execute("DELETE FROM fsm_sessions WHERE updated_at < ?", (self._cutoff(),))
+        await db.commit()
+        if cursor.rowcount:
+            logger.info(f"Evicted {cursor.rowcount} expired FSM sessions")
+        return cursor.rowcount
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(key, 'state', value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._fetch(key, 'state')
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(key, 'data', _dump(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = await self._fetch(key, 'data')
+        return json.loads(raw) if raw else {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        async with self._update_lock:
+            current = await self.get_data(key)
+            current.update(data)
+            await self.set_data(key, current)
+            return current.copy()
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
@@ -0,0 +1,67 @@
+"""In-process metrics registry with Prometheus text exposition."""
+import threading
+from typing import Dict, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    inner = ','.join(f'{name}="{value}"' for name, value in key)
+    return '{' + inner + '}'
+
+
+class MetricsRegistry:
+    """Thread-safe counters and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        """Register metric type ('counter' or 'gauge') and help text."""
+        with self._lock:
+            self._types[name] = metric_type
+            self._help[name] = help_text
+            self._values.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increment a counter (or gauge)."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge value."""
+        key = _label_key(labels)
+        with self._lock:
+            self._values.setdefault(name, {})[key] = value
+
+    def get(self, name: str, **labels) -> float:
+        """Get the current value of a metric series."""
+        with self._lock:
+            return self._values.get(name, {}).get(_label_key(labels), 0)
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types.get(name, 'untyped')}")
+                for key, value in sorted(self._values[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
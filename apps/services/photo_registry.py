@@ -0,0 +1,279 @@
+"""Content-hash registry of photos uploaded to Yandex Disk.
+
+Photos are hashed while they are streamed into a spooled temporary file.
+If the same content was uploaded before, the existing disk path and public
+URL are reused and only a link to the report is recorded.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import struct
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterable, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from apps.database import get_db
+from apps.services.yandex_disk import yandex_disk_service
+
+logger = logging.getLogger('photo_registry')
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+class PhotoTooLargeError(ValueError):
+    """Raised when a streamed photo exceeds the allowed size."""
+
+
+@dataclass
+class SpooledPhoto:
+    """Photo content spooled to a temporary file together with its hash."""
+    content_hash: str
+    size: int
+    file: BinaryIO
+
+    def close(self):
+        """Release the temporary file."""
+        self.file.close()
+
+
+class PhotoSpool:
+    """Incrementally hashes and spools photo content as chunks arrive."""
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+
+    def feed(self, chunk: bytes):
+        """Add a chunk; raises PhotoTooLargeError once ``max_size`` is exceeded."""
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            self._file.close()
+            raise PhotoTooLargeError(f"Photo exceeds {self.max_size} bytes")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def finish(self) -> SpooledPhoto:
+        """Rewind the spool and return the hashed photo."""
+        self._file.seek(0)
+        return SpooledPhoto(content_hash=self._digest.hexdigest(), size=self.size, file=self._file)
+
+    def discard(self):
+        """Drop the spooled content."""
+        self._file.close()
+
+
+def spool_chunks(chunks: Iterable[bytes], max_size: Optional[int] = None) -> SpooledPhoto:
+    """Hash and spool a synchronous stream of chunks."""
+    spool = PhotoSpool(max_size)
+    for chunk in chunks:
+        spool.feed(chunk)
+    return spool.finish()
+
+
+async def spool_async_chunks(chunks: AsyncIterable[bytes], max_size: Optional[int] = None) -> SpooledPhoto:
+    """Hash and spool an asynchronous stream of chunks."""
+    spool = PhotoSpool(max_size)
+    async for chunk in chunks:
+        spool.feed(chunk)
+    return spool.finish()
+
+
+def _jpeg_dimensions(file: BinaryIO) -> Optional[Tuple[int, int]]:
+    file.seek(2)
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        if kind in (0xD8, 0x01) or 0xD0 <= kind <= 0xD7:
+            continue
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC) carry the frame size
+        if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+            header = file.read(5)
+            if len(header) < 5:
+                return None
+            height, width = struct.unpack('>HH', header[1:5])
+            return width, height
+        file.seek(length - 2, 1)
+
+
+def read_image_dimensions(file: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG, PNG, GIF or WebP header.
+
+    Only the header is read; returns ``None`` for unknown or damaged files.
+    The file position is reset to the start afterwards.
+    """
+    try:
+        file.seek(0)
+        head = file.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            chunk = head[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', head[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(head[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return (int.from_bytes(head[24:27], 'little') + 1,
+                        int.from_bytes(head[27:30], 'little') + 1)
+            return None
+        if head[:2] == b'\xff\xd8':
+            return _jpeg_dimensions(file)
+        return None
+    except (OSError, struct.error):
+        return None
+    finally:
+        file.seek(0)
+
+
+PHOTO_FIELDS = ('content_hash', 'disk_path', 'public_url', 'thumbnail_url', 'size', 'width', 'height')
+
+
+def _registry_row_to_dict(row) -> dict:
+    return {field: row[field] for field in PHOTO_FIELDS}
+
+
+def _report_photo_row_to_dict(row) -> dict:
+    return {
+        **{field: row[field] for field in PHOTO_FIELDS},
+        'is_duplicate': bool(row['is_duplicate']),
+        'created_at': row['created_at'],
+    }
+
+
+class PhotoRegistry:
+    """Maps photo content hashes to files already stored on Yandex Disk."""
+
+    async def lookup(self, db, content_hash: str) -> Optional[dict]:
+        """Return the registered photo for a content hash, if any."""
+        async with db.execute(
+            f"SELECT {', '.join(PHOTO_FIELDS)} FROM photo_registry WHERE content_hash = ?",
+            (content_hash,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return _registry_row_to_dict(row) if row else None
+
+    async def register(self, db, content_hash: str, disk_path: str,
+                       public_url: Optional[str], size: int,
+                       thumbnail_url: Optional[str] = None,
+                       width: Optional[int] = None, height: Optional[int] = None):
+        """Register a freshly uploaded photo."""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        await db.execute("""
+            INSERT OR IGNORE INTO photo_registry
+            (content_hash, disk_path, public_url, thumbnail_url, size, width, height,
+             use_count, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+        """, (content_hash, disk_path, public_url, thumbnail_url, size, width, height, now, now))
+
+    async def touch(self, db, content_hash: str):
+        """Record another use of an already registered photo."""
+        await db.execute("""
+            UPDATE photo_registry
+            SET use_count = use_count + 1, last_used_at = ?
+            WHERE content_hash = ?
+        """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), content_hash))
+
+    async def link_to_report(self, db, report_id: int, content_hash: str, is_duplicate: bool = False):
+        """Attach a registered photo to a work report, copying its file details."""
+        await db.execute("""
+            INSERT OR IGNORE INTO report_photos
+            (report_id, content_hash, is_duplicate, disk_path, public_url, thumbnail_url,
+             size, width, height, created_at)
+            SELECT ?, content_hash, ?, disk_path, public_url, thumbnail_url, size, width, height, ?
+            FROM photo_registry
+            WHERE content_hash = ?
+        """, (report_id, int(is_duplicate), datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+              content_hash))
+
+    async def link_many(self, report_id: int, photos: List[dict]):
+        """Attach several stored photos (as returned by ``store``) to a report."""
+        if not photos:
+            return
+        async with get_db() as db:
+            for photo in photos:
+                await self.link_to_report(
+                    db, report_id, photo['content_hash'], photo.get('deduplicated', False)
+                )
+            await db.commit()
+
+    async def get_report_photos(self, db, report_id: int) -> List[dict]:
+        """Return photos linked to a report."""
+        photos = await self.get_photos_for_reports(db, [report_id])
+        return photos.get(report_id, [])
+
+    async def get_photos_for_reports(self, db, report_ids: Iterable[int]) -> Dict[int, List[dict]]:
+        """Return photos for a page of reports in one query, keyed by report ID."""
+        report_ids = list(report_ids)
+        if not report_ids:
+            return {}
+        async with db.execute(f"""
+            SELECT report_id, {', '.join(PHOTO_FIELDS)}, is_duplicate, created_at
+            FROM report_photos
+            WHERE report_id IN (SELECT value FROM json_each(?))
+            ORDER BY report_id, id
+        """, (json.dumps(report_ids),)) as cursor:
+            rows = await cursor.fetchall()
+        photos: Dict[int, List[dict]] = {}
+        for row in rows:
+            photos.setdefault(row['report_id'], []).append(_report_photo_row_to_dict(row))
+        return photos
+
+    async def store(self, photo: SpooledPhoto, folder_path: str, filename: str) -> Optional[dict]:
+        """Upload a spooled photo unless identical content is already registered.
+
+        Returns the registry entry with a ``deduplicated`` flag, or ``None``
+        if the upload failed.
+        """
+        async with get_db() as db:
+            existing = await self.lookup(db, photo.content_hash)
+            if existing:
+                await self.touch(db, photo.content_hash)
+                await db.commit()
+                logger.info(f"Photo {photo.content_hash[:12]} already uploaded: {existing['disk_path']}")
+                return {**existing, 'deduplicated': True}
+
+        disk_path = f"{folder_path.rstrip('/')}/{filename}"
+        width, height = read_image_dimensions(photo.file) or (None, None)
+        uploaded = await asyncio.to_thread(yandex_disk_service.upload_file_info, photo.file, disk_path)
+        if not uploaded or not uploaded['public_url']:
+            return None
+
+        async with get_db() as db:
+            await self.register(
+                db, photo.content_hash, disk_path, uploaded['public_url'], photo.size,
+                thumbnail_url=uploaded['thumbnail_url'], width=width, height=height
+            )
+            await db.commit()
+
+        logger.info(f"Uploaded photo {photo.content_hash[:12]} ({photo.size} bytes) to {disk_path}")
+        return {
+            'content_hash': photo.content_hash,
+            'disk_path': disk_path,
+            'public_url': uploaded['public_url'],
+            'thumbnail_url': uploaded['thumbnail_url'],
+            'size': photo.size,
+            'width': width,
+            'height': height,
+            'deduplicated': False,
+        }
+
+
+# Global registry instance
+photo_registry = PhotoRegistry()
@@ -0,0 +1,260 @@
+"""Streaming multipart photo uploads for reports.
+
+The request body is fed chunk by chunk into a streaming multipart parser.
+Each file part is hashed and spooled as it arrives (see ``PhotoSpool``), so
+a request with dozens of photos is never buffered in memory as a whole.
+As soon as a part is complete its upload to Yandex Disk starts, in parallel
+with receiving the remaining parts.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import AsyncIterable, Dict, List, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from apps.services.photo_registry import (
+    PhotoSpool, PhotoTooLargeError, SpooledPhoto, photo_registry
+)
+
+logger = logging.getLogger('photo_upload')
+
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.heif'}
+
+
+class UploadRequestError(ValueError):
+    """Raised for malformed upload requests."""
+
+
+class UploadTooLargeError(UploadRequestError):
+    """Raised when the request body exceeds the allowed size."""
+
+
+@dataclass
+class UploadedPart:
+    """A file part received from a multipart request."""
+    index: int
+    filename: Optional[str]
+    content_type: str
+    photo: Optional[SpooledPhoto] = None
+    size: int = 0
+    error: Optional[str] = None
+
+
+class MultipartPhotoReader:
+    """Incremental multipart parser that spools file parts to ``PhotoSpool``.
+
+    Non-file form fields are ignored. Parts that are not images, exceed
+    ``max_file_size`` or go beyond ``max_files`` are returned with an error
+    instead of aborting the whole request.
+    """
+
+    def __init__(self, content_type: str, max_file_size: int, max_files: int):
+        mime_type, options = parse_options_header(content_type or '')
+        if mime_type != b'multipart/form-data':
+            raise UploadRequestError("Expected multipart/form-data")
+        boundary = options.get(b'boundary')
+        if not boundary:
+            raise UploadRequestError("Missing multipart boundary")
+
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.files_seen = 0
+        self._completed: List[UploadedPart] = []
+        self._open_spools: List[PhotoSpool] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._part: Optional[UploadedPart] = None
+        self._spool: Optional[PhotoSpool] = None
+        self._parser = MultipartParser(boundary, {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = None
+        self._spool = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if b'filename' not in disposition:
+            return
+
+        filename = disposition[b'filename'].decode('utf-8', 'replace')
+        content_type = self._headers.get(b'content-type', b'application/octet-stream').decode('latin-1')
+        part = UploadedPart(index=self.files_seen, filename=filename, content_type=content_type)
+        self.files_seen += 1
+        self._part = part
+
+        if part.index >= self.max_files:
+            part.error = f"Too many files, at most {self.max_files} per request"
+        elif not content_type.startswith('image/'):
+            part.error = f"Unsupported content type {content_type}"
+        else:
+            self._spool = PhotoSpool(self.max_file_size)
+            self._open_spools.append(self._spool)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part is None:
+            return
+        self._part.size += end - start
+        if self._spool is None:
+            return
+        try:
+            self._spool.feed(data[start:end])
+        except PhotoTooLargeError:
+            self._part.error = f"File exceeds {self.max_file_size} bytes"
+            self._release_spool()
+
+    def _on_part_end(self):
+        part = self._part
+        if part is None:
+            return
+        if self._spool is not None:
+            if self._spool.size == 0:
+                part.error = "Empty file"
+                self._release_spool()
+            else:
+                part.photo = self._spool.finish()
+                self._open_spools.remove(self._spool)
+                self._spool = None
+        self._completed.append(part)
+        self._part = None
+
+    def _release_spool(self):
+        self._spool.discard()
+        self._open_spools.remove(self._spool)
+        self._spool = None
+
+    def feed(self, chunk: bytes) -> List[UploadedPart]:
+        """Parse a chunk of the body; returns the file parts completed by it."""
+        self._parser.write(chunk)
+        completed, self._completed = self._completed, []
+        return completed
+
+    def close(self) -> List[UploadedPart]:
+        """Finish parsing; returns any remaining completed parts."""
+        self._parser.finalize()
+        if self._spool is not None:
+            raise UploadRequestError("Multipart body ended inside a file part")
+        completed, self._completed = self._completed, []
+        return completed
+
+    def abort(self):
+        """Discard partially received files."""
+        for spool in self._open_spools:
+            spool.discard()
+        self._open_spools = []
+        self._spool = None
+
+
+def _disk_filename(report_id: int, part: UploadedPart) -> str:
+    extension = os.path.splitext(part.filename or '')[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        extension = '.jpg'
+    return f"report_{report_id}_{part.photo.content_hash[:16]}{extension}"
+
+
+class ReportPhotoUploader:
+    """Receives a multipart body and uploads its photos with bounded parallelism."""
+
+    def __init__(self, report_id: int, folder_path: str, parallelism: int):
+        self.report_id = report_id
+        self.folder_path = folder_path
+        self._semaphore = asyncio.Semaphore(parallelism)
+        self.stored: List[dict] = []
+
+    async def _store(self, part: UploadedPart) -> dict:
+        result = {
+            'index': part.index,
+            'filename': part.filename,
+            'size': part.size,
+            'content_hash': part.photo.content_hash if part.photo else None,
+            'public_url': None,
+            'error': part.error,
+        }
+        if part.photo is None:
+            return {**result, 'status': 'rejected'}
+
+        try:
+            async with self._semaphore:
+                stored = await photo_registry.store(
+                    part.photo, self.folder_path, _disk_filename(self.report_id, part)
+                )
+        finally:
+            part.photo.close()
+
+        if not stored:
+            return {**result, 'status': 'failed', 'error': "Upload to Yandex Disk failed"}
+        self.stored.append(stored)
+        status = 'duplicate' if stored['deduplicated'] else 'uploaded'
+        return {**result, 'status': status, 'public_url': stored['public_url']}
+
+    @staticmethod
+    async def _same_as(part: UploadedPart, first: asyncio.Task) -> dict:
+        """Result for a file identical to one earlier in the same request."""
+        part.photo.close()
+        result = await first
+        status = 'duplicate' if result['status'] in ('uploaded', 'duplicate') else result['status']
+        return {**result, 'index': part.index, 'filename': part.filename, 'status': status}
+
+    async def process(self, stream: AsyncIterable[bytes], reader: MultipartPhotoReader,
+                      max_request_size: int) -> List[dict]:
+        """Consume the body and return per-file results ordered by position."""
+        tasks: List[asyncio.Task] = []
+        by_hash: Dict[str, asyncio.Task] = {}
+
+        def schedule(parts: List[UploadedPart]):
+            for part in parts:
+                content_hash = part.photo.content_hash if part.photo else None
+                if content_hash in by_hash:
+                    tasks.append(asyncio.create_task(self._same_as(part, by_hash[content_hash])))
+                    continue
+                task = asyncio.create_task(self._store(part))
+                if content_hash:
+                    by_hash[content_hash] = task
+                tasks.append(task)
+
+        received = 0
+        try:
+            async for chunk in stream:
+                received += len(chunk)
+                if received > max_request_size:
+                    raise UploadTooLargeError(f"Request exceeds {max_request_size} bytes")
+                schedule(reader.feed(chunk))
+            schedule(reader.close())
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            reader.abort()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        logger.info(
+            f"Report {self.report_id}: received {len(results)} photos, "
+            f"{sum(1 for r in results if r['status'] == 'uploaded')} uploaded"
+        )
+        return sorted(results, key=lambda r: r['index'])
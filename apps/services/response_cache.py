@@ -0,0 +1,113 @@
+"""In-process cache of serialized responses for read-mostly catalog endpoints.
+
+Works, materials, categories and foremen are read by the dashboard on every
+tab switch and by the bot on every interaction but change rarely. Each cached
+response records the version of every entity (table) it was built from; write
+routes call ``bump()`` for the entities they change, which makes every
+response depending on them stale at once. Entries hold the encoded JSON
+body, so a hit costs neither SQL nor serialization, and the least recently
+used entries are evicted once the entry or byte budget is exceeded.
+
+Versions are read before the loader runs: a write that lands while a
+response is being built leaves the new entry already stale.
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from apps.config import settings
+from apps.services.metrics import metrics
+
+metrics.describe('response_cache_requests_total', 'counter', 'Cached endpoint lookups by endpoint and result')
+metrics.describe('response_cache_evictions_total', 'counter', 'Cached responses evicted to stay within budget')
+metrics.describe('response_cache_entries', 'gauge', 'Responses held in the cache')
+metrics.describe('response_cache_bytes', 'gauge', 'Size of the response bodies held in the cache')
+
+CacheKey = Tuple[Hashable, ...]
+
+
+class ResponseCache:
+    """LRU cache of JSON bodies keyed by endpoint and parameters."""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._versions: Dict[str, int] = {}
+        # key -> (entities, versions, body)
+        self._entries: 'OrderedDict[CacheKey, Tuple[Tuple[str, ...], Tuple[int, ...], bytes]]' = OrderedDict()
+        self._bytes = 0
+
+    def versions(self, entities: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._versions.get(entity, 0) for entity in entities)
+
+    def bump(self, *entities: str):
+        """Mark the entities as changed; responses built from them go stale."""
+        for entity in entities:
+            self._versions[entity] = self._versions.get(entity, 0) + 1
+
+    def _publish(self):
+        metrics.set('response_cache_entries', len(self._entries))
+        metrics.set('response_cache_bytes', self._bytes)
+
+    def _drop(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2])
+
+    def get(self, key: CacheKey) -> Optional[bytes]:
+        """Cached body for the key if none of its entities changed since."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entities, versions, body = entry
+        if self.versions(entities) != versions:
+            self._drop(key)
+            self._publish()
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: CacheKey, entities: Tuple[str, ...], versions: Tuple[int, ...], body: bytes):
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        if self.versions(entities) != versions:
+            # Changed while the response was being built
+            return
+        self._drop(key)
+        self._entries[key] = (entities, versions, body)
+        self._bytes += len(body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            metrics.inc('response_cache_evictions_total')
+        self._publish()
+
+    async def respond(self, key: CacheKey, entities: Tuple[str, ...],
+                      loader: Callable[[], Awaitable[Any]]) -> Response:
+        """JSON response for the key, from the cache or built by ``loader``.
+
+        ``key[0]`` names the endpoint in the metrics.
+        """
+        body = self.get(key)
+        if body is not None:
+            metrics.inc('response_cache_requests_total', endpoint=key[0], result='hit')
+            return Response(content=body, media_type='application/json')
+        metrics.inc('response_cache_requests_total', endpoint=key[0], result='miss')
+        versions = self.versions(entities)
+        response = JSONResponse(jsonable_encoder(await loader()))
+        self.put(key, entities, versions, response.body)
+        return response
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._publish()
+
+
+# Global cache shared by the API routers
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,41 @@
+"""Minimal in-process scheduler for jobs that run once a day."""
+import asyncio
+import logging
+from datetime import datetime, time, timedelta, tzinfo
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger('scheduler')
+
+
+def parse_time_of_day(value: str) -> Optional[time]:
+    """Parse ``HH:MM``; returns None for an empty value."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def seconds_until(at: time, now: datetime) -> float:
+    """Seconds from ``now`` to the next occurrence of ``at`` in now's timezone."""
+    target = datetime.combine(now.date(), at, tzinfo=now.tzinfo)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+async def run_daily(name: str, at: time, tz: tzinfo, job: Callable[[], Awaitable[None]],
+                    clock: Callable[[tzinfo], datetime] = datetime.now):
+    """Run ``job`` every day at ``at`` (local time in ``tz``) until cancelled.
+
+    A failing run is logged and does not stop the schedule.
+    """
+    while True:
+        delay = seconds_until(at, clock(tz))
+        logger.info(f"Next {name} run in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        try:
+            await job()
+        except Exception:
+            logger.exception(f"Scheduled job {name} failed")
+        # Don't run twice if the job finished within the same second
+        await asyncio.sleep(1)
@@ -0,0 +1,72 @@
+"""Full-text search over the works and materials catalogs.
+
+Queries run against the FTS5 indexes created by ``ensure_search_index``.
+Every word of the query must match the start of a word in the name or
+category; results are ranked with BM25, name matches weighing more than
+category matches.
+"""
+import re
+from typing import List, Optional
+
+SEARCH_TYPES = ('works', 'materials')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Extra columns returned per catalog
+_SEARCH_COLUMNS = {
+    'works': 't.unit, t.is_active, t.balance AS quantity',
+    'materials': 't.unit, t.is_active, t.quantity',
+}
+
+NAME_WEIGHT = 10.0
+CATEGORY_WEIGHT = 1.0
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 prefix query, or None if it has no words.
+
+    Each word is quoted, so FTS5 operators and punctuation in user input are
+    treated as plain text. ``ё`` is folded to ``е`` as in the index.
+    """
+    text = (text or '').replace('ё', 'е').replace('Ё', 'Е')
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+async def search_catalog(db, text: str, search_type: Optional[str] = None,
+                         limit: int = 20) -> List[dict]:
+    """Search works and/or materials; returns the best ``limit`` matches."""
+    match = build_match_query(text)
+    if match is None:
+        return []
+
+    results = []
+    for table in ([search_type] if search_type else SEARCH_TYPES):
+        async with db.execute(f'''
+            SELECT t.id, t.name, t.category, {_SEARCH_COLUMNS[table]},
+                   bm25({table}_fts, ?, ?) AS rank
+            FROM {table}_fts
+            JOIN {table} t ON t.id = {table}_fts.rowid
+            WHERE {table}_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (NAME_WEIGHT, CATEGORY_WEIGHT, match, limit)) as cursor:
+            rows = await cursor.fetchall()
+        results.extend(
+            {
+                'type': table[:-1],
+                'id': row[0],
+                'name': row[1],
+                'category': row[2],
+                'unit': row[3],
+                'is_active': bool(row[4]) if row[4] is not None else True,
+                'quantity': row[5] or 0,
+                'rank': row[6],
+            }
+            for row in rows
+        )
+
+    results.sort(key=lambda item: item['rank'])
+    return results[:limit]
@@ -0,0 +1,227 @@
+"""Durable queue of report submissions from the Telegram bot.
+
+A submission is written to a small SQLite file next to the main database
+before anything else happens, so a foreman's report survives a locked
+database, a Yandex Disk outage or a bot restart. Submissions are handed to
+a handler in order per foreman (a foreman's later reports wait behind an
+earlier one that keeps failing) while different foremen are processed in
+parallel. Failed attempts are retried with exponential backoff; a handler
+raises ``SubmissionRejected`` for submissions that can never succeed.
+
+The handler must be idempotent: a submission is removed only after the
+handler returns, so a crash in between replays it.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiosqlite
+
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('submission_queue')
+
+metrics.describe('bot_submissions_total', 'counter', 'Bot report submissions by outcome')
+metrics.describe('bot_submissions_pending', 'gauge', 'Bot report submissions waiting in the queue')
+
+
+class SubmissionRejected(Exception):
+    """Raised by a handler when a submission must be dropped, not retried."""
+
+
+class SubmissionQueue:
+    """SQLite-backed submission queue with per-foreman ordering."""
+
+    def __init__(self, path: str, handler: Callable[[dict], Awaitable[Any]],
+                 on_done: Optional[Callable[[dict, Any], Awaitable[None]]] = None,
+                 on_rejected: Optional[Callable[[dict, SubmissionRejected], Awaitable[None]]] = None,
+                 concurrency: int = 4, base_delay: float = 5.0, max_delay: float = 300.0,
+                 lease_seconds: float = 120.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.handler = handler
+        self.on_done = on_done
+        self.on_rejected = on_rejected
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._db: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._foreman_locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        async with self._connect_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.path)
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute('''
+                    CREATE TABLE IF NOT EXISTS submissions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        foreman_id INTEGER NOT NULL,
+                        payload TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at REAL NOT NULL,
+                        locked_until REAL,
+                        last_error TEXT,
+                        created_at REAL NOT NULL
+                    )
+                ''')
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_submissions_foreman ON submissions(foreman_id, id)"
+                )
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def submit(self, foreman_id: int, payload: dict) -> int:
+        """Persist a submission; returns its id. Processing starts right away.
+
+        Follow up with ``wait()``: until then a result is kept for the caller
+        rather than passed to ``on_done``.
+        """
+        db = await self._connection()
+        now = self._clock()
+        cursor = await db.execute(
+            "INSERT INTO submissions (foreman_id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+            (foreman_id, json.dumps(payload, ensure_ascii=False, separators=(',', ':')), now, now)
+        )
+        await db.commit()
+        submission_id = cursor.lastrowid
+        self._waiters[submission_id] = asyncio.get_running_loop().create_future()
+        asyncio.create_task(self._drain_foreman(foreman_id))
+        return submission_id
+
+    async def wait(self, submission_id: int, timeout: float) -> Optional[Any]:
+        """Wait up to ``timeout`` for the handler result.
+
+        Returns None if the submission is still queued; the result is then
+        passed to ``on_done`` (or the rejection to ``on_rejected``) later.
+        Raises ``SubmissionRejected`` if the handler rejected it in time.
+        """
+        waiter = self._waiters.get(submission_id)
+        if waiter is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            self._waiters.pop(submission_id, None)
+            return None
+
+    async def pending(self) -> int:
+        db = await self._connection()
+        async with db.execute("SELECT COUNT(*) FROM submissions") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def _claim_head(self, foreman_id: int):
+        """Lease the foreman's oldest submission if it is due and not leased elsewhere."""
+        db = await self._connection()
+        now = self._clock()
+        async with db.execute(
+            "SELECT id, payload, attempts, next_attempt_at, locked_until FROM submissions "
+            "WHERE foreman_id = ? ORDER BY id LIMIT 1",
+            (foreman_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or row[3] > now or (row[4] is not None and row[4] > now):
+            return None
+        cursor = await db.execute(
+            "UPDATE submissions SET locked_until = ? "
+            "WHERE id = ? AND (locked_until IS NULL OR locked_until <= ?)",
+            (now + self.lease_seconds, row[0], now)
+        )
+        await db.commit()
+        if cursor.rowcount != 1:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    async def _finish(self, submission_id: int, payload: dict, result: Any = None,
+                      rejection: Optional[SubmissionRejected] = None):
+        db = await self._connection()
+        await db.execute("DELETE FROM submissions WHERE id = ?", (submission_id,))
+        await db.commit()
+        metrics.inc('bot_submissions_total', outcome='rejected' if rejection else 'stored')
+
+        waiter = self._waiters.pop(submission_id, None)
+        if waiter is not None and not waiter.done():
+            if rejection:
+                waiter.set_exception(rejection)
+            else:
+                waiter.set_result(result)
+            return
+        try:
+            if rejection and self.on_rejected:
+                await self.on_rejected(payload, rejection)
+            elif not rejection and self.on_done:
+                await self.on_done(payload, result)
+        except Exception:
+            logger.exception(f"Notification for submission {submission_id} failed")
+
+    async def _retry_later(self, submission_id: int, attempts: int, error: Exception):
+        db = await self._connection()
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        await db.execute(
+            "UPDATE submissions SET attempts = ?, next_attempt_at = ?, locked_until = NULL, last_error = ? "
+            "WHERE id = ?",
+            (attempts + 1, self._clock() + delay, str(error)[:500], submission_id)
+        )
+        await db.commit()
+        metrics.inc('bot_submissions_total', outcome='retried')
+        # Don't keep the caller waiting for the backoff: report it as queued
+        waiter = self._waiters.pop(submission_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        logger.warning(f"Submission {submission_id} failed (attempt {attempts + 1}), retry in {delay:.0f}s: {error}")
+
+    async def _drain_foreman(self, foreman_id: int) -> int:
+        """Process the foreman's due submissions in order; stops at the first failure."""
+        lock = self._foreman_locks.setdefault(foreman_id, asyncio.Lock())
+        processed = 0
+        async with lock, self._semaphore:
+            while True:
+                claimed = await self._claim_head(foreman_id)
+                if claimed is None:
+                    break
+                submission_id, payload, attempts = claimed
+                try:
+                    result = await self.handler(payload)
+                except SubmissionRejected as rejection:
+                    logger.warning(f"Submission {submission_id} rejected: {rejection}")
+                    await self._finish(submission_id, payload, rejection=rejection)
+                except Exception as e:
+                    await self._retry_later(submission_id, attempts, e)
+                    break
+                else:
+                    await self._finish(submission_id, payload, result=result)
+                processed += 1
+        return processed
+
+    async def drain(self) -> int:
+        """Process every foreman's due submissions; returns how many finished."""
+        db = await self._connection()
+        async with db.execute("SELECT DISTINCT foreman_id FROM submissions") as cursor:
+            foreman_ids = [row[0] for row in await cursor.fetchall()]
+        metrics.set('bot_submissions_pending', await self.pending())
+        if not foreman_ids:
+            return 0
+        results = await asyncio.gather(*(self._drain_foreman(foreman_id) for foreman_id in foreman_ids))
+        return sum(results)
+
+    async def run(self, interval: float):
+        """Drain the queue every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Submission queue drain failed")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
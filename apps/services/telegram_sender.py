@@ -0,0 +1,135 @@
+"""Splitting long texts into Telegram messages and sending them within rate limits.
+
+Telegram rejects messages over 4096 characters and answers 429 with a
+``retry_after`` when a bot sends faster than about one message per second
+to a chat or 30 messages per second overall. ``split_message`` cuts a text
+on block boundaries (e.g. one block per foreman); ``TelegramSender`` paces
+sends per chat and globally and waits out ``retry_after`` before retrying.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, List
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('telegram_sender')
+
+MESSAGE_LIMIT = 4096
+
+metrics.describe('telegram_messages_sent_total', 'counter', 'Messages sent through TelegramSender')
+metrics.describe('telegram_retry_after_total', 'counter', 'Telegram 429 responses waited out')
+
+
+def _split_long_block(block: str, limit: int) -> List[str]:
+    """Split a single oversized block by lines, cutting lines longer than the limit."""
+    parts: List[str] = []
+    current = ''
+    for line in block.split('\n'):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f'{current}\n{line}' if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_message(blocks: Iterable[str], limit: int = MESSAGE_LIMIT, separator: str = '\n\n') -> List[str]:
+    """Pack blocks into as few messages as possible without splitting a block.
+
+    Only a block that alone exceeds ``limit`` is split, on line boundaries.
+    """
+    messages: List[str] = []
+    current = ''
+    for block in blocks:
+        if not block:
+            continue
+        pieces = [block] if len(block) <= limit else _split_long_block(block, limit)
+        for piece in pieces:
+            candidate = f'{current}{separator}{piece}' if current else piece
+            if len(candidate) > limit:
+                messages.append(current)
+                current = piece
+            else:
+                current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
+
+class TelegramSender:
+    """Sends bot messages respecting per-chat and global rate limits.
+
+    ``per_chat_interval`` is the minimum time between two messages to the
+    same chat, ``global_rate`` the maximum messages per second overall. On a
+    429 the sender sleeps for ``retry_after`` and retries, up to
+    ``max_retries`` times.
+    """
+
+    def __init__(self, bot, per_chat_interval: float = 1.0, global_rate: float = 25,
+                 max_retries: int = 5, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], object] = asyncio.sleep):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / global_rate if global_rate else 0.0
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._global_lock = asyncio.Lock()
+        self._next_global = 0.0
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._next_chat: Dict[int, float] = {}
+
+    async def _wait_global_slot(self):
+        async with self._global_lock:
+            now = self._clock()
+            if self._next_global > now:
+                await self._sleep(self._next_global - now)
+                now = self._clock()
+            self._next_global = now + self.global_interval
+
+    async def _call(self, chat_id: int, method: str, **kwargs):
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            for attempt in range(self.max_retries + 1):
+                wait = self._next_chat.get(chat_id, 0.0) - self._clock()
+                if wait > 0:
+                    await self._sleep(wait)
+                await self._wait_global_slot()
+                try:
+                    result = await getattr(self.bot, method)(chat_id, **kwargs)
+                except TelegramRetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    metrics.inc('telegram_retry_after_total')
+                    logger.warning(f"Telegram asked to retry after {e.retry_after}s (chat {chat_id})")
+                    self._next_chat[chat_id] = self._clock() + e.retry_after
+                    continue
+                self._next_chat[chat_id] = self._clock() + self.per_chat_interval
+                metrics.inc('telegram_messages_sent_total')
+                return result
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        return await self._call(chat_id, 'send_message', text=text, **kwargs)
+
+    async def send_document(self, chat_id: int, document, **kwargs):
+        return await self._call(chat_id, 'send_document', document=document, **kwargs)
+
+    async def send_long_message(self, chat_id: int, blocks: Iterable[str], reply_markup=None, **kwargs):
+        """Send blocks split into messages; the reply markup goes on the last one."""
+        messages = split_message(blocks)
+        for index, text in enumerate(messages):
+            markup = reply_markup if index == len(messages) - 1 else None
+            await self.send_message(chat_id, text, reply_markup=markup, **kwargs)
+        return len(messages)
@@ -0,0 +1,102 @@
+"""Telegram webhook delivery for the bot dispatcher.
+
+In webhook mode Telegram POSTs updates to the API server instead of the bot
+long-polling for them. Each update is verified against the secret token,
+acknowledged right away and processed in a background task, so a slow
+handler (photo upload, Yandex Disk) does not hold up other chats. The number
+of updates processed at once is bounded; when the limit is reached the
+response is delayed, which makes Telegram slow down delivery.
+"""
+import asyncio
+import hmac
+import logging
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('telegram_webhook')
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+metrics.describe('telegram_webhook_updates_total', 'counter', 'Telegram updates received via webhook')
+metrics.describe('telegram_webhook_in_flight', 'gauge', 'Telegram updates being processed')
+
+
+class TelegramWebhook:
+    """Feeds webhook updates into an aiogram dispatcher."""
+
+    def __init__(self, bot: Bot, dispatcher: Dispatcher, secret_token: str = '',
+                 max_concurrency: int = 40):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.secret_token = secret_token
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def verify_secret(self, token: Optional[str]) -> bool:
+        """Check the secret token header; always passes if no secret is set."""
+        if not self.secret_token:
+            return True
+        return hmac.compare_digest((token or '').encode(), self.secret_token.encode())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def _process(self, update: Dict[str, Any]):
+        try:
+            await self.dispatcher.feed_raw_update(self.bot, update)
+            metrics.inc('telegram_webhook_updates_total', outcome='processed')
+        except Exception:
+            metrics.inc('telegram_webhook_updates_total', outcome='failed')
+            logger.exception(f"Failed to process update {update.get('update_id')}")
+        finally:
+            self._semaphore.release()
+
+    async def feed(self, update: Dict[str, Any]) -> asyncio.Task:
+        """Start processing an update in the background; waits while at capacity."""
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        metrics.set('telegram_webhook_in_flight', len(self._tasks))
+
+        def done(finished: asyncio.Task):
+            self._tasks.discard(finished)
+            metrics.set('telegram_webhook_in_flight', len(self._tasks))
+
+        task.add_done_callback(done)
+        return task
+
+    async def register(self, url: str, drop_pending_updates: bool = False) -> bool:
+        """Point Telegram at ``url`` for the update types the dispatcher handles."""
+        registered = await self.bot.set_webhook(
+            url,
+            secret_token=self.secret_token or None,
+            max_connections=self.max_concurrency,
+            allowed_updates=self.dispatcher.resolve_used_update_types(),
+            drop_pending_updates=drop_pending_updates,
+        )
+        logger.info(f"Telegram webhook registered at {url}")
+        return registered
+
+    async def start(self, url: str):
+        """Run dispatcher startup handlers and register the webhook."""
+        await self.dispatcher.emit_startup(bot=self.bot)
+        await self.register(url)
+
+    async def stop(self, timeout: float = 30):
+        """Wait for in-flight updates, then run dispatcher shutdown handlers.
+
+        The webhook itself is left registered: other API workers keep
+        receiving updates, and Telegram queues them while all are down.
+        """
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} Telegram updates to finish")
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        await self.dispatcher.emit_shutdown(bot=self.bot)
+        await self.bot.session.close()
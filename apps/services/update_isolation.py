@@ -0,0 +1,98 @@
+"""Per-user ordering and a global concurrency cap for bot updates.
+
+aiogram processes every update in its own task (polling with
+``handle_as_tasks`` and the webhook both do), so one foreman's slow photo
+upload does not hold up the others. What keeps a single user's FSM
+transitions in order is the dispatcher's event isolation: the FSM middleware
+holds ``lock(key)`` for the user's storage key while the update is handled.
+``UserUpdateIsolation`` is that lock, with three additions over aiogram's
+``SimpleEventIsolation``: at most ``max_concurrency`` updates are handled at
+once across all users, queue depth is exported as metrics, and locks of
+users with nothing queued are dropped instead of kept forever.
+
+A user's updates wait for the user's lock first and a global slot second,
+so updates queued behind a busy user never occupy a slot.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Callable, Dict, Hashable, Optional
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+from apps.services.metrics import metrics
+
+logger = logging.getLogger('update_isolation')
+
+metrics.describe('bot_updates_total', 'counter', 'Bot updates handled under the user lock')
+metrics.describe('bot_updates_queued', 'gauge', 'Bot updates waiting for the user lock or a free slot')
+metrics.describe('bot_updates_in_progress', 'gauge', 'Bot updates being handled')
+metrics.describe('bot_update_wait_seconds_total', 'counter', 'Time bot updates spent queued')
+
+
+class _UserLock:
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Updates holding or waiting for the lock
+        self.users = 0
+
+
+class UserUpdateIsolation(BaseEventIsolation):
+    """Event isolation that serializes updates per user and caps them globally."""
+
+    def __init__(self, max_concurrency: int = 0, clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = (
+            asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        )
+        self._clock = clock
+        self._locks: Dict[Hashable, _UserLock] = {}
+        self.queued = 0
+        self.in_progress = 0
+
+    def _publish(self):
+        metrics.set('bot_updates_queued', self.queued)
+        metrics.set('bot_updates_in_progress', self.in_progress)
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _UserLock()
+        entry.users += 1
+        self.queued += 1
+        self._publish()
+        queued_at = self._clock()
+        started = False
+        acquired_slot = False
+        try:
+            async with entry.lock:
+                if self._semaphore is not None:
+                    await self._semaphore.acquire()
+                    acquired_slot = True
+                started = True
+                self.queued -= 1
+                self.in_progress += 1
+                self._publish()
+                metrics.inc('bot_update_wait_seconds_total', self._clock() - queued_at)
+                try:
+                    yield
+                finally:
+                    self.in_progress -= 1
+                    metrics.inc('bot_updates_total')
+        finally:
+            if acquired_slot:
+                self._semaphore.release()
+            if not started:
+                # Cancelled while still queued
+                self.queued -= 1
+            entry.users -= 1
+            if entry.users == 0:
+                self._locks.pop(key, None)
+            self._publish()
+
+    async def close(self) -> None:
+        self._locks.clear()
@@ -1,22 +1,80 @@
-"""Yandex Disk service for file storage."""
+"""Yandex Disk service for file storage.
+
+All HTTP calls go through a circuit breaker and a bulkhead: while Yandex Disk
+is failing, calls fail fast instead of waiting for timeouts, and a slow
+Yandex Disk can only occupy a bounded number of worker threads. Work that
+can wait (folder links, photo uploads) is put on ``yandex_retry_queue``.
+"""
 import logging
 import re
 import requests
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 
 from apps.config import settings
+from apps.services.circuit_breaker import (
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    DeferredRetryQueue,
+)
 
 logger = logging.getLogger('yandex_disk')
 
 
+class YandexDiskUnavailable(requests.RequestException):
+    """Raised without calling Yandex Disk when the breaker or bulkhead rejects a call."""
+
+
 class YandexDiskService:
     """Service for working with Yandex Disk API."""
 
-    BASE_URL = 'https://cloud-api.yandex.net/v1/disk'
-
     def __init__(self):
         self.token = settings.YANDEX_DISK_TOKEN
         self.base_folder = settings.YANDEX_DISK_BASE_FOLDER
+        self.breaker = CircuitBreaker(
+            'yandex_disk',
+            failure_rate_threshold=settings.YANDEX_BREAKER_FAILURE_RATE,
+            window_size=settings.YANDEX_BREAKER_WINDOW,
+            minimum_calls=settings.YANDEX_BREAKER_MIN_CALLS,
+            open_seconds=settings.YANDEX_BREAKER_OPEN_SECONDS,
+        )
+        self.bulkhead = Bulkhead(
+            'yandex_disk',
+            max_concurrent=settings.YANDEX_BULKHEAD_SIZE,
+            max_wait=settings.YANDEX_BULKHEAD_WAIT_SECONDS,
+        )
+
+    @property
+    def base_url(self) -> str:
+        """Yandex Disk REST API root (overridable to point at a local stand-in)."""
+        return settings.YANDEX_DISK_API_URL.rstrip('/')
+
+    def is_available(self) -> bool:
+        """Whether calls are currently allowed (the breaker is not open)."""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Perform an HTTP call guarded by the bulkhead and the circuit breaker.
+
+        Connection errors, timeouts, 5xx and 429 responses count as failures.
+        """
+        try:
+            with self.bulkhead.acquire():
+                if not self.breaker.allow_request():
+                    raise YandexDiskUnavailable("Yandex Disk circuit is open")
+                try:
+                    response = requests.request(method, url, **kwargs)
+                except requests.RequestException:
+                    self.breaker.record_failure()
+                    raise
+        except BulkheadFullError as exc:
+            raise YandexDiskUnavailable(str(exc)) from exc
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
 
     def _get_headers(self) -> Optional[dict]:
         """Get authorization headers."""
@@ -35,7 +93,7 @@ class YandexDiskService:
             return False
 
         try:
-            response = requests.get(f'{self.BASE_URL}/', headers=headers, timeout=10)
+            response = self._request('GET', f'{self.base_url}/', headers=headers, timeout=10)
             if response.status_code == 200:
                 logger.info("Yandex Disk connection successful")
                 return True
@@ -54,8 +112,9 @@ class YandexDiskService:
             folder_path = '/' + folder_path
 
         try:
-            response = requests.put(
-                f'{self.BASE_URL}/resources',
+            response = self._request(
+                'PUT',
+                f'{self.base_url}/resources',
                 headers=headers,
                 params={'path': folder_path},
                 timeout=10
@@ -82,8 +141,9 @@ class YandexDiskService:
 
         try:
             # Publish the folder
-            publish_response = requests.put(
-                f'{self.BASE_URL}/resources/publish',
+            publish_response = self._request(
+                'PUT',
+                f'{self.base_url}/resources/publish',
                 headers=headers,
                 params={'path': folder_path},
                 timeout=10
@@ -93,8 +153,9 @@ class YandexDiskService:
                 return None
 
             # Get public URL
-            info_response = requests.get(
-                f'{self.BASE_URL}/resources',
+            info_response = self._request(
+                'GET',
+                f'{self.base_url}/resources',
                 headers=headers,
                 params={'path': folder_path, 'fields': 'public_url'},
                 timeout=10
@@ -111,16 +172,29 @@ class YandexDiskService:
             logger.error(f"Error publishing folder: {exc}")
         return None
 
-    def upload_file(self, file_data: bytes, file_path: str) -> Optional[str]:
-        """Upload a file to Yandex Disk and return public URL."""
+    def upload_file(self, file_data: Union[bytes, BinaryIO], file_path: str) -> Optional[str]:
+        """Upload a file to Yandex Disk and return public URL.
+
+        ``file_data`` may be raw bytes or a binary file object; file objects
+        are streamed to the upload URL instead of being read into memory.
+        """
+        info = self.upload_file_info(file_data, file_path)
+        return info['public_url'] if info else None
+
+    def upload_file_info(self, file_data: Union[bytes, BinaryIO], file_path: str) -> Optional[dict]:
+        """Upload and publish a file; return its public URL and preview (thumbnail) URL."""
         headers = self._get_headers()
         if not headers:
             return None
 
+        if hasattr(file_data, 'seek'):
+            file_data.seek(0)
+
         try:
             # Get upload URL
-            response = requests.get(
-                f'{self.BASE_URL}/resources/upload',
+            response = self._request(
+                'GET',
+                f'{self.base_url}/resources/upload',
                 headers=headers,
                 params={'path': file_path, 'overwrite': 'true'},
                 timeout=10
@@ -135,33 +209,39 @@ class YandexDiskService:
                 return None
 
             # Upload file
-            upload_response = requests.put(href, data=file_data, timeout=60)
+            upload_response = self._request('PUT', href, data=file_data, timeout=60)
             if upload_response.status_code != 201:
                 logger.error(f"Failed to upload file: {upload_response.status_code}")
                 return None
 
             # Publish file
-            publish_response = requests.put(
-                f'{self.BASE_URL}/resources/publish',
+            publish_response = self._request(
+                'PUT',
+                f'{self.base_url}/resources/publish',
                 headers=headers,
                 params={'path': file_path},
                 timeout=10
             )
             if publish_response.status_code != 200:
                 logger.warning(f"Failed to publish file: {publish_response.status_code}")
-                return file_path
+                return {'public_url': file_path, 'thumbnail_url': None}
 
-            # Get public URL
-            info_response = requests.get(
-                f'{self.BASE_URL}/resources',
+            # Get public URL and preview
+            info_response = self._request(
+                'GET',
+                f'{self.base_url}/resources',
                 headers=headers,
-                params={'path': file_path, 'fields': 'public_url'},
+                params={'path': file_path, 'fields': 'public_url,preview', 'preview_size': 'M'},
                 timeout=10
             )
             if info_response.status_code == 200:
-                return self._sanitize_url(info_response.json().get('public_url'))
+                info = info_response.json()
+                return {
+                    'public_url': self._sanitize_url(info.get('public_url')),
+                    'thumbnail_url': info.get('preview'),
+                }
 
-            return file_path
+            return {'public_url': file_path, 'thumbnail_url': None}
         except requests.RequestException as exc:
             logger.error(f"Error uploading file: {exc}")
         return None
@@ -181,30 +261,30 @@ class YandexDiskService:
         safe = re.sub(r'[^\w\-]', '_', component or '')
         return safe or 'unknown'
 
+    def report_folder_path(self, foreman_name: str, foreman_id: int, report_date: str) -> str:
+        """Disk path of the folder holding a foreman's photos for a date."""
+        safe_base = self.sanitize_folder_component(self.base_folder)
+        safe_date = self.sanitize_folder_component(report_date)
+        safe_foreman = self.sanitize_folder_component(foreman_name)
+        return f"/{safe_base}/{safe_date}/{safe_foreman}_ID_{foreman_id}"
+
     def ensure_report_folder(self, foreman_name: str, foreman_id: int, report_date: str) -> Optional[str]:
         """Create and publish a folder structure for a report."""
         if not self.check_connection():
             return None
 
-        safe_foreman = self.sanitize_folder_component(foreman_name)
-        safe_date = self.sanitize_folder_component(report_date)
-        safe_base = self.sanitize_folder_component(self.base_folder)
-
-        # Create folder structure
-        base_path = f"/{safe_base}"
-        if not self.create_folder(base_path):
-            return None
-
-        date_path = f"{base_path}/{safe_date}"
-        if not self.create_folder(date_path):
-            return None
-
-        foreman_path = f"{date_path}/{safe_foreman}_ID_{foreman_id}"
-        if not self.create_folder(foreman_path):
-            return None
+        # Create folder structure: base, date, foreman
+        foreman_path = self.report_folder_path(foreman_name, foreman_id, report_date)
+        parts = foreman_path.strip('/').split('/')
+        for depth in range(1, len(parts) + 1):
+            if not self.create_folder('/' + '/'.join(parts[:depth])):
+                return None
 
         return self.publish_folder(foreman_path)
 
 
 # Global service instance
 yandex_disk_service = YandexDiskService()
+
+# Uploads and folder links postponed while Yandex Disk is unavailable
+yandex_retry_queue = DeferredRetryQueue('yandex_disk', breaker=yandex_disk_service.breaker)
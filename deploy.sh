@@ -56,6 +56,8 @@ fi
 # 4. Копирование файлов
 echo -e "\n${YELLOW}[4/7] Копирование файлов приложения...${NC}"
 sudo cp -r "$SCRIPT_DIR/apps/"* "$APP_DIR/"
+# Пакет apps нужен боту для общих сервисов (from apps.services ...)
+sudo cp -r "$SCRIPT_DIR/apps" "$APP_DIR/"
 sudo cp "$SCRIPT_DIR/requirements.txt" "$APP_DIR/"
 echo -e "${GREEN}✓ Файлы скопированы${NC}"
 
@@ -0,0 +1,169 @@
+"""Offline end-to-end benchmark of report submission with photos.
+
+Runs against a local fake Yandex Disk with configurable latency and error
+rate, and a temporary SQLite database. Each submission follows the bot path:
+create the foreman's report folder, upload photos through the photo
+registry, create the report via the API and link the photos to it.
+
+Usage::
+
+    python scripts/benchmark_report_submission.py --reports 50 --concurrency 10 \
+        --photos 2 --latency 0.15 --upload-latency 0.4
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_db_fd)
+os.environ['DATABASE_PATH'] = _db_path
+os.environ.setdefault('YANDEX_DISK_TOKEN', 'benchmark-token')
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from apps.config import settings  # noqa: E402
+from apps.database import get_db, init_database  # noqa: E402
+from apps.main import app  # noqa: E402
+from apps.services.photo_registry import photo_registry, spool_chunks  # noqa: E402
+from apps.services.yandex_disk import yandex_disk_service  # noqa: E402
+from tests.fakes.yandex_disk import FakeYandexDiskConfig, FakeYandexDiskServer  # noqa: E402
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def seed_database():
+    """Create one work and one foreman; returns their ids."""
+    await init_database()
+    async with get_db() as db:
+        cursor = await db.execute(
+            "INSERT INTO works (name, category, unit, balance, is_active) VALUES (?, ?, ?, ?, 1)",
+            ('Кладка кирпича', 'Кладка', 'м3', 1_000_000.0)
+        )
+        work_id = cursor.lastrowid
+        foreman_id = 1001
+        await db.execute(
+            "INSERT INTO foremen (id, first_name, last_name, username, registration_date, is_active) "
+            "VALUES (?, ?, ?, ?, ?, 1)",
+            (foreman_id, 'Иван Иванов', 'Бригадир', 'ivan', time.strftime('%Y-%m-%d %H:%M:%S'))
+        )
+        await db.commit()
+    return work_id, foreman_id
+
+
+async def submit_report(client, work_id, foreman_id, photos, photo_size, index):
+    """One bot-style report submission; returns elapsed seconds."""
+    started = time.perf_counter()
+    report_date = time.strftime('%Y-%m-%d')
+    folder_url = await asyncio.to_thread(
+        yandex_disk_service.ensure_report_folder, 'Иван Иванов', foreman_id, report_date
+    )
+    folder_path = yandex_disk_service.report_folder_path('Иван Иванов', foreman_id, report_date)
+
+    stored = []
+    for photo_index in range(photos):
+        spooled = spool_chunks([random.randbytes(photo_size)])
+        try:
+            result = await photo_registry.store(spooled, folder_path, f"{index}_{photo_index}.jpg")
+        finally:
+            spooled.close()
+        if result:
+            stored.append(result)
+
+    response = await client.post('/api/work-reports', json={
+        'foreman_id': foreman_id,
+        'work_id': work_id,
+        'quantity': 1.0,
+        'photo_report_url': folder_url or '',
+    })
+    response.raise_for_status()
+    await photo_registry.link_many(response.json()['id'], stored)
+    return time.perf_counter() - started, len(stored) == photos and bool(folder_url)
+
+
+async def run(args):
+    config = FakeYandexDiskConfig(
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        upload_latency=args.upload_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    random.seed(args.seed)
+    with FakeYandexDiskServer(config) as server:
+        settings.YANDEX_DISK_API_URL = server.api_url
+        work_id, foreman_id = await seed_database()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        transport = ASGITransport(app=app)
+
+        async with AsyncClient(transport=transport, base_url='http://bench') as client:
+            async def worker(index):
+                async with semaphore:
+                    return await submit_report(
+                        client, work_id, foreman_id, args.photos, args.photo_size, index
+                    )
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(worker(i) for i in range(args.reports)))
+            elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, _ in results]
+        return {
+            'reports': args.reports,
+            'concurrency': args.concurrency,
+            'photos_per_report': args.photos,
+            'fake_latency_s': args.latency,
+            'fake_upload_latency_s': args.upload_latency,
+            'fake_error_rate': args.error_rate,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(args.reports / elapsed, 2),
+            'incomplete': sum(1 for _, complete in results if not complete),
+            'latency_s': {
+                'mean': round(statistics.mean(latencies), 4),
+                'p50': round(percentile(latencies, 50), 4),
+                'p90': round(percentile(latencies, 90), 4),
+                'p99': round(percentile(latencies, 99), 4),
+                'max': round(max(latencies), 4),
+            },
+            'yandex_calls': len(server.disk.state.requests),
+            'yandex_errors_injected': server.disk.state.errors_injected,
+            'breaker': yandex_disk_service.breaker.snapshot(),
+            'bulkhead': yandex_disk_service.bulkhead.snapshot(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--reports', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--photos', type=int, default=1, help='Photos per report')
+    parser.add_argument('--photo-size', type=int, default=200 * 1024, help='Bytes per photo')
+    parser.add_argument('--latency', type=float, default=0.1, help='Fake API latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Random extra latency, seconds')
+    parser.add_argument('--upload-latency', type=float, default=0.3, help='Fake upload latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    try:
+        print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+    finally:
+        os.unlink(_db_path)
+
+
+if __name__ == '__main__':
+    main()
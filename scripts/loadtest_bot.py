@@ -0,0 +1,384 @@
+"""Offline load test of the Telegram bot with simulated foremen.
+
+Runs ``apps/bot.py`` against a local fake Telegram Bot API and a fake
+Yandex Disk, with a temporary SQLite database. Each simulated foreman goes
+through the full report flow: ``/start`` → report menu → category → work
+(inline button) → quantity → photos → save → finish. Latency is measured
+from sending an update to the bot's reply, per step.
+
+The bot either long-polls the fake (``--mode polling``, as ``bot.py`` runs
+in production) or is served by the API app in webhook mode, with the fake
+POSTing updates to it (``--mode webhook``). The result is printed as JSON
+(and written to ``--output``) so runs can be compared.
+
+Usage::
+
+    python scripts/loadtest_bot.py --foremen 50 --reports 2 --photos 1 \
+        --tg-latency 0.05 --upload-latency 0.3 --output loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import secrets
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tests.fakes.telegram import FakeTelegramConfig, FakeTelegramServer  # noqa: E402
+from tests.fakes.yandex_disk import (  # noqa: E402
+    FakeYandexDiskConfig, FakeYandexDiskServer, _free_port
+)
+
+FOREMAN_ID_BASE = 10_000
+
+# Step name, the text sent and a check for the bot's reply
+REPORT_STEPS = (
+    ('start', '/start', lambda text: 'Добро пожаловать' in text),
+    ('open_report', '📊 Сформировать отчет', lambda text: 'Выберите раздел' in text),
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean': round(statistics.mean(latencies), 4),
+        'p50': round(percentile(latencies, 50), 4),
+        'p90': round(percentile(latencies, 90), 4),
+        'p99': round(percentile(latencies, 99), 4),
+        'max': round(max(latencies), 4),
+    }
+
+
+class LogCounter(logging.Handler):
+    """Counts error log records and SQLite lock errors across all loggers."""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.errors = 0
+        self.db_locked = 0
+
+    def emit(self, record):
+        text = record.getMessage()
+        if record.exc_info:
+            text += str(record.exc_info[1])
+        if 'database is locked' in text or 'database table is locked' in text:
+            self.db_locked += 1
+        if record.levelno >= logging.ERROR:
+            self.errors += 1
+
+
+def configure_environment(args, workdir: Path, telegram_url: str, api_port: int):
+    """Point the bot at the fakes and a scratch database before it is imported."""
+    os.environ.update({
+        'BOT_TOKEN': f'{secrets.randbelow(10**9)}:LOADTEST{secrets.token_hex(8)}',
+        'TELEGRAM_API_URL': telegram_url,
+        'DATABASE_PATH': str(workdir / 'loadtest.db'),
+        'BOT_FSM_DB_PATH': str(workdir / 'bot_fsm.db'),
+        'BOT_OUTBOX_DB_PATH': str(workdir / 'bot_outbox.db'),
+        'LOG_FILE': str(workdir / 'bot.log'),
+        'LOG_LEVEL': args.log_level,
+        'YANDEX_DISK_TOKEN': 'loadtest-token',
+        'MANAGER_USER_IDS': '',
+        'MANAGER_DIGEST_TIME': '',
+        'BOT_MAX_CONCURRENT_UPDATES': str(args.max_concurrent_updates),
+    })
+    if args.mode == 'webhook':
+        os.environ['BOT_WEBHOOK_URL'] = f'http://127.0.0.1:{api_port}'
+        os.environ['BOT_WEBHOOK_SECRET'] = secrets.token_hex(16)
+    else:
+        os.environ['BOT_WEBHOOK_URL'] = ''
+
+
+async def seed_database(foremen: int, categories: int, works_per_category: int):
+    """Create the catalog and registered foremen assigned to every category."""
+    from apps.database import get_db, init_database
+
+    await init_database()
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    async with get_db() as db:
+        category_ids = []
+        for index in range(categories):
+            cursor = await db.execute(
+                "INSERT INTO categories (name, created_date) VALUES (?, ?)", (f'Раздел {index + 1}', now)
+            )
+            category_ids.append(cursor.lastrowid)
+            await db.executemany(
+                "INSERT INTO works (name, category, unit, balance, is_active) VALUES (?, ?, ?, ?, 1)",
+                [(f'Работа {index + 1}.{work + 1}', f'Раздел {index + 1}', 'м2', 1_000_000.0)
+                 for work in range(works_per_category)]
+            )
+        foreman_ids = [FOREMAN_ID_BASE + index for index in range(foremen)]
+        await db.executemany(
+            "INSERT INTO foremen (id, first_name, last_name, username, registration_date, is_active) "
+            "VALUES (?, ?, ?, ?, ?, 1)",
+            [(foreman_id, f'Бригадир {foreman_id}', 'Прораб', f'foreman{foreman_id}', now)
+             for foreman_id in foreman_ids]
+        )
+        await db.executemany(
+            "INSERT INTO foreman_sections (foreman_id, category_id) VALUES (?, ?)",
+            [(foreman_id, category_id) for foreman_id in foreman_ids for category_id in category_ids]
+        )
+        await db.commit()
+    return foreman_ids
+
+
+class Foreman:
+    """One simulated foreman talking to the bot through the fake Telegram."""
+
+    def __init__(self, telegram, user_id: int, args, rng: random.Random, latencies: dict):
+        self.telegram = telegram
+        self.user_id = user_id
+        self.args = args
+        self.rng = rng
+        self.latencies = latencies
+
+    async def _step(self, name, send, check):
+        """Send an update and wait for the reply passing ``check``; returns it."""
+        seen = len(self.telegram.messages(self.user_id))
+        started = time.perf_counter()
+        await send()
+        try:
+            reply = await self.telegram.wait_for(
+                self.user_id, lambda message: check(message.text), after=seen, timeout=self.args.step_timeout
+            )
+        except asyncio.TimeoutError:
+            raise RuntimeError(f'{name}: no reply within {self.args.step_timeout}s')
+        self.latencies.setdefault(name, []).append(reply.at - started)
+        if self.args.think_time:
+            await asyncio.sleep(self.rng.uniform(0, self.args.think_time))
+        return reply
+
+    def _text(self, text):
+        return lambda: self.telegram.send_text(self.user_id, text)
+
+    async def run_report(self):
+        for name, text, check in REPORT_STEPS:
+            await self._step(name, self._text(text), check)
+
+        category = f'Раздел {self.rng.randint(1, self.args.categories)}'
+        works_message = await self._step(
+            'category', self._text(category), lambda text: text.startswith('Выберите выполненную работу')
+        )
+        buttons = [button['callback_data']
+                   for row in works_message.reply_markup['inline_keyboard'] for button in row
+                   if button['callback_data'].startswith('work:pick:')]
+        await self._step(
+            'work',
+            lambda: self.telegram.press_button(self.user_id, works_message, self.rng.choice(buttons)),
+            lambda text: 'Выбрана работа' in text,
+        )
+        await self._step('quantity', self._text('1'), lambda text: 'фотоотчет' in text)
+
+        if self.args.photos:
+            await self._step('photo_mode', self._text('📸 Прикрепить фото'),
+                             lambda text: 'отправьте фотографию' in text)
+            for _ in range(self.args.photos):
+                content = self.rng.randbytes(self.args.photo_size)
+                await self._step(
+                    'photo',
+                    lambda: self.telegram.send_photo(self.user_id, content),
+                    lambda text: 'Добавлено фото' in text or 'недоступен' in text or text.startswith('❌'),
+                )
+            save = self._text('✅ Завершить добавление фото')
+        else:
+            save = self._text('➡️ Пропустить фото')
+        saved = await self._step('save', save, lambda text: 'добавлена в отчет' in text or text.startswith('❌'))
+        if saved.text.startswith('❌'):
+            raise RuntimeError(f'save: {saved.text.splitlines()[0]}')
+        await self._step('finish', self._text('📤 Завершить отчет'), lambda text: 'Отчет завершен' in text)
+
+    async def run(self, start_delay: float):
+        """Run the report flow ``--reports`` times; returns (completed, failures)."""
+        await asyncio.sleep(start_delay)
+        completed, failures = 0, []
+        for _ in range(self.args.reports):
+            started = time.perf_counter()
+            try:
+                await self.run_report()
+            except Exception as e:
+                failures.append(str(e))
+                continue
+            completed += 1
+            self.latencies.setdefault('flow', []).append(time.perf_counter() - started)
+        return completed, failures
+
+
+async def start_bot(args):
+    """Start the bot in the requested mode; returns a coroutine function stopping it."""
+    if args.mode == 'webhook':
+        import uvicorn
+        from apps.main import app
+
+        server = uvicorn.Server(uvicorn.Config(
+            app, host='127.0.0.1', port=args.api_port, log_level='warning', lifespan='on',
+        ))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            if task.done():
+                task.result()
+            await asyncio.sleep(0.01)
+
+        async def stop():
+            server.should_exit = True
+            await task
+        return stop
+
+    from apps import bot as bot_module
+    from apps.services.yandex_disk import yandex_retry_queue
+
+    await bot_module.on_startup()
+    retry_task = asyncio.create_task(yandex_retry_queue.run(bot_module.settings.YANDEX_RETRY_INTERVAL_SECONDS))
+    polling = asyncio.create_task(bot_module.dp.start_polling(
+        bot_module.bot, handle_signals=False, polling_timeout=1,
+    ))
+
+    async def stop():
+        await bot_module.dp.stop_polling()
+        await polling
+        retry_task.cancel()
+        await bot_module.change_watcher.stop()
+    return stop
+
+
+async def run(args, workdir: Path):
+    telegram_config = FakeTelegramConfig(
+        latency=args.tg_latency, latency_jitter=args.jitter, file_latency=args.file_latency, seed=args.seed,
+    )
+    yandex_config = FakeYandexDiskConfig(
+        latency=args.yandex_latency, latency_jitter=args.jitter,
+        upload_latency=args.upload_latency, error_rate=args.error_rate, seed=args.seed,
+    )
+    log_counter = LogCounter()
+    logging.getLogger().addHandler(log_counter)
+
+    async with FakeTelegramServer(telegram_config) as telegram_server:
+        with FakeYandexDiskServer(yandex_config) as yandex_server:
+            args.api_port = _free_port()
+            configure_environment(args, workdir, telegram_server.api_url, args.api_port)
+            from apps.config import settings
+            from apps.services.metrics import metrics
+            settings.YANDEX_DISK_API_URL = yandex_server.api_url
+
+            foreman_ids = await seed_database(args.foremen, args.categories, args.works)
+            stop_bot = await start_bot(args)
+            telegram = telegram_server.telegram
+            latencies: dict = {}
+            rng = random.Random(args.seed)
+            foremen = [
+                Foreman(telegram, user_id, args, random.Random(rng.random()), latencies)
+                for user_id in foreman_ids
+            ]
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                foreman.run(args.ramp_up * index / max(1, len(foremen)))
+                for index, foreman in enumerate(foremen)
+            ))
+            elapsed = time.perf_counter() - started
+            await stop_bot()
+
+            from apps.database import get_db
+            async with get_db() as db:
+                async with db.execute("SELECT COUNT(*) FROM work_reports") as cursor:
+                    reports_saved = (await cursor.fetchone())[0]
+
+    logging.getLogger().removeHandler(log_counter)
+    completed = sum(done for done, _ in results)
+    failures = Counter(reason.split(':')[0] for _, reasons in results for reason in reasons)
+    step_names = ['start', 'open_report', 'category', 'work', 'quantity', 'photo_mode', 'photo', 'save', 'finish']
+    return {
+        'scenario': 'report_flow',
+        'mode': args.mode,
+        'foremen': args.foremen,
+        'reports_per_foreman': args.reports,
+        'photos_per_report': args.photos,
+        'max_concurrent_updates': args.max_concurrent_updates,
+        'fake': {
+            'telegram_latency_s': args.tg_latency,
+            'yandex_latency_s': args.yandex_latency,
+            'upload_latency_s': args.upload_latency,
+            'file_latency_s': args.file_latency,
+            'jitter_s': args.jitter,
+            'yandex_error_rate': args.error_rate,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'flows': {
+            'completed': completed,
+            'failed': args.foremen * args.reports - completed,
+            'failures_by_step': dict(failures),
+        },
+        'reports_saved': reports_saved,
+        'reports_per_s': round(reports_saved / elapsed, 2) if elapsed else None,
+        'flow_latency_s': summarize(latencies.get('flow', [])),
+        'step_latency_s': {name: summarize(latencies[name]) for name in step_names if name in latencies},
+        'db_lock_errors': log_counter.db_locked,
+        'error_logs': log_counter.errors,
+        'submissions': {
+            outcome: metrics.get('bot_submissions_total', outcome=outcome)
+            for outcome in ('stored', 'retried', 'rejected')
+        },
+        'telegram_requests': dict(Counter(telegram.state.requests)),
+        'yandex_calls': len(yandex_server.disk.state.requests),
+        'yandex_errors_injected': yandex_server.disk.state.errors_injected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    parser.add_argument('--foremen', type=int, default=10, help='Simulated foremen working at once')
+    parser.add_argument('--reports', type=int, default=1, help='Report flows per foreman')
+    parser.add_argument('--photos', type=int, default=1, help='Photos per report')
+    parser.add_argument('--photo-size', type=int, default=100 * 1024, help='Bytes per photo')
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--works', type=int, default=20, help='Works per category')
+    parser.add_argument('--tg-latency', type=float, default=0.02, help='Fake Bot API latency, seconds')
+    parser.add_argument('--file-latency', type=float, default=0.05, help='Fake file download latency, seconds')
+    parser.add_argument('--yandex-latency', type=float, default=0.05, help='Fake Yandex Disk latency, seconds')
+    parser.add_argument('--upload-latency', type=float, default=0.2, help='Fake upload latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Random extra latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of Yandex Disk calls failing')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Max pause between user steps, seconds')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='Seconds over which foremen start')
+    parser.add_argument('--step-timeout', type=float, default=60.0)
+    parser.add_argument('--max-concurrent-updates', type=int, default=32)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the JSON result to this file')
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='bot-loadtest-'))
+    try:
+        result = asyncio.run(run(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    if result['flows']['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,8 @@ os.environ['YANDEX_DISK_TOKEN'] = 'test_token'
 
 from apps.main import app
 from apps.database import init_database, get_db
+from apps.services.response_cache import response_cache
+from tests.fakes.yandex_disk import FakeYandexDiskConfig, FakeYandexDiskServer
 
 
 @pytest.fixture(scope="session")
@@ -39,6 +41,7 @@ async def test_db():
     settings.DATABASE_PATH = path
 
     await init_database()
+    response_cache.clear()
     yield path
 
     # Cleanup
@@ -56,6 +59,30 @@ async def client(test_db) -> AsyncGenerator[AsyncClient, None]:
         yield ac
 
 
+@pytest.fixture(scope="session")
+def fake_yandex_disk_server():
+    """Local Yandex Disk API stand-in shared by the test session."""
+    with FakeYandexDiskServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_yandex_disk(fake_yandex_disk_server, monkeypatch):
+    """Point YandexDiskService at a clean fake Yandex Disk.
+
+    Yields the fake disk; tests may change ``fake_yandex_disk.config`` to add
+    latency, errors or throttling.
+    """
+    from apps.config import settings
+    from apps.services.yandex_disk import yandex_disk_service
+
+    fake_yandex_disk_server.disk.reset(FakeYandexDiskConfig(seed=0))
+    monkeypatch.setattr(settings, 'YANDEX_DISK_API_URL', fake_yandex_disk_server.api_url)
+    yandex_disk_service.breaker.reset()
+    yield fake_yandex_disk_server.disk
+    yandex_disk_service.breaker.reset()
+
+
 @pytest.fixture
 def sample_work_data():
     """Sample work data for tests."""
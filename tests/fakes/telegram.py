@@ -0,0 +1,332 @@
+"""Local stand-in for the Telegram Bot API.
+
+Implements what ``apps/bot.py`` calls: ``getMe``, ``getUpdates`` (long
+polling), ``setWebhook``/``deleteWebhook`` (updates are then POSTed to the
+webhook instead), ``sendMessage``, ``sendDocument``, message editing,
+``answerCallbackQuery``, ``getFile`` and file downloads. Tests and the load
+driver play the users: they push updates with ``send_text``, ``send_photo``
+and ``press_button`` and wait for the bot's replies with ``wait_for``.
+
+The server must run on the same event loop as the code waiting for replies
+(see ``FakeTelegramServer``); the bot may run there too or elsewhere.
+"""
+import asyncio
+import itertools
+import json
+import random
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from tests.fakes.yandex_disk import _free_port
+
+BOT_ID = 424242
+
+
+@dataclass
+class FakeTelegramConfig:
+    """Behaviour knobs for the fake server."""
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    file_latency: float = 0.0
+    seed: Optional[int] = None
+
+
+@dataclass
+class SentMessage:
+    """A message the bot sent (or edited) in a chat."""
+    message_id: int
+    chat_id: int
+    method: str
+    text: str
+    reply_markup: Optional[dict]
+    at: float
+
+
+@dataclass
+class FakeTelegramState:
+    """Pending updates, sent messages, files and the request log."""
+    updates: List[dict] = field(default_factory=list)
+    messages: Dict[int, List[SentMessage]] = field(default_factory=dict)
+    files: Dict[str, bytes] = field(default_factory=dict)
+    webhook_url: str = ''
+    webhook_secret: str = ''
+    requests: List[str] = field(default_factory=list)
+    webhook_failures: int = 0
+
+
+def _ok(result: Any) -> JSONResponse:
+    return JSONResponse({'ok': True, 'result': result})
+
+
+def _error(status: int, description: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={
+        'ok': False, 'error_code': status, 'description': description,
+    })
+
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+
+class FakeTelegram:
+    """ASGI app emulating the Bot API for one bot, plus its mutable state."""
+
+    def __init__(self, config: Optional[FakeTelegramConfig] = None):
+        self.config = config or FakeTelegramConfig()
+        self.state = FakeTelegramState()
+        self._random = random.Random(self.config.seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._updates_ready = asyncio.Event()
+        self._replies = asyncio.Condition()
+        self._webhook_client: Optional[httpx.AsyncClient] = None
+        self.app = self._build_app()
+
+    # ---- user side ----
+
+    def _message(self, chat_id: int, **content) -> dict:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': _user(chat_id),
+            **content,
+        }
+
+    async def push_update(self, update: dict) -> int:
+        """Deliver an update: via the webhook if one is set, otherwise to getUpdates."""
+        update_id = next(self._update_ids)
+        update = {'update_id': update_id, **update}
+        if self.state.webhook_url:
+            await self._deliver(update)
+        else:
+            self.state.updates.append(update)
+            self._updates_ready.set()
+        return update_id
+
+    async def _deliver(self, update: dict):
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=60)
+        headers = {}
+        if self.state.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.state.webhook_secret
+        response = await self._webhook_client.post(self.state.webhook_url, json=update, headers=headers)
+        if response.status_code != 200:
+            self.state.webhook_failures += 1
+
+    async def send_text(self, user_id: int, text: str) -> int:
+        """The user sends a text message (commands included)."""
+        content = {'text': text}
+        if text.startswith('/'):
+            command = text.split()[0]
+            content['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return await self.push_update({'message': self._message(user_id, **content)})
+
+    def add_file(self, content: bytes) -> str:
+        """Store a file as if a user had uploaded it; returns its file_id."""
+        file_id = secrets.token_hex(12)
+        self.state.files[file_id] = content
+        return file_id
+
+    async def send_photo(self, user_id: int, content: bytes) -> int:
+        """The user sends a photo."""
+        file_id = self.add_file(content)
+        photo = {'file_id': file_id, 'file_unique_id': file_id[:8], 'width': 1280, 'height': 960,
+                 'file_size': len(content)}
+        return await self.push_update({'message': self._message(user_id, photo=[photo])})
+
+    async def press_button(self, user_id: int, message: SentMessage, callback_data: str) -> int:
+        """The user presses an inline button of a message the bot sent."""
+        return await self.push_update({'callback_query': {
+            'id': secrets.token_hex(6),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': callback_data,
+            'message': {
+                'message_id': message.message_id,
+                'date': int(time.time()),
+                'chat': {'id': message.chat_id, 'type': 'private'},
+                'text': message.text,
+            },
+        }})
+
+    def messages(self, chat_id: int) -> List[SentMessage]:
+        return self.state.messages.get(chat_id, [])
+
+    async def wait_for(self, chat_id: int, predicate: Callable[[SentMessage], bool],
+                       after: int = 0, timeout: float = 30) -> SentMessage:
+        """Wait for a bot message in the chat, among those after index ``after``."""
+        async def matched():
+            async with self._replies:
+                while True:
+                    for message in self.messages(chat_id)[after:]:
+                        if predicate(message):
+                            return message
+                    await self._replies.wait()
+        return await asyncio.wait_for(matched(), timeout)
+
+    # ---- bot side ----
+
+    async def _record(self, chat_id: int, method: str, text: str, reply_markup: Optional[dict],
+                      message_id: Optional[int] = None) -> SentMessage:
+        message = SentMessage(
+            message_id=message_id or next(self._message_ids), chat_id=chat_id, method=method,
+            text=text, reply_markup=reply_markup, at=time.perf_counter(),
+        )
+        async with self._replies:
+            self.state.messages.setdefault(chat_id, []).append(message)
+            self._replies.notify_all()
+        return message
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        self.state.updates = [u for u in self.state.updates if u['update_id'] >= offset]
+        if not self.state.updates and timeout:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.state.updates[:limit]
+
+    async def _call(self, method: str, params: dict):
+        method = method.lower()
+        if method == 'getme':
+            return _ok({'id': BOT_ID, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'})
+        if method == 'getupdates':
+            if self.state.webhook_url:
+                return _error(409, "Conflict: can't use getUpdates method while webhook is active")
+            return _ok(await self._get_updates(params))
+        if method == 'setwebhook':
+            self.state.webhook_url = params.get('url', '')
+            self.state.webhook_secret = params.get('secret_token', '')
+            return _ok(True)
+        if method == 'deletewebhook':
+            self.state.webhook_url = ''
+            self.state.webhook_secret = ''
+            return _ok(True)
+        if method in ('sendmessage', 'senddocument'):
+            chat_id = int(params['chat_id'])
+            text = params.get('text') or params.get('caption') or ''
+            markup = json.loads(params['reply_markup']) if params.get('reply_markup') else None
+            sent = await self._record(chat_id, method, text, markup)
+            result = {
+                'message_id': sent.message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'FakeBot'},
+            }
+            if method == 'sendmessage':
+                result['text'] = text
+            else:
+                result['document'] = {'file_id': secrets.token_hex(8), 'file_unique_id': secrets.token_hex(4)}
+            return _ok(result)
+        if method in ('editmessagereplymarkup', 'editmessagetext'):
+            chat_id = int(params['chat_id'])
+            markup = json.loads(params['reply_markup']) if params.get('reply_markup') else None
+            await self._record(chat_id, method, params.get('text', ''), markup,
+                               message_id=int(params['message_id']))
+            return _ok(True)
+        if method == 'answercallbackquery':
+            return _ok(True)
+        if method == 'getfile':
+            file_id = params['file_id']
+            if file_id not in self.state.files:
+                return _error(400, 'Bad Request: invalid file_id')
+            return _ok({'file_id': file_id, 'file_unique_id': file_id[:8],
+                        'file_size': len(self.state.files[file_id]), 'file_path': f'photos/{file_id}.jpg'})
+        return _error(404, f'Not Found: method {method} is not emulated')
+
+    async def _delay(self, base: float):
+        delay = base
+        if self.config.latency_jitter:
+            delay += self._random.uniform(0, self.config.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Telegram Bot API")
+
+        @app.api_route('/bot{token}/{method}', methods=['GET', 'POST'])
+        async def bot_method(token: str, method: str, request: Request):
+            self.state.requests.append(method)
+            if method.lower() != 'getupdates':
+                await self._delay(self.config.latency)
+            if request.headers.get('content-type', '').startswith('application/json'):
+                params = await request.json()
+            else:
+                params = {key: value for key, value in (await request.form()).items()
+                          if isinstance(value, str)}
+            params.update(request.query_params)
+            return await self._call(method, params)
+
+        @app.get('/file/bot{token}/{path:path}')
+        async def download(token: str, path: str):
+            self.state.requests.append('file')
+            await self._delay(self.config.file_latency)
+            file_id = path.rsplit('/', 1)[-1].split('.', 1)[0]
+            content = self.state.files.get(file_id)
+            if content is None:
+                return _error(404, 'Not Found')
+            return Response(content, media_type='image/jpeg')
+
+        return app
+
+    async def close(self):
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
+
+
+class FakeTelegramServer:
+    """Runs a ``FakeTelegram`` with uvicorn as a task on the current event loop.
+
+    Replies are awaited on this loop, so unlike ``FakeYandexDiskServer`` it is
+    not started in a thread.
+    """
+
+    def __init__(self, config: Optional[FakeTelegramConfig] = None,
+                 host: str = '127.0.0.1', port: Optional[int] = None):
+        self.telegram = FakeTelegram(config)
+        self.host = host
+        self.port = port or _free_port()
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.telegram.app, host=self.host, port=self.port, log_level='warning', lifespan='off',
+        ))
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def api_url(self) -> str:
+        """Value for the bot's ``TELEGRAM_API_URL``."""
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self) -> 'FakeTelegramServer':
+        self._task = asyncio.create_task(self._server.serve())
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if self._task.done() or time.monotonic() > deadline:
+                raise RuntimeError('Fake Telegram server did not start')
+            await asyncio.sleep(0.01)
+        return self
+
+    async def stop(self):
+        await self.telegram.close()
+        self._server.should_exit = True
+        # Release a pending long poll so the server can shut down
+        self.telegram._updates_ready.set()
+        if self._task is not None:
+            await self._task
+
+    async def __aenter__(self) -> 'FakeTelegramServer':
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
@@ -0,0 +1,268 @@
+"""Local stand-in for the Yandex Disk REST API.
+
+Implements the subset of ``/v1/disk`` used by ``YandexDiskService``:
+disk info, folder creation, resource info, upload links and publishing.
+Latency, error rate and throttling are configurable so the client can be
+tested and benchmarked offline under realistic or hostile conditions.
+
+Run standalone::
+
+    python -m tests.fakes.yandex_disk --port 8765 --latency 0.2 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+API_PREFIX = '/v1/disk'
+
+
+@dataclass
+class FakeYandexDiskConfig:
+    """Behaviour knobs for the fake server."""
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    upload_latency: float = 0.0
+    error_rate: float = 0.0
+    max_requests_per_second: Optional[float] = None
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeYandexDiskState:
+    """In-memory disk contents and request log."""
+    folders: Set[str] = field(default_factory=lambda: {'/'})
+    files: Dict[str, bytes] = field(default_factory=dict)
+    published: Dict[str, str] = field(default_factory=dict)
+    upload_targets: Dict[str, str] = field(default_factory=dict)
+    requests: List[tuple] = field(default_factory=list)
+    errors_injected: int = 0
+    throttled: int = 0
+
+
+def normalize_path(path: str) -> str:
+    """Normalize ``disk:/a/b``, ``a/b`` and ``/a/b/`` to ``/a/b``."""
+    if path.startswith('disk:'):
+        path = path[len('disk:'):]
+    path = '/' + path.strip('/')
+    return path
+
+
+def _parent(path: str) -> str:
+    return path.rsplit('/', 1)[0] or '/'
+
+
+def _error(status: int, error: str, description: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={'error': error, 'description': description})
+
+
+class FakeYandexDisk:
+    """ASGI app emulating Yandex Disk, plus its mutable state."""
+
+    def __init__(self, config: Optional[FakeYandexDiskConfig] = None):
+        self.config = config or FakeYandexDiskConfig()
+        self.state = FakeYandexDiskState()
+        self._random = random.Random(self.config.seed)
+        self._window_start = 0.0
+        self._window_count = 0
+        self.app = self._build_app()
+
+    def reset(self, config: Optional[FakeYandexDiskConfig] = None):
+        """Drop all contents and optionally replace the configuration."""
+        if config is not None:
+            self.config = config
+        self.state = FakeYandexDiskState()
+        self._random = random.Random(self.config.seed)
+        self._window_start = 0.0
+        self._window_count = 0
+
+    def _throttled(self) -> bool:
+        limit = self.config.max_requests_per_second
+        if not limit:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self._window_count > limit
+
+    async def _delay(self, base: float):
+        delay = base
+        if self.config.latency_jitter:
+            delay += self._random.uniform(0, self.config.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Yandex Disk")
+
+        @app.middleware("http")
+        async def simulate_conditions(request: Request, call_next):
+            self.state.requests.append((request.method, request.url.path))
+            if self._throttled():
+                self.state.throttled += 1
+                return _error(429, 'TooManyRequestsError', 'Too many requests')
+            is_upload = request.url.path.startswith('/upload-target/')
+            await self._delay(self.config.upload_latency if is_upload else self.config.latency)
+            if self.config.error_rate and self._random.random() < self.config.error_rate:
+                self.state.errors_injected += 1
+                return _error(503, 'ServiceUnavailableError', 'Service temporarily unavailable')
+            if not is_upload and not request.headers.get('authorization', '').startswith('OAuth '):
+                return _error(401, 'UnauthorizedError', 'Unauthorized')
+            return await call_next(request)
+
+        @app.get(API_PREFIX + '/')
+        async def disk_info():
+            used = sum(len(content) for content in self.state.files.values())
+            return {'total_space': 10 * 1024 ** 3, 'used_space': used, 'trash_size': 0}
+
+        @app.put(API_PREFIX + '/resources')
+        async def create_folder(path: str):
+            path = normalize_path(path)
+            if path in self.state.folders or path in self.state.files:
+                return _error(409, 'DiskPathPointsToExistentDirectoryError', 'Resource already exists')
+            if _parent(path) not in self.state.folders:
+                return _error(409, 'DiskPathDoesntExistsError', 'Parent folder does not exist')
+            self.state.folders.add(path)
+            return JSONResponse(status_code=201, content={
+                'href': f'{API_PREFIX}/resources?path=disk:{path}', 'method': 'GET', 'templated': False,
+            })
+
+        @app.get(API_PREFIX + '/resources')
+        async def resource_info(request: Request, path: str, fields: Optional[str] = None):
+            path = normalize_path(path)
+            if path in self.state.folders:
+                info = {'path': f'disk:{path}', 'type': 'dir', 'name': path.rsplit('/', 1)[-1]}
+            elif path in self.state.files:
+                info = {
+                    'path': f'disk:{path}', 'type': 'file', 'name': path.rsplit('/', 1)[-1],
+                    'size': len(self.state.files[path]),
+                    'preview': str(request.base_url).rstrip('/') + f'/preview{path}',
+                }
+            else:
+                return _error(404, 'DiskNotFoundError', 'Resource not found')
+            if path in self.state.published:
+                info['public_url'] = self.state.published[path]
+            if fields:
+                wanted = {name.strip() for name in fields.split(',')}
+                info = {key: value for key, value in info.items() if key in wanted}
+            return info
+
+        @app.get(API_PREFIX + '/resources/upload')
+        async def upload_link(request: Request, path: str, overwrite: bool = False):
+            path = normalize_path(path)
+            if path in self.state.files and not overwrite:
+                return _error(409, 'DiskResourceAlreadyExistsError', 'Resource already exists')
+            if _parent(path) not in self.state.folders:
+                return _error(409, 'DiskPathDoesntExistsError', 'Parent folder does not exist')
+            token = secrets.token_hex(8)
+            self.state.upload_targets[token] = path
+            href = str(request.base_url).rstrip('/') + f'/upload-target/{token}'
+            return {'href': href, 'method': 'PUT', 'templated': False}
+
+        @app.put('/upload-target/{token}')
+        async def upload_target(token: str, request: Request):
+            path = self.state.upload_targets.pop(token, None)
+            if path is None:
+                return _error(404, 'NotFound', 'Unknown upload link')
+            chunks = []
+            async for chunk in request.stream():
+                chunks.append(chunk)
+            self.state.files[path] = b''.join(chunks)
+            return JSONResponse(status_code=201, content={})
+
+        @app.put(API_PREFIX + '/resources/publish')
+        async def publish(path: str):
+            path = normalize_path(path)
+            if path not in self.state.folders and path not in self.state.files:
+                return _error(404, 'DiskNotFoundError', 'Resource not found')
+            self.state.published.setdefault(path, f'https://disk.yandex.ru/d/{secrets.token_urlsafe(10)}')
+            return {'href': f'{API_PREFIX}/resources?path=disk:{path}', 'method': 'GET', 'templated': False}
+
+        return app
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeYandexDiskServer:
+    """Runs a ``FakeYandexDisk`` with uvicorn in a background thread.
+
+    ``YandexDiskService`` uses blocking ``requests``, so the fake has to be a
+    real HTTP server rather than an in-process ASGI transport.
+    """
+
+    def __init__(self, config: Optional[FakeYandexDiskConfig] = None,
+                 host: str = '127.0.0.1', port: Optional[int] = None):
+        self.disk = FakeYandexDisk(config)
+        self.host = host
+        self.port = port or _free_port()
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.disk.app, host=self.host, port=self.port, log_level='warning', lifespan='off',
+        ))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def api_url(self) -> str:
+        """Value for the ``YANDEX_DISK_API_URL`` setting."""
+        return f'http://{self.host}:{self.port}{API_PREFIX}'
+
+    def start(self) -> 'FakeYandexDiskServer':
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError('Fake Yandex Disk server did not start')
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> 'FakeYandexDiskServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Yandex Disk API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to API calls')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency, seconds')
+    parser.add_argument('--upload-latency', type=float, default=0.0, help='Seconds added to uploads')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls answered with 503')
+    parser.add_argument('--max-rps', type=float, default=None, help='Requests per second before 429')
+    args = parser.parse_args()
+
+    disk = FakeYandexDisk(FakeYandexDiskConfig(
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        upload_latency=args.upload_latency,
+        error_rate=args.error_rate,
+        max_requests_per_second=args.max_rps,
+    ))
+    print(f'YANDEX_DISK_API_URL=http://{args.host}:{args.port}{API_PREFIX}')
+    uvicorn.run(disk.app, host=args.host, port=args.port, log_level='info')
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,16 @@ async def test_health_check(client: AsyncClient):
     response = await client.get("/health")
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
+    assert response.json()["yandex_disk"]["state"] == "closed"
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient):
+    """Test Prometheus metrics include Yandex Disk breaker state."""
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert "yandex_disk_circuit_state" in response.text
+    assert "yandex_disk_circuit_trips_total" in response.text
 
 
 # ============ Categories Tests ============
@@ -237,3 +247,226 @@ async def test_login_invalid_user(client: AsyncClient):
     assert response.status_code == 200
     data = response.json()
     assert data["success"] == False
+
+
+# ============ Report Photos Tests ============
+
+@pytest.mark.asyncio
+async def test_get_report_photos_not_found(client: AsyncClient):
+    """Test getting photos of a missing report."""
+    response = await client.get("/api/report/999/photos")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_report_photos_lists_linked_photos(client: AsyncClient, sample_work_data, sample_foreman_data):
+    """Test photos linked through the registry are visible per report."""
+    from apps.database import get_db
+    from apps.services.photo_registry import photo_registry
+
+    work_id = (await client.post("/api/works", json=sample_work_data)).json()["id"]
+    foreman_id = (await client.post("/api/foremen", json=sample_foreman_data)).json()["id"]
+    report = await client.post("/api/work-reports", json={
+        "foreman_id": foreman_id, "work_id": work_id, "quantity": 1.0
+    })
+    report_id = report.json()["id"]
+
+    async with get_db() as db:
+        await photo_registry.register(db, "abc123", "/StroyKontrol/p.jpg", "https://disk.example/p", 42)
+        await db.commit()
+    await photo_registry.link_many(report_id, [{"content_hash": "abc123", "deduplicated": True}])
+
+    response = await client.get(f"/api/report/{report_id}/photos")
+    assert response.status_code == 200
+    photos = response.json()
+    assert len(photos) == 1
+    assert photos[0]["public_url"] == "https://disk.example/p"
+    assert photos[0]["is_duplicate"] is True
+
+
+async def _create_report(client: AsyncClient, sample_work_data, sample_foreman_data) -> int:
+    work_id = (await client.post("/api/works", json=sample_work_data)).json()["id"]
+    foreman_id = (await client.post("/api/foremen", json=sample_foreman_data)).json()["id"]
+    report = await client.post("/api/work-reports", json={
+        "foreman_id": foreman_id, "work_id": work_id, "quantity": 1.0
+    })
+    return report.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_upload_report_photos(client: AsyncClient, fake_yandex_disk, sample_work_data,
+                                    sample_foreman_data, monkeypatch):
+    """Test multipart photo upload with duplicates and rejected files."""
+    from apps.config import settings
+    monkeypatch.setattr(settings, 'PHOTO_UPLOAD_MAX_FILE_SIZE', 1024)
+    report_id = await _create_report(client, sample_work_data, sample_foreman_data)
+
+    response = await client.post(f"/api/report/{report_id}/photos", data={"note": "x"}, files=[
+        ("files", ("a.jpg", b"first photo", "image/jpeg")),
+        ("files", ("b.png", b"second photo", "image/png")),
+        ("files", ("c.jpg", b"first photo", "image/jpeg")),
+        ("files", ("notes.txt", b"text", "text/plain")),
+        ("files", ("big.jpg", b"x" * 2048, "image/jpeg")),
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["received"] == 5
+    assert data["uploaded"] == 2
+    assert data["duplicates"] == 1
+    assert data["failed"] == 2
+    assert [f["status"] for f in data["files"]] == [
+        "uploaded", "uploaded", "duplicate", "rejected", "rejected"
+    ]
+    assert data["files"][2]["public_url"] == data["files"][0]["public_url"]
+    assert len(fake_yandex_disk.state.files) == 2
+
+    photos = (await client.get(f"/api/report/{report_id}/photos")).json()
+    assert len(photos) == 2
+    report = (await client.get(f"/api/report/{report_id}")).json()
+    assert report["photo_report_url"] == data["folder_url"]
+
+
+@pytest.mark.asyncio
+async def test_upload_report_photos_requires_multipart(client: AsyncClient, fake_yandex_disk,
+                                                       sample_work_data, sample_foreman_data):
+    """Test non-multipart uploads and missing reports are rejected."""
+    report_id = await _create_report(client, sample_work_data, sample_foreman_data)
+
+    response = await client.post(f"/api/report/{report_id}/photos", content=b"raw",
+                                 headers={"content-type": "image/jpeg"})
+    assert response.status_code == 400
+
+    response = await client.post("/api/report/999/photos", files=[("files", ("a.jpg", b"1", "image/jpeg"))])
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_report_listing_includes_photos(client: AsyncClient, fake_yandex_disk,
+                                              sample_work_data, sample_foreman_data):
+    """Test report listings embed photo details loaded in one batch."""
+    import struct
+    png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + struct.pack('>II', 640, 480) + b'\x08\x02\x00\x00\x00'
+    report_id = await _create_report(client, sample_work_data, sample_foreman_data)
+    await client.post(f"/api/report/{report_id}/photos", files=[("files", ("p.png", png, "image/png"))])
+
+    reports = (await client.get("/api/all-reports")).json()
+    assert len(reports) == 1
+    photo = reports[0]["photos"][0]
+    assert (photo["width"], photo["height"]) == (640, 480)
+    assert photo["disk_path"].endswith(".png")
+    assert photo["thumbnail_url"]
+    assert photo["size"] == len(png)
+
+    assert (await client.get(f"/api/report/{report_id}")).json()["photos"] == reports[0]["photos"]
+    assert "photos" not in (await client.get("/api/all-reports?include_photos=false")).json()[0]
+
+
+# ============ Search Tests ============
+
+@pytest.mark.asyncio
+async def test_search_catalog(client: AsyncClient, sample_work_data, sample_material_data):
+    """Test prefix search over works and materials stays in sync with edits."""
+    for name, category in [("Кладка кирпича", "Кладочные работы"),
+                           ("Штукатурка стен", "Отделка"),
+                           ("Монтаж ёмкости", "Монтаж")]:
+        response = await client.post("/api/works", json={**sample_work_data, "name": name, "category": category})
+        work_id = response.json()["id"]
+    await client.post("/api/materials", json={**sample_material_data, "name": "Кирпич красный",
+                                              "category": "Кладочные работы"})
+
+    response = await client.get("/api/search", params={"q": "кирп"})
+    assert response.status_code == 200
+    assert {(r["type"], r["name"]) for r in response.json()} == {
+        ("material", "Кирпич красный"), ("work", "Кладка кирпича")
+    }
+
+    response = await client.get("/api/search", params={"q": "КЛАД", "type": "works"})
+    assert [r["name"] for r in response.json()] == ["Кладка кирпича"]
+
+    response = await client.get("/api/search", params={"q": "емкост"})
+    assert [r["id"] for r in response.json()] == [work_id]
+
+    await client.put(f"/api/works/{work_id}", json={"name": "Монтаж резервуара"})
+    assert (await client.get("/api/search", params={"q": "емкост"})).json() == []
+    assert len((await client.get("/api/search", params={"q": "резерв"})).json()) == 1
+
+    await client.delete(f"/api/works/{work_id}")
+    assert (await client.get("/api/search", params={"q": "резерв"})).json() == []
+    assert (await client.get("/api/search", params={"q": '"*)('})).json() == []
+    assert (await client.get("/api/search", params={"q": "x", "type": "foremen"})).status_code == 422
+
+
+# ============ Telegram Webhook Tests ============
+
+@pytest.mark.asyncio
+async def test_telegram_webhook(client: AsyncClient, monkeypatch):
+    """Test webhook updates are checked against the secret and fed to the dispatcher."""
+    import asyncio
+    from aiogram import Bot, Dispatcher
+    from apps.routers import telegram as telegram_routes
+    from apps.services.telegram_webhook import TelegramWebhook
+
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 7, "date": 0, "text": "/start",
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Иван"},
+        },
+    }
+    response = await client.post("/telegram/webhook", json=update)
+    assert response.status_code == 404
+
+    dp = Dispatcher()
+    received = []
+
+    @dp.message()
+    async def on_message(message):
+        received.append(message.text)
+
+    webhook = TelegramWebhook(Bot(token="42:TEST"), dp, secret_token="s3cret")
+    monkeypatch.setattr(telegram_routes, "webhook", webhook)
+
+    response = await client.post("/telegram/webhook", json=update,
+                                 headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+    assert response.status_code == 401
+
+    response = await client.post("/telegram/webhook", json=update,
+                                 headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+    assert response.status_code == 200
+    await asyncio.gather(*webhook._tasks)
+    assert received == ["/start"]
+    await webhook.bot.session.close()
+
+
+# ============ Response Cache Tests ============
+
+@pytest.mark.asyncio
+async def test_catalog_responses_cached_until_write(client: AsyncClient, sample_work_data,
+                                                    sample_material_data):
+    """Test catalog lists are served from the cache and refreshed by writes."""
+    from apps.services.metrics import metrics
+
+    def hits(endpoint):
+        return metrics.get("response_cache_requests_total", endpoint=endpoint, result="hit")
+
+    assert (await client.get("/api/works")).json() == []
+    before = hits("works")
+    assert (await client.get("/api/works")).json() == []
+    assert hits("works") == before + 1
+
+    work = (await client.post("/api/works", json=sample_work_data)).json()
+    response = await client.get("/api/works")
+    assert [item["name"] for item in response.json()] == ["Test Work"]
+    assert response.headers["content-type"] == "application/json"
+    # Creating the work also created its category
+    assert [item["name"] for item in (await client.get("/api/categories")).json()] == ["Test Category"]
+
+    await client.put(f"/api/works/{work['id']}/add-balance", json={"amount": 5})
+    assert (await client.get("/api/works")).json()[0]["balance"] == 105.0
+
+    await client.post("/api/materials", json=sample_material_data)
+    materials = (await client.get("/api/materials")).json()
+    await client.put(f"/api/materials/{materials[0]['id']}/add-quantity", json={"amount": 1})
+    assert (await client.get("/api/materials")).json()[0]["quantity"] == 51.0
+
@@ -0,0 +1,575 @@
+"""Tests for business logic services."""
+import hashlib
+
+import pytest
+import requests
+
+from apps.database import get_db
+from apps.services import photo_registry as photo_registry_module
+from apps.services.circuit_breaker import (
+    Bulkhead, BulkheadFullError, CircuitBreaker, DeferredRetryQueue
+)
+from apps.services.photo_registry import (
+    PhotoTooLargeError, photo_registry, spool_chunks
+)
+from apps.services.yandex_disk import (
+    YandexDiskService, YandexDiskUnavailable, yandex_disk_service
+)
+
+
+# ============ Photo Registry Tests ============
+
+def test_spool_chunks_hashes_content():
+    """Test spooling computes hash and size of the streamed content."""
+    chunks = [b"abc", b"", b"def"]
+    spooled = spool_chunks(chunks)
+    try:
+        assert spooled.size == 6
+        assert spooled.content_hash == hashlib.sha256(b"abcdef").hexdigest()
+        assert spooled.file.read() == b"abcdef"
+    finally:
+        spooled.close()
+
+
+def test_spool_chunks_size_limit():
+    """Test spooling stops when the size limit is exceeded."""
+    with pytest.raises(PhotoTooLargeError):
+        spool_chunks([b"x" * 10, b"x" * 10], max_size=15)
+
+
+@pytest.mark.asyncio
+async def test_store_deduplicates_by_hash(test_db, monkeypatch):
+    """Test identical photos are uploaded only once."""
+    uploads = []
+
+    def fake_upload(file_data, file_path):
+        uploads.append((file_data.read(), file_path))
+        return {'public_url': f"https://disk.example/{len(uploads)}", 'thumbnail_url': None}
+
+    monkeypatch.setattr(photo_registry_module.yandex_disk_service, 'upload_file_info', fake_upload)
+
+    first = await photo_registry.store(spool_chunks([b"photo"]), "/StroyKontrol/a", "1.jpg")
+    second = await photo_registry.store(spool_chunks([b"photo"]), "/StroyKontrol/b", "2.jpg")
+
+    assert uploads == [(b"photo", "/StroyKontrol/a/1.jpg")]
+    assert first['deduplicated'] is False
+    assert second['deduplicated'] is True
+    assert second['public_url'] == first['public_url']
+
+    async with get_db() as db:
+        async with db.execute(
+            "SELECT use_count FROM photo_registry WHERE content_hash = ?",
+            (first['content_hash'],)
+        ) as cursor:
+            assert (await cursor.fetchone())['use_count'] == 2
+
+
+# ============ Circuit Breaker Tests ============
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """Test breaker opens on failure rate and closes after a half-open success."""
+    clock = FakeClock()
+    breaker = CircuitBreaker('test_breaker', failure_rate_threshold=0.5, window_size=4,
+                             minimum_calls=4, open_seconds=10, clock=clock)
+
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trips == 1
+    assert breaker.allow_request() is False
+
+    clock.now = 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request() is True
+    assert breaker.allow_request() is False
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trips == 2
+
+    clock.now = 20
+    assert breaker.allow_request() is True
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_bulkhead_rejects_when_full():
+    """Test bulkhead rejects calls beyond its concurrency limit."""
+    bulkhead = Bulkhead('test_bulkhead', max_concurrent=1)
+    with bulkhead.acquire():
+        assert bulkhead.in_flight == 1
+        with pytest.raises(BulkheadFullError):
+            with bulkhead.acquire():
+                pass
+    assert bulkhead.in_flight == 0
+    assert bulkhead.rejected == 1
+
+
+def test_yandex_client_fails_fast_when_open(monkeypatch):
+    """Test Yandex Disk calls stop hitting the network once the breaker opens."""
+    calls = []
+
+    def failing_request(method, url, **kwargs):
+        calls.append(url)
+        raise requests.ConnectionError("down")
+
+    monkeypatch.setattr(requests, 'request', failing_request)
+    service = YandexDiskService()
+    service.token = 'token'
+
+    for _ in range(service.breaker.minimum_calls):
+        assert service.check_connection() is False
+    assert service.breaker.state == 'open'
+    assert service.is_available() is False
+
+    with pytest.raises(YandexDiskUnavailable):
+        service._request('GET', service.base_url)
+    assert service.create_folder('/StroyKontrol') is False
+    assert len(calls) == service.breaker.minimum_calls
+
+
+@pytest.mark.asyncio
+async def test_deferred_queue_retries_until_success():
+    """Test deferred jobs are retried and removed once they succeed."""
+    attempts = []
+
+    async def job(value):
+        attempts.append(value)
+        return len(attempts) > 1
+
+    queue = DeferredRetryQueue('test_queue', base_delay=0)
+    queue.submit('job', job, 'x')
+
+    assert await queue.run_once() == 0
+    assert len(queue) == 1
+    assert await queue.run_once() == 1
+    assert len(queue) == 0
+    assert attempts == ['x', 'x']
+
+
+# ============ Yandex Disk Client Tests (fake server) ============
+
+def test_ensure_report_folder_on_fake_disk(fake_yandex_disk):
+    """Test report folder structure is created and published."""
+    public_url = yandex_disk_service.ensure_report_folder('Иван Иванов', 7, '2025-01-15')
+
+    assert public_url.startswith('https://disk.yandex.ru/d/')
+    assert '/StroyKontrol/2025-01-15/Иван_Иванов_ID_7' in fake_yandex_disk.state.folders
+    assert list(fake_yandex_disk.state.published.values()) == [public_url]
+
+
+@pytest.mark.asyncio
+async def test_store_uploads_to_fake_disk(test_db, fake_yandex_disk):
+    """Test photo upload path end to end against the fake disk."""
+    assert yandex_disk_service.create_folder('/StroyKontrol')
+
+    stored = await photo_registry.store(spool_chunks([b"jpeg", b"data"]), "/StroyKontrol", "1.jpg")
+
+    assert stored['public_url'].startswith('https://disk.yandex.ru/d/')
+    assert fake_yandex_disk.state.files['/StroyKontrol/1.jpg'] == b"jpegdata"
+
+
+def test_fake_disk_errors_trip_breaker(fake_yandex_disk):
+    """Test server errors open the breaker and later calls fail fast."""
+    fake_yandex_disk.config.error_rate = 1.0
+
+    for _ in range(yandex_disk_service.breaker.minimum_calls):
+        assert yandex_disk_service.check_connection() is False
+    assert yandex_disk_service.breaker.state == 'open'
+
+    served = len(fake_yandex_disk.state.requests)
+    assert yandex_disk_service.create_folder('/StroyKontrol') is False
+    assert len(fake_yandex_disk.state.requests) == served
+
+
+def test_fake_disk_throttling(fake_yandex_disk):
+    """Test throttled calls are answered with 429."""
+    fake_yandex_disk.config.max_requests_per_second = 1
+
+    assert yandex_disk_service.check_connection() is True
+    assert yandex_disk_service.check_connection() is False
+    assert fake_yandex_disk.state.throttled == 1
+
+
+def test_read_image_dimensions():
+    """Test width and height are read from PNG and JPEG headers."""
+    import io
+    import struct
+    from apps.services.photo_registry import read_image_dimensions
+
+    png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + struct.pack('>II', 640, 480) + b'\x08\x02\x00\x00\x00'
+    jpeg = (b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+            + b'\xff\xc0' + struct.pack('>HBHH', 17, 8, 1080, 1920) + b'\x00' * 10)
+
+    assert read_image_dimensions(io.BytesIO(png)) == (640, 480)
+    assert read_image_dimensions(io.BytesIO(jpeg)) == (1920, 1080)
+    assert read_image_dimensions(io.BytesIO(b'not an image')) is None
+
+
+# ============ Bot FSM Storage Tests ============
+
+@pytest.mark.asyncio
+async def test_fsm_storage_persists_across_instances(tmp_path):
+    """Test state and data survive reopening the storage file."""
+    from aiogram.fsm.storage.base import StorageKey
+    from apps.services.fsm_storage import SQLiteStorage
+
+    path = str(tmp_path / 'fsm.db')
+    key = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+    storage = SQLiteStorage(path)
+    await storage.set_state(key, 'Form:waiting_quantity')
+    await storage.update_data(key, {'work_id': 5, 'comment': 'Кладка'})
+    await storage.update_data(key, {'quantity': 1.5})
+    await storage.close()
+
+    storage = SQLiteStorage(path)
+    assert await storage.get_state(key) == 'Form:waiting_quantity'
+    assert await storage.get_data(key) == {'work_id': 5, 'comment': 'Кладка', 'quantity': 1.5}
+
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+    assert await storage.get_state(key) is None
+    assert await storage.get_data(key) == {}
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_fsm_storage_expires_idle_sessions(tmp_path):
+    """Test sessions idle longer than the TTL are ignored and evicted."""
+    from aiogram.fsm.storage.base import StorageKey
+    from apps.services.fsm_storage import SQLiteStorage
+
+    clock = FakeClock()
+    storage = SQLiteStorage(str(tmp_path / 'fsm.db'), ttl=100, clock=clock)
+    key = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+    await storage.set_state(key, 'Form:selecting_action')
+    await storage.set_data(key, {'work_id': 5})
+    clock.now = 101
+    assert await storage.get_state(key) is None
+
+    await storage.set_state(key, 'Form:waiting_quantity')
+    assert await storage.get_data(key) == {}
+    clock.now = 300
+    assert await storage.evict_expired() == 1
+    await storage.close()
+
+
+# ============ Scheduler Tests ============
+
+def test_seconds_until_next_daily_run():
+    """Test the next run is today if the time is ahead, otherwise tomorrow."""
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+    from apps.services.scheduler import parse_time_of_day, seconds_until
+
+    tz = ZoneInfo('Europe/Moscow')
+    at = parse_time_of_day('19:00')
+    assert seconds_until(at, datetime(2025, 3, 1, 18, 30, tzinfo=tz)) == 30 * 60
+    assert seconds_until(at, datetime(2025, 3, 1, 19, 0, tzinfo=tz)) == 24 * 3600
+    assert seconds_until(at, datetime(2025, 3, 1, 20, 0, tzinfo=tz)) == 23 * 3600
+    assert parse_time_of_day('') is None
+
+
+# ============ Telegram Sender Tests ============
+
+def test_split_message_keeps_blocks_whole():
+    """Test blocks are packed into messages without splitting them."""
+    from apps.services.telegram_sender import split_message
+
+    blocks = ["Дата: 01.03.2025", "Бригадир: A\n• " + "x" * 40, "Бригадир: B\n• " + "y" * 40]
+    messages = split_message(blocks, limit=80)
+    assert messages == [blocks[0] + "\n\n" + blocks[1], blocks[2]]
+
+    long_block = "\n".join(f"• line {i}" for i in range(30))
+    parts = split_message([long_block], limit=50)
+    assert all(len(part) <= 50 for part in parts)
+    assert "\n".join(parts) == long_block
+    assert split_message(["z" * 120], limit=50) == ["z" * 50, "z" * 50, "z" * 20]
+
+
+@pytest.mark.asyncio
+async def test_telegram_sender_paces_and_retries():
+    """Test per-chat pacing and waiting out Telegram's retry_after."""
+    from aiogram.exceptions import TelegramRetryAfter
+    from aiogram.methods import SendMessage
+    from apps.services.telegram_sender import TelegramSender
+
+    clock = FakeClock()
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    class FakeBot:
+        def __init__(self):
+            self.sent = []
+            self.fail_next = True
+
+        async def send_message(self, chat_id, text, **kwargs):
+            if self.fail_next:
+                self.fail_next = False
+                raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), 'Flood', 7)
+            self.sent.append((clock.now, chat_id, text))
+
+    bot = FakeBot()
+    sender = TelegramSender(bot, per_chat_interval=1.0, global_rate=0, clock=clock, sleep=sleep)
+    assert await sender.send_long_message(1, ["a" * 3000, "b" * 3000]) == 2
+
+    assert sleeps == [7, 1.0]
+    assert [(at, text[0]) for at, _, text in bot.sent] == [(7, "a"), (8, "b")]
+
+
+@pytest.mark.asyncio
+async def test_submission_queue_orders_retries_and_persists(tmp_path):
+    """Test per-foreman ordering, backoff after a failure and replay after restart."""
+    from apps.services.submission_queue import SubmissionQueue, SubmissionRejected
+
+    clock = FakeClock()
+    handled = []
+    failing = {'n': 1}
+    notified = []
+
+    async def handler(payload):
+        if payload['n'] == failing['n']:
+            raise RuntimeError("database is locked")
+        if payload['n'] == 3:
+            raise SubmissionRejected("no balance")
+        handled.append(payload['n'])
+        return payload['n'] * 10
+
+    async def on_done(payload, result):
+        notified.append(('done', payload['n'], result))
+
+    async def on_rejected(payload, error):
+        notified.append(('rejected', payload['n'], str(error)))
+
+    path = str(tmp_path / "outbox.db")
+    queue = SubmissionQueue(path, handler, on_done=on_done, on_rejected=on_rejected,
+                            base_delay=5, clock=clock)
+    first = await queue.submit(7, {'n': 1})
+    assert await queue.wait(first, 5) is None
+    # The foreman's later report waits behind the failed one
+    second = await queue.submit(7, {'n': 2})
+    assert await queue.wait(second, 0.1) is None
+    assert handled == [] and await queue.pending() == 2
+    await queue.close()
+
+    # A new instance picks the queue up from disk once the backoff has passed
+    queue = SubmissionQueue(path, handler, on_done=on_done, on_rejected=on_rejected,
+                            base_delay=5, clock=clock)
+    failing['n'] = None
+    assert await queue.drain() == 0
+    clock.now += 5
+    assert await queue.drain() == 2
+    assert handled == [1, 2]
+    assert notified == [('done', 1, 10), ('done', 2, 20)]
+
+    rejected = await queue.submit(7, {'n': 3})
+    with pytest.raises(SubmissionRejected):
+        await queue.wait(rejected, 1)
+    stored = await queue.submit(8, {'n': 4})
+    assert await queue.wait(stored, 1) == 40
+    assert await queue.pending() == 0
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_user_update_isolation_orders_per_user_and_caps():
+    """Test one user's updates run in order while the global cap is respected."""
+    import asyncio
+    from aiogram.fsm.storage.base import StorageKey
+    from apps.services.update_isolation import UserUpdateIsolation
+
+    isolation = UserUpdateIsolation(max_concurrency=2)
+    events = []
+    peak = {'value': 0}
+
+    async def handle(user_id, n, delay):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        async with isolation.lock(key):
+            peak['value'] = max(peak['value'], isolation.in_progress)
+            events.append(('start', user_id, n))
+            await asyncio.sleep(delay)
+            events.append(('end', user_id, n))
+
+    tasks = [
+        asyncio.create_task(handle(1, 1, 0.05)),
+        asyncio.create_task(handle(1, 2, 0)),
+        asyncio.create_task(handle(2, 1, 0)),
+        asyncio.create_task(handle(3, 1, 0)),
+    ]
+    await asyncio.sleep(0)
+    assert isolation.in_progress == 2 and isolation.queued == 2
+    await asyncio.gather(*tasks)
+
+    # User 1's second update starts only after the first one (slow upload) ended,
+    # while the other users were served in the meantime
+    user1 = [event for event in events if event[1] == 1]
+    assert user1 == [('start', 1, 1), ('end', 1, 1), ('start', 1, 2), ('end', 1, 2)]
+    assert events.index(('end', 3, 1)) < events.index(('end', 1, 1))
+    assert peak['value'] == 2
+    assert isolation.queued == 0 and isolation.in_progress == 0
+    assert isolation._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_fake_telegram_round_trip():
+    """Test an aiogram bot can poll, reply and download a photo through the fake Bot API."""
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+    from tests.fakes.telegram import FakeTelegramServer
+
+    async with FakeTelegramServer() as server:
+        telegram = server.telegram
+        bot = Bot('123:FAKE', session=AiohttpSession(api=TelegramAPIServer.from_base(server.api_url)))
+        try:
+            await telegram.send_text(7, '/start')
+            await telegram.send_photo(7, b'jpeg bytes')
+            updates = await bot.get_updates(offset=0, timeout=1)
+            assert updates[0].message.text == '/start'
+            photo = updates[1].message.photo[-1]
+
+            markup = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text='Работа', callback_data='work:pick:1')]
+            ])
+            await bot.send_message(7, 'Выберите работу', reply_markup=markup)
+            sent = await telegram.wait_for(7, lambda message: message.text == 'Выберите работу', timeout=5)
+            assert sent.reply_markup['inline_keyboard'][0][0]['callback_data'] == 'work:pick:1'
+
+            await telegram.press_button(7, sent, 'work:pick:1')
+            updates = await bot.get_updates(offset=updates[-1].update_id + 1, timeout=1)
+            assert updates[0].callback_query.data == 'work:pick:1'
+
+            file = await bot.get_file(photo.file_id)
+            assert (await bot.download_file(file.file_path)).read() == b'jpeg bytes'
+        finally:
+            await bot.session.close()
+
+
+@pytest.mark.asyncio
+async def test_repository_writes_off_and_restores_materials(test_db):
+    """Test the shared repository reads norms, spots shortages and moves stock with history."""
+    from apps.repository import (
+        fetch_work_materials_requirements, find_material_shortage, get_foreman_display_name,
+        restore_materials, write_off_materials,
+    )
+    from apps.services.metrics import metrics
+
+    async with get_db() as db:
+        await db.execute("INSERT INTO works (id, name, category, unit) VALUES (1, 'Кладка', 'Стены', 'м3')")
+        await db.execute(
+            "INSERT INTO materials (id, category, name, unit, quantity, created_at) "
+            "VALUES (1, 'Стены', 'Кирпич', 'шт', 1000, '2024-01-01 00:00:00'), "
+            "(2, 'Стены', 'Раствор', 'м3', 1, '2024-01-01 00:00:00')"
+        )
+        await db.execute(
+            "INSERT INTO work_materials (work_id, material_id, quantity_per_unit) VALUES (1, 1, 400), (1, 2, 0.25)"
+        )
+        await db.execute(
+            "INSERT INTO foremen (id, first_name, last_name, registration_date) "
+            "VALUES (5, 'Иван', 'Петров', '2024-01-01 00:00:00')"
+        )
+        await db.commit()
+
+        queries = metrics.get('db_queries_total', query='work_materials')
+        requirements = await fetch_work_materials_requirements(db, 1)
+        assert metrics.get('db_queries_total', query='work_materials') == queries + 1
+        assert [(r['material_name'], r['unit'], r['quantity_per_unit']) for r in requirements] == [
+            ('Кирпич', 'шт', 400), ('Раствор', 'м3', 0.25),
+        ]
+        assert find_material_shortage(requirements, 2) is None
+        assert find_material_shortage(requirements, 3)['material_name'] == 'Кирпич'
+
+        performed_by = await get_foreman_display_name(db, 5)
+        assert performed_by == 'Бригадир Иван Петров'
+        assert await get_foreman_display_name(db, 99) == 'Бригадир ID 99'
+        await write_off_materials(db, requirements, 2, performed_by, 'Списание по отчету')
+        await restore_materials(db, requirements[:1], 1, performed_by, 'Удаление отчета')
+        await db.commit()
+
+        async with db.execute("SELECT quantity FROM materials ORDER BY id") as cursor:
+            assert [row[0] for row in await cursor.fetchall()] == [600, 0.5]
+        async with db.execute(
+            "SELECT material_id, change_type, change_amount, resulting_quantity, performed_by "
+            "FROM material_history ORDER BY id"
+        ) as cursor:
+            assert [tuple(row) for row in await cursor.fetchall()] == [
+                (1, 'Списание', -800, 200, 'Бригадир Иван Петров'),
+                (2, 'Списание', -0.5, 0.5, 'Бригадир Иван Петров'),
+                (1, 'Возврат', 400, 600, 'Бригадир Иван Петров'),
+            ]
+
+
+def test_response_cache_evicts_least_recently_used():
+    """Test the cache keeps within its entry and byte budget and drops stale entries."""
+    from apps.services.response_cache import ResponseCache
+
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put(("a",), ("works",), cache.versions(("works",)), b"1111")
+    cache.put(("b",), ("materials",), cache.versions(("materials",)), b"2222")
+    assert cache.get(("a",)) == b"1111"
+    cache.put(("c",), ("works",), cache.versions(("works",)), b"3333")
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == b"1111"
+
+    cache.put(("d",), ("foremen",), cache.versions(("foremen",)), b"4444444")
+    assert cache.get(("c",)) is None and cache.get(("a",)) is None
+    assert cache.get(("d",)) == b"4444444"
+
+    versions = cache.versions(("foremen",))
+    cache.bump("foremen")
+    assert cache.get(("d",)) is None
+    cache.put(("d",), ("foremen",), versions, b"old")
+    assert cache.get(("d",)) is None
+
+
+@pytest.mark.asyncio
+async def test_change_watcher_reports_tables_changed_by_other_connections(test_db):
+    """Test writes from another connection reach subscribers as changed table names."""
+    from apps.services.change_watcher import ChangeWatcher
+    from apps.services.response_cache import ResponseCache
+
+    cache = ResponseCache()
+    cache.put(("works",), ("works",), cache.versions(("works",)), b"[]")
+    cache.put(("foremen",), ("foremen",), cache.versions(("foremen",)), b"[]")
+    notified = []
+    watcher = ChangeWatcher(test_db)
+    watcher.subscribe(lambda tables: cache.bump(*tables))
+    watcher.subscribe(notified.append)
+    try:
+        assert await watcher.check() == set()
+
+        async with get_db() as db:
+            await db.execute("INSERT INTO works (name, category, unit) VALUES ('Кладка', 'Стены', 'м3')")
+            await db.commit()
+        assert await watcher.check() == {"works"}
+        assert await watcher.check() == set()
+        assert cache.get(("works",)) is None
+        assert cache.get(("foremen",)) == b"[]"
+
+        async with get_db() as db:
+            await db.execute("UPDATE works SET balance = 5")
+            await db.execute(
+                "INSERT INTO foremen (id, first_name, last_name, registration_date) VALUES (1, 'И', 'П', '')"
+            )
+            await db.commit()
+        assert await watcher.check() == {"works", "foremen"}
+        assert notified == [{"works"}, {"works", "foremen"}]
+        assert watcher.versions["works"] == 2
+    finally:
+        await watcher.close()